@@ -0,0 +1,237 @@
+"""
+Short code allocation without a uniqueness query per request.
+
+"range" (default): each process leases blocks of SHORT_CODE_BLOCK_SIZE ids, from
+the database (an insert into code_block_leases) or from a Redis counter, and hands
+them out locally. Ids are base62-encoded; with SHORT_CODE_PERMUTE they first go
+through a keyed Feistel permutation of the 6-character space, so consecutive ids
+don't produce guessable neighbouring codes.
+
+"bloom": random codes, skipped when a local Bloom filter of existing codes says
+they might be taken. The filter is loaded from `urls` once per process.
+
+Both modes finish in a bounded number of steps. Codes minted by other processes
+in bloom mode (or legacy random codes in range mode) can still collide, so the
+unique index on urls.short_code stays the final guard: callers retry on
+IntegrityError and report the code through `note_taken`.
+"""
+
+import hashlib
+import hmac
+import random
+import socket
+import string
+import threading
+from typing import Callable, Iterable
+
+from sqlalchemy import select
+
+from . import database, models
+from .bloom import BloomFilter
+from .config import settings
+from .redis_client import get_redis
+
+ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+def base62_encode(number: int, length: int = CODE_LENGTH) -> str:
+    chars = []
+    while number:
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return "".join(reversed(chars)).rjust(length, ALPHABET[0])
+
+def base62_decode(code: str) -> int:
+    number = 0
+    for char in code:
+        number = number * len(ALPHABET) + ALPHABET.index(char)
+    return number
+
+
+class FeistelPermutation:
+    """Keyed, reversible bijection on [0, domain): a balanced Feistel network with cycle-walking."""
+
+    ROUNDS = 4
+
+    def __init__(self, key: bytes, domain: int):
+        self.domain = domain
+        bits = max(2, (domain - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self._round_keys = [hmac.new(key, bytes([i]), hashlib.sha256).digest() for i in range(self.ROUNDS)]
+
+    def _f(self, i: int, value: int) -> int:
+        digest = hashlib.blake2b(value.to_bytes(8, "little"), key=self._round_keys[i], digest_size=8).digest()
+        return int.from_bytes(digest, "little") & self.half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in range(self.ROUNDS):
+            left, right = right, left ^ self._f(i, right)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in reversed(range(self.ROUNDS)):
+            left, right = right ^ self._f(i, left), left
+        return (left << self.half_bits) | right
+
+    def permute(self, value: int) -> int:
+        if not 0 <= value < self.domain:
+            raise ValueError(f"{value} is outside the permutation domain")
+        value = self._encrypt(value)
+        # The network permutes a power-of-two range; walk until we land back inside the domain.
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        if not 0 <= value < self.domain:
+            raise ValueError(f"{value} is outside the permutation domain")
+        value = self._decrypt(value)
+        while value >= self.domain:
+            value = self._decrypt(value)
+        return value
+
+
+# --- Allocators ---
+
+class RangeAllocator:
+    """Hands out ids from leased blocks; one lease round-trip per `block_size` codes."""
+
+    def __init__(self, lease_block: Callable[[], int], block_size: int, permutation: FeistelPermutation | None = None):
+        self._lease_block = lease_block
+        self.block_size = block_size
+        self.permutation = permutation
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        with self._lock:
+            if self._next >= self._end:
+                block = self._lease_block()
+                self._next, self._end = block * self.block_size, (block + 1) * self.block_size
+            value = self._next
+            self._next += 1
+        return self.encode(value)
+
+    def allocate_many(self, count: int) -> list[str]:
+        return [self.allocate() for _ in range(count)]
+
+    def encode(self, value: int) -> str:
+        if value < CODE_SPACE:
+            if self.permutation is not None:
+                value = self.permutation.permute(value)
+            return base62_encode(value)
+        # Past the 6-character space ids simply get longer, which can't collide with shorter codes.
+        return base62_encode(value, length=CODE_LENGTH + 1)
+
+    def note_taken(self, code: str) -> None:
+        # The id is burnt; the next allocate() moves on to a fresh one.
+        pass
+
+
+class BloomAllocator:
+    """Random codes checked against a local Bloom filter of codes already in use."""
+
+    ATTEMPTS_PER_LENGTH = 16
+    MAX_LENGTH = 10  # urls.short_code is String(10)
+
+    def __init__(self, load_codes: Callable[[], Iterable[str]], capacity: int, error_rate: float):
+        self._load_codes = load_codes
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._filter: BloomFilter | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> BloomFilter:
+        if self._filter is None:
+            bloom = BloomFilter(self._capacity, self._error_rate)
+            for code in self._load_codes():
+                bloom.add(code)
+            self._filter = bloom
+        return self._filter
+
+    def allocate(self) -> str:
+        with self._lock:
+            bloom = self._ensure_loaded()
+            # Falling through to a longer code when the space gets crowded keeps this bounded.
+            for length in range(CODE_LENGTH, self.MAX_LENGTH + 1):
+                for _ in range(self.ATTEMPTS_PER_LENGTH):
+                    code = "".join(random.choices(ALPHABET, k=length))
+                    if code not in bloom:
+                        bloom.add(code)
+                        return code
+        raise RuntimeError("Could not generate a unique short code")
+
+    def allocate_many(self, count: int) -> list[str]:
+        return [self.allocate() for _ in range(count)]
+
+    def note_taken(self, code: str) -> None:
+        with self._lock:
+            self._ensure_loaded().add(code)
+
+
+# --- Block Lease Sources ---
+
+def lease_block_from_db() -> int:
+    db = database.new_session()
+    try:
+        lease = models.CodeBlockLease(holder=socket.gethostname())
+        db.add(lease)
+        db.flush()
+        block = lease.id
+        db.commit()
+        return block
+    finally:
+        db.close()
+
+def lease_block_from_redis() -> int:
+    # Only safe with a persistent Redis: a reset counter would hand out old blocks again.
+    return get_redis().incr("linkloom:codes:next_block")
+
+def load_existing_codes() -> Iterable[str]:
+    db = database.new_session()
+    try:
+        yield from db.scalars(select(models.URL.short_code).execution_options(yield_per=10000))
+    finally:
+        db.close()
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+def _permutation_key() -> bytes:
+    # Never rotate this once codes have been issued: permuted ids would start colliding.
+    secret = settings.SHORT_CODE_PERMUTATION_KEY or settings.SECRET_KEY
+    return hashlib.sha256(b"short-code-permutation:" + secret.encode()).digest()
+
+def make_allocator():
+    if settings.SHORT_CODE_ALLOCATOR == "bloom":
+        return BloomAllocator(
+            load_existing_codes,
+            capacity=settings.SHORT_CODE_BLOOM_CAPACITY,
+            error_rate=settings.SHORT_CODE_BLOOM_ERROR_RATE,
+        )
+    if settings.SHORT_CODE_ALLOCATOR == "range":
+        if settings.SHORT_CODE_BLOCK_SOURCE not in ("db", "redis"):
+            raise ValueError(f"Unknown SHORT_CODE_BLOCK_SOURCE {settings.SHORT_CODE_BLOCK_SOURCE!r}")
+        if settings.SHORT_CODE_BLOCK_SOURCE == "redis" and not settings.REDIS_ENABLED:
+            raise ValueError("SHORT_CODE_BLOCK_SOURCE='redis' needs REDIS_ENABLED; use 'db' to lease blocks without Redis")
+        lease = lease_block_from_redis if settings.SHORT_CODE_BLOCK_SOURCE == "redis" else lease_block_from_db
+        permutation = FeistelPermutation(_permutation_key(), CODE_SPACE) if settings.SHORT_CODE_PERMUTE else None
+        return RangeAllocator(lease, settings.SHORT_CODE_BLOCK_SIZE, permutation)
+    raise ValueError(f"Unknown SHORT_CODE_ALLOCATOR {settings.SHORT_CODE_ALLOCATOR!r}")
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = make_allocator()
+    return _allocator
+
+def set_allocator(allocator) -> None:
+    global _allocator
+    _allocator = allocator
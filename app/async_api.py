@@ -0,0 +1,159 @@
+# app/async_api.py
+# Async variants of the read-heavy routes, registered instead of the sync ones when
+# ASYNC_DB_ENABLED is set. Each request holds a coroutine rather than a threadpool slot.
+
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import async_crud, async_database, auth_cache, cache, conditional, hot_links, ingest, negative_cache, ratelimit, schemas, security, utils
+from .config import settings
+
+router = APIRouter()
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+
+async def get_async_db():
+    async with async_database.new_async_session() as db:
+        yield db
+
+async def get_async_read_db():
+    # Same as get_async_db, but served by the read replica when DATABASE_REPLICA_URL is set.
+    async with async_database.new_async_read_session() as db:
+        yield db
+
+async def get_current_user_async(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = auth_cache.verify_token(token)
+        email: str = claims.get("sub")
+        if email is None:
+            raise credentials_exception
+    except security.JWTError:
+        raise credentials_exception
+
+    user = auth_cache.cached_user(claims)
+    if user is None:
+        user = await async_crud.get_user_snapshot(db, user_id=claims.get("uid"), email=email)
+        if user is None:
+            raise credentials_exception
+        auth_cache.remember_user(claims, user)
+    return user
+
+
+@router.get("/api/me/links", response_model=list[schemas.URLInfo])
+async def read_user_links(
+    request: Request,
+    response: Response,
+    limit: int = Query(default=settings.LINKS_PAGE_SIZE, ge=1, le=settings.LINKS_PAGE_SIZE_MAX),
+    cursor: str | None = None,
+    is_active: bool | None = None,
+    current_user: schemas.User = Depends(get_current_user_async),
+    # The primary, for the same reason as the sync route: the ETag must never run ahead of the page.
+    db: AsyncSession = Depends(get_async_db),
+):
+    after = None
+    if cursor:
+        try:
+            after = utils.decode_links_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Read before the page, from the database the token is bumped after: a change committed in
+    # between makes the ETag older than the body, never newer.
+    etag = await run_in_threadpool(conditional.listing_etag, current_user.id, request)
+    headers = conditional.validator_headers(etag, None, conditional.LISTING_CACHE_CONTROL)
+    if conditional.is_not_modified(request, etag):
+        return conditional.not_modified(headers)
+    response.headers.update(headers)
+
+    rows = await async_crud.get_user_links(db, owner_id=current_user.id, limit=limit + 1, after=after, is_active=is_active)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = utils.encode_cursor({"id": last.id, "created_at": last.created_at})
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+
+    base_url = str(request.base_url)
+    return [{**row._mapping, "short_url": f"{base_url}{row.short_code}"} for row in rows]
+
+
+@router.get("/api/me/links/recent", response_model=list[schemas.URLInfo])
+async def read_user_recent_links(
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    db_links = await async_crud.get_user_recent_links(db=db, owner_id=current_user.id)
+    base_url = str(request.base_url)
+    for link in db_links:
+        link.short_url = f"{base_url}{link.short_code}"
+    return db_links
+
+
+async def limit_redirect(short_code: str, request: Request):
+    retry_after = await ratelimit.limiter.ahit("redirect", ip=request.client.host, short_code=short_code)
+    if retry_after is not None:
+        raise ratelimit.too_many_requests(retry_after)
+
+@router.get("/{short_code}", dependencies=[Depends(limit_redirect)])
+async def redirect_to_url(short_code: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    db_url = await cache.link_cache.aget(
+        short_code,
+        lambda: negative_cache.link_filter.aguard(short_code, lambda: async_crud.get_link_snapshot(db, short_code)),
+    )
+
+    if not db_url:
+        raise HTTPException(status_code=404, detail="URL not found")
+
+    if not db_url.is_active:
+        return JSONResponse(
+            status_code=status.HTTP_410_GONE,
+            content={"detail": "This link has been deactivated"},
+            headers={"Cache-Control": "no-store, no-cache, must-revalidate, max-age=0"},
+        )
+
+    # Only buffers the click in-process, so it is safe to call on the event loop.
+    ingest.enqueue_click(
+        short_code=short_code,
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        referrer=request.headers.get("referer"),
+    )
+    hot_links.hot_links.record(short_code)
+    return RedirectResponse(
+        url=db_url.original_url, status_code=db_url.status_code, headers={"Cache-Control": db_url.cache_control}
+    )
+
+
+@router.get("/api/stats/{short_code}", response_model=schemas.URLStats)
+async def get_url_stats(
+    short_code: str, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)
+):
+    validator = await async_crud.get_url_stats_validator(db, short_code)
+    if not validator:
+        raise HTTPException(status_code=404, detail="URL not found")
+    etag, last_modified = conditional.stats_validators(validator)
+    headers = conditional.validator_headers(etag, last_modified, conditional.STATS_CACHE_CONTROL)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(headers)
+
+    db_url = await async_crud.get_db_url_stats(db, short_code)
+    if not db_url:
+        raise HTTPException(status_code=404, detail="URL not found")
+    response.headers.update(headers)
+    base_url = str(request.base_url)
+    db_url.short_url = f"{base_url}{short_code}"
+    return db_url
@@ -0,0 +1,74 @@
+# app/async_crud.py
+# Async counterparts of the read paths in crud.py that the routes in async_api.py use.
+# Writes stay on the sync session.
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import auth_cache, cache, crud, models
+
+# --- User CRUD Functions ---
+
+async def get_user_snapshot(db: AsyncSession, user_id: int | None = None, email: str | None = None) -> auth_cache.UserSnapshot | None:
+    query = select(models.User.id, models.User.email)
+    if user_id is not None:
+        query = query.where(models.User.id == user_id)
+    else:
+        query = query.where(models.User.email == email)
+    row = (await db.execute(query)).first()
+    return auth_cache.UserSnapshot(id=row.id, email=row.email) if row else None
+
+# --- URL CRUD Functions ---
+
+async def get_link_snapshot(db: AsyncSession, short_code: str) -> cache.CachedLink | None:
+    row = (
+        await db.execute(select(*crud.LINK_SNAPSHOT_COLUMNS).where(models.URL.short_code == short_code))
+    ).first()
+    return cache.CachedLink.from_row(row) if row else None
+
+async def get_url_stats_validator(db: AsyncSession, short_code: str):
+    return (await db.execute(crud.url_stats_validator_query(short_code))).first()
+
+async def get_db_url_stats(db: AsyncSession, short_code: str) -> models.URL | None:
+    pending_clicks, pending_last = crud.pending_counters(short_code)
+    row = (
+        await db.execute(
+            select(models.URL, pending_clicks, pending_last).where(models.URL.short_code == short_code)
+        )
+    ).first()
+    if not row:
+        return None
+
+    db_url, pending, last = row
+    set_committed_value(db_url, "total_clicks", (db_url.total_clicks or 0) + pending)
+    if last is not None and (db_url.last_clicked_at is None or last > db_url.last_clicked_at):
+        set_committed_value(db_url, "last_clicked_at", last)
+    db_url.recent_clicks = (
+        await db.scalars(
+            select(models.Click)
+            .where(models.Click.short_code == short_code)
+            .order_by(models.Click.clicked_at.desc())
+            .limit(10)
+        )
+    ).all()
+    return db_url
+
+async def get_user_links(
+    db: AsyncSession,
+    owner_id: int,
+    limit: int = 100,
+    after: dict | None = None,
+    is_active: bool | None = None,
+) -> list:
+    return (await db.execute(crud.user_links_query(owner_id, limit, after, is_active))).all()
+
+async def get_user_recent_links(db: AsyncSession, owner_id: int, limit: int = 5) -> list[models.URL]:
+    return (
+        await db.scalars(
+            select(models.URL)
+            .where(models.URL.owner_id == owner_id, models.URL.is_active == True)
+            .order_by(models.URL.created_at.desc())
+            .limit(limit)
+        )
+    ).all()
@@ -0,0 +1,60 @@
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from .config import settings
+from .instrumentation import instrument_engine
+
+# Sync driver prefixes and the async driver that replaces each of them.
+_ASYNC_DRIVERS = {
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+def to_async_url(url: str) -> str:
+    """Maps a sync DATABASE_URL onto the matching async driver."""
+    for prefix, replacement in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return replacement + url[len(prefix):]
+    return url
+
+def _make_async_engine(url: str) -> AsyncEngine:
+    pool_options = {} if url.startswith("sqlite") else {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    engine = create_async_engine(url, **pool_options)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+_engine: AsyncEngine | None = None
+_read_engine: AsyncEngine | None = None
+
+def get_async_engine() -> AsyncEngine:
+    # Built on first use so the async drivers are only needed when async mode is on.
+    global _engine
+    if _engine is None:
+        _engine = _make_async_engine(settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL))
+    return _engine
+
+def get_async_read_engine() -> AsyncEngine:
+    """The replica's async engine when DATABASE_REPLICA_URL is set, the primary's otherwise."""
+    global _read_engine
+    if _read_engine is None:
+        if settings.DATABASE_REPLICA_URL:
+            _read_engine = _make_async_engine(to_async_url(settings.DATABASE_REPLICA_URL))
+        else:
+            _read_engine = get_async_engine()
+    return _read_engine
+
+# expire_on_commit=False: attributes stay readable after commit without another round-trip.
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def new_async_session():
+    return AsyncSessionLocal(bind=get_async_engine())
+
+def new_async_read_session():
+    return AsyncSessionLocal(bind=get_async_read_engine())
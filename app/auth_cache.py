@@ -0,0 +1,87 @@
+# app/auth_cache.py
+# Caches for the authentication path: verified token claims, and a lightweight
+# snapshot of each user so that get_current_user doesn't query on every request.
+
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from . import models, pubsub, security
+from .cache import TTLCache
+from .config import settings
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """The fields request handlers need from the current user, detached from any session."""
+    id: int
+    email: str
+
+_claims = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+_users = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+
+def verify_token(token: str) -> dict:
+    """Decodes and verifies a JWT, reusing the result for repeat tokens. Raises JWTError."""
+    claims = _claims.get(token)
+    if claims is None:
+        claims = security.decode_access_token(token)
+        _claims.set(token, claims)
+    elif claims.get("exp") is not None and claims["exp"] < time.time():
+        _claims.pop(token)
+        raise security.JWTError("Signature has expired.")
+    return claims
+
+def _user_key(claims: dict):
+    # Tokens issued before "uid" was added only carry the email.
+    return claims.get("uid") or ("email", claims.get("sub"))
+
+def cached_user(claims: dict) -> UserSnapshot | None:
+    return _users.get(_user_key(claims))
+
+def remember_user(claims: dict, user: UserSnapshot) -> None:
+    _users.set(_user_key(claims), user)
+
+def get_user(claims: dict, loader: Callable[[], UserSnapshot | None]) -> UserSnapshot | None:
+    user = cached_user(claims)
+    if user is None:
+        user = loader()
+        if user is not None:
+            remember_user(claims, user)
+    return user
+
+def invalidate_user(user_id: int, email: str | None = None) -> None:
+    pubsub.publish("user_invalidated", user_id=user_id, email=email)
+
+def _drop_user(message: dict) -> None:
+    _users.pop(message["user_id"])
+    _users.pop(("email", message.get("email")))
+
+pubsub.subscribe("user_invalidated", _drop_user)
+
+# Mapper events only see changes flushed through the ORM unit of work: Core and
+# bulk update()/delete() statements on users bypass them and must call
+# invalidate_user themselves. Changes are collected per session and published
+# once the transaction commits, so a rolled-back change never evicts anything
+# and no worker can reload the old row between the flush and the commit.
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _on_user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    changed = session.info.setdefault("changed_users", set())
+    changed.add((target.id, target.email))
+    # An email change also has to drop the snapshot cached under the old address.
+    for old_email in inspect(target).attrs.email.history.deleted:
+        changed.add((target.id, old_email))
+
+@event.listens_for(Session, "after_commit")
+def _publish_user_changes(session):
+    for user_id, email in session.info.pop("changed_users", ()):
+        invalidate_user(user_id, email)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop("changed_users", None)
@@ -0,0 +1,26 @@
+"""
+Creates the schema and applies the migrations. Run it once per deploy, before
+the web, ingest and Celery processes start; none of them touch the schema on
+their own (set BOOTSTRAP_ON_STARTUP for a single-process dev setup):
+
+    python -m app.bootstrap
+"""
+
+import logging
+
+from sqlalchemy.engine import Engine
+
+from . import database, migrations, models
+
+logger = logging.getLogger(__name__)
+
+def bootstrap(engine: Engine | None = None) -> None:
+    engine = engine or database.get_engine()
+    models.Base.metadata.create_all(bind=engine)
+    migrations.apply(engine)
+    logger.info("Schema is up to date on %s", engine.url.render_as_string(hide_password=True))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    bootstrap()
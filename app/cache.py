@@ -0,0 +1,277 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import cached_property
+from typing import Any, Awaitable, Callable, Hashable
+from urllib.parse import quote
+
+import redis
+import redis.asyncio
+
+from . import pubsub
+from .config import settings
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass(frozen=True)
+class CachedLink:
+    """The part of a URL row the redirect path needs."""
+    original_url: str
+    is_active: bool
+    # The link's own redirect policy; None means the REDIRECT_* defaults.
+    redirect_status: int | None = None
+    cache_max_age: int | None = None
+
+    @classmethod
+    def from_row(cls, row) -> "CachedLink":
+        return cls(
+            original_url=row.original_url,
+            is_active=bool(row.is_active),
+            redirect_status=row.redirect_status,
+            cache_max_age=row.cache_max_age,
+        )
+
+    @property
+    def status_code(self) -> int:
+        return self.redirect_status or settings.REDIRECT_STATUS
+
+    @cached_property
+    def cache_control(self) -> str:
+        """Browsers only (never shared caches, which would swallow clicks), and never past the configured cap."""
+        max_age = settings.REDIRECT_CACHE_MAX_AGE if self.cache_max_age is None else self.cache_max_age
+        max_age = min(max_age, settings.REDIRECT_CACHE_MAX_AGE_LIMIT)
+        return f"private, max-age={max_age}" if max_age > 0 else "no-store"
+
+    @cached_property
+    def location(self) -> bytes:
+        """The encoded `Location` header, built once per cached entry (quoted as RedirectResponse does)."""
+        return quote(self.original_url, safe=":/%#?=@[]!$&'()*+,;").encode("latin-1")
+
+    @cached_property
+    def redirect_headers(self) -> list[tuple[bytes, bytes]]:
+        """Raw ASGI headers of the redirect, for the fast path."""
+        return [(b"location", self.location), (b"cache-control", self.cache_control.encode("latin-1"))]
+
+
+class LinkCache:
+    """
+    Read-through cache for short_code lookups: an in-process LRU/TTL tier in front
+    of a shared Redis tier. Invalidations clear both tiers and are broadcast to
+    every worker; the local TTL bounds staleness if a broadcast is ever missed.
+
+    The hottest links are also pinned in process (see app/hot_links.py): pinned
+    entries are neither evicted nor expired, only replaced by the next refresh or
+    dropped by an invalidation.
+    """
+
+    KEY_PREFIX = "linkloom:link:"
+    # Written over an invalidated key so a reader that loaded the old row just before
+    # the change cannot put it back into Redis (fills use SET NX).
+    TOMBSTONE = "-"
+
+    def __init__(
+        self,
+        local: TTLCache,
+        redis_ttl: int,
+        redis_factory: Callable[[], redis.Redis | None] = get_redis,
+        async_redis_factory: Callable[[], redis.asyncio.Redis | None] = get_async_redis,
+    ):
+        self.local = local
+        self.redis_ttl = redis_ttl
+        self._redis = redis_factory
+        self._async_redis = async_redis_factory
+        self.pinned: dict[str, CachedLink] = {}
+        # When each recently dropped code was dropped, so a pin loaded before that is not put back.
+        self._dropped = TTLCache(local.maxsize, 60)
+        self._pin_lock = threading.Lock()
+        self._stats = {
+            "pinned_hits": 0, "local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0, "redis_errors": 0,
+        }
+
+    def _get_local(self, short_code: str) -> CachedLink | None:
+        link = self.pinned.get(short_code)
+        if link is not None:
+            self._stats["pinned_hits"] += 1
+            return link
+        link = self.local.get(short_code)
+        if link is not None:
+            self._stats["local_hits"] += 1
+        return link
+
+    def get(self, short_code: str, loader: Callable[[], CachedLink | None]) -> CachedLink | None:
+        link = self._get_local(short_code)
+        if link is not None:
+            return link
+
+        client = self._redis()
+        raw = None
+        if client is not None:
+            try:
+                raw = client.get(self.KEY_PREFIX + short_code)
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+                client = None
+            if raw is not None and raw != self.TOMBSTONE:
+                link = CachedLink(**json.loads(raw))
+                self.local.set(short_code, link)
+                self._stats["redis_hits"] += 1
+                return link
+
+        self._stats["misses"] += 1
+        link = loader()
+        if link is None:
+            return None
+        self.local.set(short_code, link)
+        if client is not None and raw is None:
+            try:
+                client.set(self.KEY_PREFIX + short_code, json.dumps(asdict(link)), ex=self.redis_ttl, nx=True)
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+        return link
+
+    def get_local(self, short_code: str) -> CachedLink | None:
+        """The in-process tiers alone: never blocks, so it is safe to call on the event loop."""
+        return self._get_local(short_code)
+
+    async def aget(self, short_code: str, loader: Callable[[], Awaitable[CachedLink | None]]) -> CachedLink | None:
+        """Same as get(), for the async request path: the Redis tier and the loader are awaited."""
+        link = self._get_local(short_code)
+        if link is not None:
+            return link
+
+        client = self._async_redis()
+        raw = None
+        if client is not None:
+            try:
+                raw = await client.get(self.KEY_PREFIX + short_code)
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+                client = None
+            if raw is not None and raw != self.TOMBSTONE:
+                link = CachedLink(**json.loads(raw))
+                self.local.set(short_code, link)
+                self._stats["redis_hits"] += 1
+                return link
+
+        self._stats["misses"] += 1
+        link = await loader()
+        if link is None:
+            return None
+        self.local.set(short_code, link)
+        if client is not None and raw is None:
+            try:
+                await client.set(self.KEY_PREFIX + short_code, json.dumps(asdict(link)), ex=self.redis_ttl, nx=True)
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+        return link
+
+    def prime(self, links: dict[str, CachedLink]) -> None:
+        """Stores freshly created links in the Redis tier, so other workers find them without a query."""
+        client = self._redis()
+        if client is None or not links:
+            return
+        try:
+            with client.pipeline(transaction=False) as pipe:
+                for short_code, link in links.items():
+                    pipe.set(self.KEY_PREFIX + short_code, json.dumps(asdict(link)), ex=self.redis_ttl, nx=True)
+                pipe.execute()
+        except redis.RedisError:
+            self._stats["redis_errors"] += 1
+
+    def warm(self, links: dict[str, CachedLink]) -> None:
+        """Loads links into both tiers ahead of traffic; the Redis tier is what outlives the local TTL."""
+        for short_code, link in links.items():
+            self.local.set(short_code, link)
+        self.prime(links)
+
+    def invalidate(self, short_code: str) -> None:
+        """Drops a link from both tiers on every worker. Call after the change is committed."""
+        self._stats["invalidations"] += 1
+        client = self._redis()
+        if client is not None:
+            try:
+                ttl = max(1, int(self.local.ttl * 2))
+                client.set(self.KEY_PREFIX + short_code, self.TOMBSTONE, ex=ttl)
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+        pubsub.publish("link_invalidated", short_code=short_code)
+
+    def pin(self, links: dict[str, CachedLink], loaded_at: float) -> None:
+        """
+        Replaces the pinned set. `loaded_at` is the time.monotonic() from before the links
+        were read, so that a link invalidated while they were being read is left out.
+        """
+        with self._pin_lock:
+            self.pinned = {
+                short_code: link
+                for short_code, link in links.items()
+                if self._dropped.get(short_code, float("-inf")) < loaded_at
+            }
+
+    def drop_local(self, short_code: str) -> None:
+        with self._pin_lock:
+            self._dropped.set(short_code, time.monotonic())
+            self.pinned.pop(short_code, None)
+        self.local.pop(short_code)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "pinned": len(self.pinned),
+            "local_size": len(self.local),
+            "local_maxsize": self.local.maxsize,
+        }
+
+
+link_cache = LinkCache(
+    local=TTLCache(settings.LINK_CACHE_LOCAL_SIZE, settings.LINK_CACHE_LOCAL_TTL_SECONDS),
+    redis_ttl=settings.LINK_CACHE_REDIS_TTL_SECONDS,
+)
+
+pubsub.subscribe("link_invalidated", lambda message: link_cache.drop_local(message["short_code"]))
@@ -0,0 +1,160 @@
+"""
+Conditional GETs for the endpoints clients poll: link stats and link listings.
+
+Responses carry an `ETag` (and a `Last-Modified` where one is known) computed
+from a validator that is much cheaper than the response itself, so a request
+with a matching `If-None-Match` / `If-Modified-Since` is answered with a
+bodyless 304 before the route runs its full queries or serializes anything.
+
+- Stats are validated by the link's counters and timestamps, read with the
+  pending counter shards in one small statement.
+- Listings are validated by a per-owner version token, replaced whenever one
+  of the owner's links is created, changed or deleted. Tokens live in Redis so
+  every worker agrees on them; they are random rather than counted, so a token
+  lost to eviction or a flush is simply replaced by a new one and can never
+  repeat an old ETag. With Redis disabled the tokens are kept in process; if
+  Redis is unreachable listings are served without an ETag.
+"""
+
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable
+
+import redis
+from fastapi import Request, Response, status
+
+from .cache import TTLCache
+from .config import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(*parts) -> str:
+    """A weak ETag over `parts`: equal validators mean an equivalent representation."""
+    digest = hashlib.sha1("\x1f".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _utc(moment: datetime) -> datetime:
+    # SQLite hands back naive datetimes for timezone-aware columns; they are UTC.
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(_utc(moment), usegmt=True)
+
+def is_not_modified(request: Request, etag: str | None, last_modified: datetime | None = None) -> bool:
+    """RFC 9110 evaluation for GET: If-None-Match (weak comparison) wins over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        opaque = etag.removeprefix("W/")
+        return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP dates have whole seconds.
+    return _utc(last_modified).replace(microsecond=0) <= since
+
+def validator_headers(etag: str | None, last_modified: datetime | None, cache_control: str) -> dict[str, str]:
+    headers = {"Cache-Control": cache_control}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+# --- Link stats ---
+
+# Stats may be stored but must be revalidated before every use.
+STATS_CACHE_CONTROL = "no-cache"
+
+def stats_validators(row) -> tuple[str, datetime]:
+    """ETag and Last-Modified of /api/stats/{short_code} from a `crud.url_stats_validator_query` row."""
+    total = (row.total_clicks or 0) + row.pending_clicks
+    candidates = [row.created_at, row.updated_at, row.last_clicked_at, row.pending_last_clicked_at]
+    last_modified = max((_utc(moment) for moment in candidates if moment is not None), default=None)
+    etag = make_etag(
+        total,
+        last_modified.isoformat() if last_modified else "",
+        row.is_active,
+        row.redirect_status,
+        row.cache_max_age,
+    )
+    return etag, last_modified
+
+
+# --- Link listings ---
+
+# Listings are per user: only the client may keep them, and only to revalidate.
+LISTING_CACHE_CONTROL = "private, no-cache"
+
+class VersionTokens:
+    """Opaque tokens that change whenever the data they stand for changes."""
+
+    KEY_PREFIX = "linkloom:version:"
+
+    def __init__(self, local: TTLCache, redis_ttl: int, redis_factory: Callable[[], redis.Redis | None] = get_redis):
+        self.local = local
+        self.redis_ttl = redis_ttl
+        self._redis = redis_factory
+
+    def get(self, name: str) -> str | None:
+        """The current token for `name`, starting one if there is none. None if Redis is unreachable."""
+        client = self._redis()
+        if client is None:
+            token = self.local.get(name)
+            if token is None:
+                token = secrets.token_hex(8)
+                self.local.set(name, token)
+            return token
+        try:
+            token = secrets.token_hex(8)
+            if client.set(self.KEY_PREFIX + name, token, ex=self.redis_ttl, nx=True):
+                return token
+            return client.get(self.KEY_PREFIX + name)
+        except redis.RedisError:
+            return None
+
+    def bump(self, name: str) -> None:
+        """Replaces the token for `name`. Call after the change is committed."""
+        client = self._redis()
+        if client is None:
+            self.local.set(name, secrets.token_hex(8))
+            return
+        try:
+            client.set(self.KEY_PREFIX + name, secrets.token_hex(8), ex=self.redis_ttl)
+        except redis.RedisError:
+            # Listings may answer 304 from the old token until it expires.
+            logger.warning("Could not bump the version of %s", name, exc_info=True)
+
+
+listing_versions = VersionTokens(
+    local=TTLCache(settings.LISTING_VERSION_LOCAL_SIZE, settings.LISTING_VERSION_TTL_SECONDS),
+    redis_ttl=settings.LISTING_VERSION_TTL_SECONDS,
+)
+
+def owner_links_changed(owner_id: int | None) -> None:
+    if owner_id is not None:
+        listing_versions.bump(f"links:{owner_id}")
+
+def listing_etag(owner_id: int, request: Request) -> str | None:
+    """Covers the query string and host too: both shape the page (cursor, filters, short_url)."""
+    token = listing_versions.get(f"links:{owner_id}")
+    return make_etag(token, str(request.url)) if token is not None else None
@@ -1,15 +1,189 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
-    REDIS_URL: str = "redis://redis:6379/0" 
-    
+    # Optional read replica for the read-only routes (redirect, stats, link listings).
+    DATABASE_REPLICA_URL: str = ""
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Serve the redirect, stats and link-listing routes on AsyncSession (asyncpg / aiosqlite).
+    ASYNC_DB_ENABLED: bool = False
+    # Defaults to DATABASE_URL with its driver swapped for the async one.
+    ASYNC_DATABASE_URL: str = ""
+    REDIS_URL: str = "redis://redis:6379/0"
+    # Turn off to run everything on in-process fallbacks (tests, single-process dev).
+    REDIS_ENABLED: bool = True
+
     SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Verified tokens and user snapshots cached by get_current_user.
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    # bcrypt cost; existing hashes are upgraded the next time their user logs in.
+    BCRYPT_ROUNDS: int = 12
+    # Threads dedicated to bcrypt, and how many calls may queue for them before logins get a 503.
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # --- Startup ---
+    # Create the schema and apply migrations in the lifespan; deploys run `python -m app.bootstrap` instead.
+    BOOTSTRAP_ON_STARTUP: bool = False
+    # Links (most clicked over the window) loaded into the link cache before /ready passes; 0 skips warm-up.
+    WARMUP_LINKS: int = 0
+    WARMUP_WINDOW_HOURS: int = 24
+
+    # --- Internal endpoints ---
+    # Required in X-Internal-Token for /internal/*; without it only loopback clients get in.
+    INTERNAL_API_TOKEN: str = ""
+
+    # --- Instrumentation ---
+    # Per-route query count, DB time and serialization time, served at /internal/metrics.
+    INSTRUMENTATION_ENABLED: bool = True
+    SERVER_TIMING_HEADER: bool = True
+    # Statements slower than this are logged; 0 turns the slow-query log off.
+    SLOW_QUERY_MS: float = 0
+
+    # --- Rate limiting ---
+    # Token buckets as "<requests>/<second|minute|hour|day>"; an empty string lifts that limit.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_SHORTEN_PER_IP: str = "120/minute"
+    RATE_LIMIT_SHORTEN_PER_USER: str = "60/minute"
+    RATE_LIMIT_REDIRECT_PER_IP: str = "600/minute"
+    RATE_LIMIT_REDIRECT_PER_CODE: str = "6000/minute"
+    # Buckets kept in-process (Redis disabled or unreachable), and rejections remembered locally.
+    RATE_LIMIT_LOCAL_SIZE: int = 100_000
+
+    # --- Shortening ---
+    # Shortening a URL the same owner already has an active link for returns that link.
+    # Links created while this was off are not matched.
+    SHORTEN_DEDUP_PER_OWNER: bool = False
+
+    # --- Redirects ---
+    # Status and browser cache lifetime of links without a policy of their own.
+    REDIRECT_STATUS: Literal[301, 302, 307, 308] = 307
+    REDIRECT_CACHE_MAX_AGE: int = 0
+    # Cap on any link's max-age: a browser that cached a redirect only sees a deactivation after this.
+    REDIRECT_CACHE_MAX_AGE_LIMIT: int = 86400
+
+    # --- Conditional GETs ---
+    # Lifetime of the per-owner listing versions behind the ETags of /api/me/links.
+    LISTING_VERSION_TTL_SECONDS: int = 3600
+    LISTING_VERSION_LOCAL_SIZE: int = 100_000
+
+    # --- Batch shortening ---
+    BATCH_SHORTEN_CHUNK_SIZE: int = 500
+    BATCH_SHORTEN_MAX_ITEMS: int = 100_000
+    # Request bodies are spooled to a temp file past this size before they are parsed.
+    BATCH_SHORTEN_SPOOL_MEMORY_BYTES: int = 1_048_576
+
+    # --- Link listings ---
+    LINKS_PAGE_SIZE: int = 100
+    LINKS_PAGE_SIZE_MAX: int = 1000
+
+    # --- Dashboard summary ---
+    SUMMARY_TOP_LINKS: int = 5
+    # Hourly per-owner click counts behind the 24h/7d figures are dropped after this.
+    OWNER_ROLLUP_RETENTION_DAYS: int = 8
+
+    # --- Stats ---
+    STATS_TIMESERIES_MAX_BUCKETS: int = 2000
+
+    # --- Click export ---
+    # Rows fetched per round-trip from the export cursor, and per chunk written to the response.
+    CLICK_EXPORT_BATCH_SIZE: int = 1000
+
+    # --- Click retention ---
+    # Monthly clicks partitions created ahead of time (PostgreSQL only).
+    CLICK_PARTITIONS_AHEAD: int = 2
+    # Whole months older than this are archived and dropped; 0 keeps every click.
+    CLICK_RETENTION_DAYS: int = 0
+    CLICK_ARCHIVE_DIR: str = "archive"
+
+    # --- Redirect lookup cache ---
+    # Answer GET /{short_code} from an ASGI middleware ahead of FastAPI routing; see app/fastpath.py.
+    REDIRECT_FAST_PATH: bool = True
+    LINK_CACHE_LOCAL_SIZE: int = 10000
+    # Upper bound on how long a worker can serve a stale entry if an invalidation is missed.
+    LINK_CACHE_LOCAL_TTL_SECONDS: float = 5.0
+    LINK_CACHE_REDIS_TTL_SECONDS: int = 3600
+
+    # --- Hot links ---
+    # Per-worker heavy-hitter sketch of redirects, merged in Redis; see app/hot_links.py.
+    HOT_LINKS_ENABLED: bool = True
+    HOT_LINKS_CAPACITY: int = 1000
+    HOT_LINKS_FLUSH_SECONDS: float = 5.0
+    # Longest /api/trending window; minute buckets older than this expire.
+    HOT_LINKS_WINDOW_MINUTES: int = 60
+    HOT_LINKS_RANKING_CACHE_SECONDS: float = 5.0
+    # /api/trending picks the caller's links out of this many codes of the global ranking.
+    HOT_LINKS_TRENDING_CANDIDATES: int = 200
+    # The top links over the pin window are kept in every worker's link cache.
+    HOT_LINKS_PINNED: int = 100
+    HOT_LINKS_PIN_WINDOW_MINUTES: int = 5
+    HOT_LINKS_PIN_REFRESH_SECONDS: float = 30.0
+
+    # --- Negative lookup filter ---
+    # Bloom filter of existing codes in front of the redirect query; see app/negative_cache.py.
+    NEGATIVE_CACHE_ENABLED: bool = True
+    NEGATIVE_CACHE_CAPACITY: int = 1_000_000
+    NEGATIVE_CACHE_ERROR_RATE: float = 0.01
+    NEGATIVE_CACHE_REBUILD_SECONDS: float = 3600
+    # Rebuild early once deleted codes make up this share of the entries.
+    NEGATIVE_CACHE_STALE_RATIO: float = 0.1
+
+    # --- Click ingestion ---
+    CLICK_BATCH_MAX_SIZE: int = 500
+    CLICK_BATCH_MAX_DELAY_MS: int = 200
+    # Failed flushes before a batch is split up and its failing events dead-lettered.
+    CLICK_FLUSH_MAX_ATTEMPTS: int = 5
+    # Prefix of this consumer's processing-list name (the pid and a random suffix are appended); defaults to the hostname.
+    CLICK_INGEST_CONSUMER: str = ""
+    # A consumer that has not renewed its lease for this long is presumed dead and its in-flight events are requeued.
+    CLICK_INGEST_LEASE_SECONDS: int = 30
+    # Run the consumer inside the web process (always on when Redis is disabled).
+    CLICK_INGEST_EMBEDDED: bool = False
+
+    # --- Click enrichment ---
+    # The consumer parses user agents and looks up countries before storing clicks; see app/enrichment.py.
+    CLICK_ENRICHMENT_ENABLED: bool = True
+    # Distinct user-agent strings whose parse is memoized per consumer; 0 parses every click.
+    USER_AGENT_CACHE_SIZE: int = 10_000
+    # Built with `python -m app.enrichment build-geoip`; empty leaves the country unset.
+    GEOIP_DATABASE_PATH: str = ""
+
+    # --- Click publishing ---
+    # Redirects hand clicks to an in-process buffer; a background thread pushes them to Redis in batches.
+    CLICK_PUBLISH_BUFFER_SIZE: int = 10_000
+    CLICK_PUBLISH_BATCH_SIZE: int = 500
+    CLICK_PUBLISH_INTERVAL_MS: int = 50
+    # What happens to clicks once the buffer is full: "drop", "sample" or "spill".
+    CLICK_PUBLISH_OVERFLOW: str = "drop"
+    # With "sample", the share of clicks still admitted once the buffer is half full.
+    CLICK_PUBLISH_SAMPLE_RATE: float = 0.1
+    # With "spill", overflowing clicks are appended here and published once Redis catches up.
+    CLICK_PUBLISH_SPILL_PATH: str = "click-spill.ndjson"
+
+    # --- Click counters ---
+    CLICK_COUNTER_SHARDS: int = 8
+    CLICK_COUNTER_FOLD_SECONDS: float = 10.0
+
+    # --- Short code allocation ---
+    SHORT_CODE_ALLOCATOR: str = "range"  # "range" or "bloom"
+    SHORT_CODE_BLOCK_SOURCE: str = "db"  # "db" or "redis" (needs a persistent Redis)
+    SHORT_CODE_BLOCK_SIZE: int = 1000
+    SHORT_CODE_PERMUTE: bool = True
+    SHORT_CODE_PERMUTATION_KEY: str = ""  # defaults to one derived from SECRET_KEY
+    SHORT_CODE_BLOOM_CAPACITY: int = 10_000_000
+    SHORT_CODE_BLOOM_ERROR_RATE: float = 0.001
+
 
-    
     model_config = SettingsConfigDict(env_file=".env")
-    
-    
+
+
 settings = Settings()
\ No newline at end of file
@@ -1,31 +1,146 @@
 # app/crud.py
 
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from urllib.parse import urlsplit
+
+from sqlalchemy import Select, bindparam, case, delete, insert, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import func
 
-from . import models, schemas, security
+from . import auth_cache, cache, conditional, models, negative_cache, schemas, security
+from .config import settings
 
 # --- User CRUD Functions ---
 
 def get_user_by_email(db: Session, email: str) -> models.User | None:
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = security.get_password_hash(user.password)
+def get_user_snapshot(db: Session, user_id: int | None = None, email: str | None = None) -> auth_cache.UserSnapshot | None:
+    """Loads the current-user snapshot by primary key, or by email for tokens without a user id."""
+    query = db.query(models.User.id, models.User.email)
+    if user_id is not None:
+        row = query.filter(models.User.id == user_id).first()
+    else:
+        row = query.filter(models.User.email == email).first()
+    return auth_cache.UserSnapshot(id=row.id, email=row.email) if row else None
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str | None = None) -> models.User:
+    if hashed_password is None:
+        hashed_password = security.get_password_hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def update_user_password_hash(db: Session, user: models.User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    db.commit()
+
 # --- URL CRUD Functions ---
 
 def get_db_url_by_short_code(db: Session, short_code: str) -> models.URL | None:
     return db.query(models.URL).filter(models.URL.short_code == short_code).first()
 
+# What the redirect path needs of a link, in the shape the link cache stores (CachedLink.from_row).
+LINK_SNAPSHOT_COLUMNS = (
+    models.URL.original_url,
+    models.URL.is_active,
+    models.URL.redirect_status,
+    models.URL.cache_max_age,
+)
+
+def get_link_snapshot(db: Session, short_code: str) -> cache.CachedLink | None:
+    """Loads only the columns the redirect path needs, in the shape the link cache stores."""
+    row = db.execute(select(*LINK_SNAPSHOT_COLUMNS).where(models.URL.short_code == short_code)).first()
+    return cache.CachedLink.from_row(row) if row else None
+
+def get_link_snapshots(db: Session, short_codes: list[str]) -> dict[str, cache.CachedLink]:
+    if not short_codes:
+        return {}
+    rows = db.execute(
+        select(models.URL.short_code, *LINK_SNAPSHOT_COLUMNS).where(models.URL.short_code.in_(short_codes))
+    )
+    return {row.short_code: cache.CachedLink.from_row(row) for row in rows}
+
+def get_owned_active_codes(db: Session, owner_id: int, short_codes: list[str]) -> set[str]:
+    """Which of `short_codes` are active links of `owner_id`."""
+    if not short_codes:
+        return set()
+    return set(
+        db.scalars(
+            select(models.URL.short_code).where(
+                models.URL.short_code.in_(short_codes), models.URL.owner_id == owner_id, models.URL.is_active
+            )
+        )
+    )
+
+def get_hot_link_snapshots(db: Session, limit: int, since: datetime) -> dict[str, cache.CachedLink]:
+    """The `limit` links with the most clicks since `since`, by the hourly rollups, as link cache entries."""
+    rollups = models.ClickRollup
+    hot = (
+        select(rollups.short_code)
+        .where(rollups.granularity == "hour", rollups.bucket_start >= since)
+        .group_by(rollups.short_code)
+        .order_by(func.sum(rollups.clicks).desc())
+        .limit(limit)
+        .subquery()
+    )
+    rows = db.execute(
+        select(models.URL.short_code, *LINK_SNAPSHOT_COLUMNS).join(hot, hot.c.short_code == models.URL.short_code)
+    )
+    return {row.short_code: cache.CachedLink.from_row(row) for row in rows}
+
+def pending_counters(short_code: str):
+    """Scalar subqueries for the clicks and latest click in a link's counter shards, not yet folded."""
+    shards = models.ClickCounterShard
+    pending_clicks = (
+        select(func.coalesce(func.sum(shards.clicks), 0))
+        .where(shards.short_code == short_code)
+        .scalar_subquery()
+    )
+    pending_last = select(func.max(shards.last_clicked_at)).where(shards.short_code == short_code).scalar_subquery()
+    return pending_clicks, pending_last
+
+def url_stats_validator_query(short_code: str) -> Select:
+    """Everything the stats response depends on except the recent clicks, which only change with the counters."""
+    pending_clicks, pending_last = pending_counters(short_code)
+    return select(
+        models.URL.total_clicks,
+        models.URL.last_clicked_at,
+        models.URL.created_at,
+        models.URL.updated_at,
+        models.URL.is_active,
+        models.URL.redirect_status,
+        models.URL.cache_max_age,
+        pending_clicks.label("pending_clicks"),
+        pending_last.label("pending_last_clicked_at"),
+    ).where(models.URL.short_code == short_code)
+
+def get_url_stats_validator(db: Session, short_code: str):
+    return db.execute(url_stats_validator_query(short_code)).first()
+
 def get_db_url_stats(db: Session, short_code: str) -> models.URL | None:
-    db_url = get_db_url_by_short_code(db, short_code)
-    if db_url:
+    # Folded total and pending shard deltas are read in one statement, so a fold
+    # running concurrently can't make the count jump or double up.
+    pending_clicks, pending_last = pending_counters(short_code)
+    row = (
+        db.query(models.URL, pending_clicks, pending_last)
+        .filter(models.URL.short_code == short_code)
+        .first()
+    )
+    db_url = None
+    if row:
+        db_url, pending, last = row
+        # Not a change to persist, just the exact figure for this response.
+        set_committed_value(db_url, "total_clicks", (db_url.total_clicks or 0) + pending)
+        if last is not None and (db_url.last_clicked_at is None or last > db_url.last_clicked_at):
+            set_committed_value(db_url, "last_clicked_at", last)
         db_url.recent_clicks = (
             db.query(models.Click)
             .filter(models.Click.short_code == short_code)
@@ -36,19 +151,63 @@ def get_db_url_stats(db: Session, short_code: str) -> models.URL | None:
     return db_url
 
 # vvv THIS IS THE CORRECTED FUNCTION vvv
-def create_db_url(db: Session, url: schemas.URLCreate, short_code: str, owner_id: int) -> models.URL:
+def create_db_url(
+    db: Session, url: schemas.URLCreate, short_code: str, owner_id: int, url_hash: str | None = None
+) -> models.URL:
     """Creates a new URL entry and associates it with a user."""
     db_url = models.URL(
         original_url=str(url.original_url),
         short_code=short_code,
         owner_id=owner_id,  # FIX: Link the URL to the user
+        url_hash=url_hash,
     )
     db.add(db_url)
+    negative_cache.links_created([short_code])
+    adjust_owner_summary(db, owner_id, links=1, active=1)
     db.commit()
     db.refresh(db_url)
+    cache.link_cache.prime({short_code: cache.CachedLink(original_url=db_url.original_url, is_active=True)})
+    conditional.owner_links_changed(owner_id)
     return db_url
 # ^^^ END OF FIX ^^^
 
+def create_db_urls_bulk(db: Session, urls: list[dict], owner_id: int) -> None:
+    """
+    Inserts `{"short_code", "original_url", "url_hash"}` rows (url_hash may be None)
+    for one owner with a multi-row INSERT in one transaction.
+    """
+    if not urls:
+        return
+    db.execute(insert(models.URL), [{**url, "owner_id": owner_id} for url in urls])
+    negative_cache.links_created([url["short_code"] for url in urls])
+    adjust_owner_summary(db, owner_id, links=len(urls), active=len(urls))
+    db.commit()
+    cache.link_cache.prime(
+        {url["short_code"]: cache.CachedLink(original_url=url["original_url"], is_active=True) for url in urls}
+    )
+    conditional.owner_links_changed(owner_id)
+
+def get_owner_link_by_url_hash(db: Session, owner_id: int, url_hash: str) -> models.URL | None:
+    """One probe of the (owner_id, url_hash) unique index."""
+    return db.scalars(
+        select(models.URL).where(models.URL.owner_id == owner_id, models.URL.url_hash == url_hash)
+    ).first()
+
+def get_owner_codes_by_url_hash(db: Session, owner_id: int, url_hashes: set[str]) -> dict[str, str]:
+    """Maps each of `url_hashes` the owner already has a deduplicated link for to its short code."""
+    if not url_hashes:
+        return {}
+    rows = db.execute(
+        select(models.URL.url_hash, models.URL.short_code).where(
+            models.URL.owner_id == owner_id, models.URL.url_hash.in_(url_hashes)
+        )
+    )
+    return dict(rows.tuples().all())
+
+def get_taken_short_codes(db: Session, codes: list[str]) -> list[str]:
+    """Returns the codes from `codes` that are already stored."""
+    return list(db.scalars(select(models.URL.short_code).where(models.URL.short_code.in_(codes))))
+
 # --- Click CRUD Functions ---
 
 def create_db_click(db: Session, short_code: str, ip: str, ua: str, ref: str):
@@ -62,14 +221,397 @@ def create_db_click(db: Session, short_code: str, ip: str, ua: str, ref: str):
     db.commit()
 
 def update_db_url_clicks(db: Session, short_code: str):
-    db.query(models.URL).filter(models.URL.short_code == short_code).update({
-        models.URL.total_clicks: models.URL.total_clicks + 1,
-        models.URL.last_clicked_at: func.now(),
-    })
+    increment_click_counters(db, {short_code: (1, datetime.now(timezone.utc))})
     db.commit()
+
+def create_db_clicks_bulk(db: Session, events: list[dict]) -> int:
+    """
+    Stores a batch of click events in one transaction: a multi-row INSERT into
+    clicks plus one aggregated counter increment per short code. Events for links
+    that no longer exist are dropped. Returns the number of clicks stored.
+    Enrichment fields (browser, os, device, country) are stored when present.
+    """
+    codes = {event["short_code"] for event in events}
+    # Also the owner of each link, whose summary the batch adds to.
+    owners = dict(
+        db.execute(select(models.URL.short_code, models.URL.owner_id).where(models.URL.short_code.in_(codes)))
+        .tuples()
+        .all()
+    )
+
+    rows = [
+        {
+            "short_code": event["short_code"],
+            "ip_address": event.get("ip_address"),
+            "user_agent": event.get("user_agent"),
+            "referrer": event.get("referrer"),
+            "browser": event.get("browser"),
+            "os": event.get("os"),
+            "device": event.get("device"),
+            "country": event.get("country"),
+            "clicked_at": datetime.fromisoformat(event["clicked_at"]),
+        }
+        for event in events
+        if event["short_code"] in owners
+    ]
+    if not rows:
+        return 0
+    db.execute(insert(models.Click), rows)
+
+    totals: dict[str, tuple[int, datetime]] = {}
+    for row in rows:
+        count, last = totals.get(row["short_code"], (0, row["clicked_at"]))
+        totals[row["short_code"]] = (count + 1, max(last, row["clicked_at"]))
+
+    increment_click_counters(db, totals)
+    increment_click_rollups(db, rows)
+    increment_owner_clicks(db, rows, owners)
+    db.commit()
+    return len(rows)
     
-def get_user_links(db: Session, owner_id: int) -> list[models.URL]:
-    return db.query(models.URL).filter(models.URL.owner_id == owner_id).all()
+# --- Click Counter Functions ---
+
+def _upsert(db: Session, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Click counters need an upsert, which is not implemented for {dialect}")
+
+def _latest(column, candidate):
+    """SQL for max(column, candidate) that treats a NULL column as older than anything."""
+    return case((or_(column.is_(None), column < candidate), candidate), else_=column)
+
+def increment_click_counters(db: Session, totals: dict[str, tuple[int, datetime]]) -> None:
+    """Adds `{short_code: (clicks, last_clicked_at)}` to a random counter shard per link. Does not commit."""
+    shards = models.ClickCounterShard.__table__
+    stmt = _upsert(db, shards)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[shards.c.short_code, shards.c.shard],
+        set_={
+            "clicks": shards.c.clicks + stmt.excluded.clicks,
+            "last_clicked_at": _latest(shards.c.last_clicked_at, stmt.excluded.last_clicked_at),
+        },
+    )
+    db.execute(
+        stmt,
+        # Sorted so concurrent writers always lock rows in the same order.
+        [
+            {
+                "short_code": code,
+                "shard": random.randrange(settings.CLICK_COUNTER_SHARDS),
+                "clicks": count,
+                "last_clicked_at": last,
+            }
+            for code, (count, last) in sorted(totals.items())
+        ],
+    )
+
+def fold_click_counters(db: Session) -> int:
+    """Moves pending shard counts into URL.total_clicks. Returns the number of links updated."""
+    shards = models.ClickCounterShard.__table__
+    # DELETE ... RETURNING takes each shard row exactly once, even with increments racing it:
+    # an increment that loses the race simply recreates the row for the next fold.
+    folded = db.execute(
+        delete(shards).returning(shards.c.short_code, shards.c.clicks, shards.c.last_clicked_at)
+    ).all()
+
+    totals: dict[str, tuple[int, datetime | None]] = {}
+    for code, clicks, last in folded:
+        count, latest = totals.get(code, (0, None))
+        if latest is None or (last is not None and last > latest):
+            latest = last
+        totals[code] = (count + clicks, latest)
+
+    if totals:
+        urls = models.URL.__table__
+        last = bindparam("last")
+        db.execute(
+            update(urls)
+            .where(urls.c.short_code == bindparam("code"))
+            .values(
+                total_clicks=func.coalesce(urls.c.total_clicks, 0) + bindparam("clicks"),
+                last_clicked_at=func.coalesce(_latest(urls.c.last_clicked_at, last), urls.c.last_clicked_at),
+            ),
+            [{"code": code, "clicks": count, "last": latest} for code, (count, latest) in sorted(totals.items())],
+        )
+    db.commit()
+    return len(totals)
+
+# Only what URLInfo needs, so listings don't materialise full ORM objects.
+USER_LINK_COLUMNS = (
+    models.URL.id,
+    models.URL.short_code,
+    models.URL.original_url,
+    models.URL.owner_id,
+    models.URL.is_active,
+    models.URL.created_at,
+    models.URL.redirect_status,
+    models.URL.cache_max_age,
+)
+
+def user_links_query(
+    owner_id: int,
+    limit: int,
+    after: dict | None = None,
+    is_active: bool | None = None,
+) -> Select:
+    """
+    One page of an owner's links, newest first, keyset-paginated on (created_at, id).
+    `after` is the {"id", "created_at"} of the last row of the previous page.
+    """
+    query = select(*USER_LINK_COLUMNS).where(models.URL.owner_id == owner_id)
+    if is_active is not None:
+        query = query.where(models.URL.is_active == is_active)
+    if after is not None:
+        # Compare against the stored created_at of the cursor row rather than the value
+        # echoed back in the token, which may not round-trip exactly on every backend.
+        # The token value is only the fallback for a row deleted in between pages.
+        cursor_created_at = (
+            select(models.URL.created_at).where(models.URL.id == after["id"]).scalar_subquery()
+        )
+        query = query.where(
+            tuple_(models.URL.created_at, models.URL.id)
+            < tuple_(func.coalesce(cursor_created_at, after["created_at"]), after["id"])
+        )
+    return query.order_by(models.URL.created_at.desc(), models.URL.id.desc()).limit(limit)
+
+# --- Click Rollup Functions ---
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+DIRECT_REFERRER = "(direct)"
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+def referrer_host(referrer: str | None) -> str:
+    """Rolls referrers up to their host so the per-day referrer table stays small."""
+    if not referrer:
+        return DIRECT_REFERRER
+    host = urlsplit(referrer).hostname
+    return (host or referrer)[:255].lower()
+
+def _increment_counts(db: Session, model, key_columns: list[str], counts: Counter) -> None:
+    table = model.__table__
+    stmt = _upsert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[name] for name in key_columns],
+        set_={"clicks": table.c.clicks + stmt.excluded.clicks},
+    )
+    # Sorted so concurrent writers always lock rows in the same order.
+    db.execute(stmt, [{**dict(zip(key_columns, key)), "clicks": n} for key, n in sorted(counts.items())])
+
+def increment_click_rollups(db: Session, rows: list[dict]) -> None:
+    """Adds a batch of stored clicks to the hourly/daily and referrer rollups. Does not commit."""
+    buckets: Counter = Counter()
+    referrers: Counter = Counter()
+    for row in rows:
+        for granularity in ROLLUP_GRANULARITIES:
+            buckets[(row["short_code"], granularity, bucket_start(row["clicked_at"], granularity))] += 1
+        day = bucket_start(row["clicked_at"], "day")
+        referrers[(row["short_code"], day, referrer_host(row["referrer"]))] += 1
+
+    _increment_counts(db, models.ClickRollup, ["short_code", "granularity", "bucket_start"], buckets)
+    _increment_counts(db, models.ReferrerRollup, ["short_code", "day", "referrer"], referrers)
+
+# --- Owner Summary Functions ---
+
+def adjust_owner_summary(db: Session, owner_id: int | None, links: int = 0, active: int = 0, clicks: int = 0) -> None:
+    """Adds the deltas to the owner's summary row, creating it for a new owner. Does not commit."""
+    if owner_id is None:
+        return
+    table = models.OwnerSummary.__table__
+    stmt = _upsert(db, table).values(owner_id=owner_id, total_links=links, active_links=active, total_clicks=clicks)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.owner_id],
+            set_={
+                "total_links": table.c.total_links + stmt.excluded.total_links,
+                "active_links": table.c.active_links + stmt.excluded.active_links,
+                "total_clicks": table.c.total_clicks + stmt.excluded.total_clicks,
+            },
+        )
+    )
+
+def increment_owner_clicks(db: Session, rows: list[dict], owners: dict[str, int | None]) -> None:
+    """Adds a batch of stored clicks to their owners' totals and hourly counts. Does not commit."""
+    totals: Counter = Counter()
+    hourly: Counter = Counter()
+    for row in rows:
+        owner_id = owners.get(row["short_code"])
+        if owner_id is not None:
+            totals[owner_id] += 1
+            hourly[(owner_id, bucket_start(row["clicked_at"], "hour"))] += 1
+    # Sorted so concurrent writers always lock rows in the same order.
+    for owner_id, clicks in sorted(totals.items()):
+        adjust_owner_summary(db, owner_id, clicks=clicks)
+    if hourly:
+        _increment_counts(db, models.OwnerClickRollup, ["owner_id", "bucket_start"], hourly)
+
+def forget_link_in_owner_summary(db: Session, db_url: models.URL) -> None:
+    """Takes a link that is about to be deleted, and its clicks, out of its owner's figures. Does not commit."""
+    if db_url.owner_id is None:
+        return
+    shards, rollups = models.ClickCounterShard, models.ClickRollup
+    pending = db.scalar(select(func.coalesce(func.sum(shards.clicks), 0)).where(shards.short_code == db_url.short_code))
+    adjust_owner_summary(
+        db,
+        db_url.owner_id,
+        links=-1,
+        active=-1 if db_url.is_active else 0,
+        clicks=-((db_url.total_clicks or 0) + pending),
+    )
+    since = bucket_start(datetime.now(timezone.utc), "hour") - timedelta(days=settings.OWNER_ROLLUP_RETENTION_DAYS)
+    hourly = db.execute(
+        select(rollups.bucket_start, rollups.clicks).where(
+            rollups.short_code == db_url.short_code, rollups.granularity == "hour", rollups.bucket_start >= since
+        )
+    ).all()
+    if hourly:
+        _increment_counts(
+            db,
+            models.OwnerClickRollup,
+            ["owner_id", "bucket_start"],
+            Counter({(db_url.owner_id, bucket_start(row.bucket_start, "hour")): -row.clicks for row in hourly}),
+        )
+
+def get_owner_summary(db: Session, owner_id: int, now: datetime, top: int = 5) -> dict:
+    """
+    Reads the summary row, at most a week of hourly rows, the `top` links off the
+    (owner_id, total_clicks) index and the owner's links with unfolded clicks: the
+    cost does not grow with the number of links.
+
+    Links are ranked by folded plus pending clicks, the same count as `total_clicks`.
+    """
+    summary = db.get(models.OwnerSummary, owner_id)
+    current_hour = bucket_start(now, "hour")
+    rollups = models.OwnerClickRollup
+    hourly = db.execute(
+        select(rollups.bucket_start, rollups.clicks).where(
+            rollups.owner_id == owner_id, rollups.bucket_start > current_hour - timedelta(days=7)
+        )
+    ).all()
+    day_start = current_hour - timedelta(hours=23)
+    # The top by folded plus pending clicks is among the top by folded clicks and the links
+    # with pending clicks; the shards only hold what was clicked since the last fold.
+    shards = models.ClickCounterShard
+    pending = db.execute(
+        select(models.URL.short_code, models.URL.original_url, models.URL.total_clicks, func.sum(shards.clicks))
+        .join(shards, shards.short_code == models.URL.short_code)
+        .where(models.URL.owner_id == owner_id)
+        .group_by(models.URL.short_code, models.URL.original_url, models.URL.total_clicks)
+    ).all()
+    leaders = db.execute(
+        select(models.URL.short_code, models.URL.original_url, models.URL.total_clicks)
+        .where(models.URL.owner_id == owner_id)
+        .order_by(models.URL.total_clicks.desc())
+        .limit(top)
+    ).all()
+    candidates = {
+        row.short_code: {"short_code": row.short_code, "original_url": row.original_url, "total_clicks": row.total_clicks or 0}
+        for row in leaders
+    }
+    for short_code, original_url, folded, pending_clicks in pending:
+        candidates[short_code] = {
+            "short_code": short_code, "original_url": original_url, "total_clicks": (folded or 0) + pending_clicks,
+        }
+    top_links = sorted(candidates.values(), key=lambda link: link["total_clicks"], reverse=True)[:top]
+    return {
+        "total_links": summary.total_links if summary else 0,
+        "active_links": summary.active_links if summary else 0,
+        "total_clicks": summary.total_clicks if summary else 0,
+        "clicks_last_24h": sum(row.clicks for row in hourly if bucket_start(row.bucket_start, "hour") >= day_start),
+        "clicks_last_7d": sum(row.clicks for row in hourly),
+        "top_links": top_links,
+    }
+
+def prune_owner_click_rollups(db: Session, before: datetime) -> int:
+    result = db.execute(delete(models.OwnerClickRollup).where(models.OwnerClickRollup.bucket_start < before))
+    db.commit()
+    return result.rowcount
+
+def get_click_timeseries(
+    db: Session, short_code: str, granularity: str, start: datetime, end: datetime
+) -> dict[datetime, int]:
+    """Clicks per bucket in [start, end), read from the rollups only."""
+    rollups = models.ClickRollup
+    rows = db.execute(
+        select(rollups.bucket_start, rollups.clicks).where(
+            rollups.short_code == short_code,
+            rollups.granularity == granularity,
+            rollups.bucket_start >= start,
+            rollups.bucket_start < end,
+        )
+    ).all()
+    return {bucket_start(row.bucket_start, granularity): row.clicks for row in rows}
+
+def get_top_referrers(db: Session, short_code: str, start: datetime, end: datetime, limit: int = 10) -> list:
+    rollups = models.ReferrerRollup
+    total = func.sum(rollups.clicks).label("clicks")
+    return db.execute(
+        select(rollups.referrer, total)
+        .where(rollups.short_code == short_code, rollups.day >= start, rollups.day < end)
+        .group_by(rollups.referrer)
+        .order_by(total.desc(), rollups.referrer)
+        .limit(limit)
+    ).all()
+
+# --- Click Export ---
+
+CLICK_EXPORT_COLUMNS = (
+    models.Click.id,
+    models.Click.short_code,
+    models.Click.clicked_at,
+    models.Click.ip_address,
+    models.Click.user_agent,
+    models.Click.referrer,
+    models.Click.browser,
+    models.Click.os,
+    models.Click.device,
+    models.Click.country,
+)
+
+def iter_owner_clicks(
+    db: Session,
+    owner_id: int,
+    short_code: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after_id: int | None = None,
+    batch_size: int = 1000,
+) -> Iterator:
+    """
+    Yields an owner's clicks in id order, optionally for one link, within
+    [start, end) and after click `after_id`. Rows come off a server-side cursor
+    `batch_size` at a time, so memory stays flat however many there are.
+    """
+    query = (
+        select(*CLICK_EXPORT_COLUMNS)
+        .join(models.URL, models.URL.short_code == models.Click.short_code)
+        .where(models.URL.owner_id == owner_id)
+    )
+    if short_code is not None:
+        query = query.where(models.Click.short_code == short_code)
+    if start is not None:
+        query = query.where(models.Click.clicked_at >= start)
+    if end is not None:
+        query = query.where(models.Click.clicked_at < end)
+    if after_id is not None:
+        query = query.where(models.Click.id > after_id)
+    # yield_per implies stream_results: a named cursor on PostgreSQL instead of a fully buffered result.
+    yield from db.execute(query.order_by(models.Click.id).execution_options(yield_per=batch_size))
+
+def get_user_links(
+    db: Session,
+    owner_id: int,
+    limit: int = 100,
+    after: dict | None = None,
+    is_active: bool | None = None,
+) -> list:
+    return db.execute(user_links_query(owner_id, limit, after, is_active)).all()
 
 
 def get_user_recent_links(db: Session, owner_id: int, limit: int = 5) -> list[models.URL]:
@@ -93,11 +635,37 @@ def update_db_url_status(db: Session, short_code: str, owner_id: int) -> models.
 
     if db_url:
         db_url.is_active = not db_url.is_active
+        if not db_url.is_active:
+            # A deactivated link is never handed out again by dedup; shortening its URL makes a new one.
+            db_url.url_hash = None
+        db_url.updated_at = datetime.now(timezone.utc)
+        adjust_owner_summary(db, owner_id, active=1 if db_url.is_active else -1)
         db.commit()
         db.refresh(db_url)
+        cache.link_cache.invalidate(short_code)
+        conditional.owner_links_changed(owner_id)
     
     return db_url
 
+def update_db_url_redirect_policy(
+    db: Session, short_code: str, owner_id: int, policy: schemas.RedirectPolicy
+) -> models.URL | None:
+    db_url = db.query(models.URL).filter(
+        models.URL.short_code == short_code,
+        models.URL.owner_id == owner_id
+    ).first()
+
+    if db_url:
+        db_url.redirect_status = policy.redirect_status
+        db_url.cache_max_age = policy.cache_max_age
+        db_url.updated_at = datetime.now(timezone.utc)
+        db.commit()
+        db.refresh(db_url)
+        cache.link_cache.invalidate(short_code)
+        conditional.owner_links_changed(owner_id)
+
+    return db_url
+
 # New Endpoint 
 
 def delete_db_link(db: Session, short_code: str, owner_id: int) -> models.URL | None:
@@ -107,8 +675,15 @@ def delete_db_link(db: Session, short_code: str, owner_id: int) -> models.URL |
     ).first()
 
     if db_url:
+        forget_link_in_owner_summary(db, db_url)
         db.delete(db_url)
+        # Counter shards and rollups are keyed by short_code without a foreign key; drop them with the link.
+        for table in (models.ClickCounterShard, models.ClickRollup, models.ReferrerRollup):
+            db.execute(delete(table).where(table.short_code == short_code))
         db.commit()
+        cache.link_cache.invalidate(short_code)
+        negative_cache.links_deleted([short_code])
+        conditional.owner_links_changed(owner_id)
     
     return db_url
 
@@ -1,9 +1,150 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from .config import settings
+from .instrumentation import instrument_engine
+
+
+class PoolStats:
+    """Counters for one engine's connection pool, fed by pool events and InstrumentedQueuePool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def incr(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - started, timed_out=False)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the same stats.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+_pool_stats: dict[Engine, PoolStats] = {}
+
+def _make_engine(url: str) -> Engine:
+    if url.startswith("sqlite"):
+        # SQLite connections get handed between request threads and background consumers.
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    stats = PoolStats()
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.stats = stats
+    event.listen(engine, "checkout", lambda *args: stats.incr("checkouts"))
+    event.listen(engine, "connect", lambda *args: stats.incr("connects"))
+    event.listen(engine, "invalidate", lambda *args: stats.incr("invalidations"))
+    _pool_stats[engine] = stats
+    instrument_engine(engine)
+    return engine
+
+
+_engine: Engine | None = None
+_read_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    # Built on first use, so importing the app (web, Celery, tests) touches no database.
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _make_engine(settings.DATABASE_URL)
+    return _engine
+
+def get_read_engine() -> Engine:
+    """Read-only routes (redirect, stats) go to the replica when one is configured."""
+    global _read_engine
+    if _read_engine is None:
+        if settings.DATABASE_REPLICA_URL:
+            with _engine_lock:
+                if _read_engine is None:
+                    _read_engine = _make_engine(settings.DATABASE_REPLICA_URL)
+        else:
+            _read_engine = get_engine()
+    return _read_engine
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+def new_session() -> Session:
+    return SessionLocal(bind=get_engine())
+
+def new_read_session() -> Session:
+    return SessionLocal(bind=get_read_engine())
+
+Base = declarative_base()
 
-engine = create_engine(settings.DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_metrics() -> dict:
+    """Live pool state and counters for the primary and (if separate) replica engine."""
+    engines = {"primary": get_engine()}
+    if get_read_engine() is not engines["primary"]:
+        engines["replica"] = get_read_engine()
 
-Base = declarative_base()
\ No newline at end of file
+    metrics = {}
+    for name, eng in engines.items():
+        pool = eng.pool
+        state = {"pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            state.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        metrics[name] = {**state, **_pool_stats[eng].as_dict()}
+    return metrics
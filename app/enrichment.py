@@ -0,0 +1,217 @@
+"""
+Click enrichment: the consumer turns each click's raw user agent into
+browser / OS / device and its IP address into a country before the batch is
+stored, so breakdowns group by short columns instead of reparsing strings.
+
+User-agent strings are few and heavily skewed (a handful of browser builds
+make up most traffic), so parses are memoized in an LRU of
+USER_AGENT_CACHE_SIZE entries per consumer process.
+
+Countries come from an offline range database that is memory-mapped and
+binary-searched in place, so it costs no load time and its pages are shared
+by every consumer process on a host. Build it from a CSV of
+`start_ip,end_ip,country` rows (IPv4 and/or IPv6, e.g. the DB-IP "IP to
+Country Lite" download):
+
+    python -m app.enrichment build-geoip dbip-country-lite.csv geoip.bin
+
+and point GEOIP_DATABASE_PATH at the result. Without one, country stays empty.
+
+File layout: the magic `LLGEOIP1`, a big-endian uint32 record count, then
+sorted, non-overlapping records of start address (16 bytes), end address
+(16 bytes) and ISO country code (2 bytes). IPv4 is stored IPv4-mapped, so one
+bytewise comparison orders both families.
+"""
+
+import bisect
+import csv
+import ipaddress
+import logging
+import mmap
+import re
+import struct
+import sys
+import threading
+from functools import lru_cache
+from typing import Callable, Iterable, NamedTuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# --- User agents ---
+
+class UserAgent(NamedTuple):
+    browser: str
+    os: str
+    device: str
+
+# First match wins, so more specific tokens come first (Edge and Opera also say Chrome and Safari).
+BROWSER_RULES = [
+    (re.compile(r"bot\b|crawl|spider|slurp|facebookexternalhit|curl/|wget/|python-requests|go-http-client", re.I), "Bot"),
+    (re.compile(r"Edg(e|A|iOS)?/"), "Edge"),
+    (re.compile(r"OPR/|Opera"), "Opera"),
+    (re.compile(r"SamsungBrowser/"), "Samsung Internet"),
+    (re.compile(r"Firefox/|FxiOS/"), "Firefox"),
+    (re.compile(r"Chrome/|CriOS/|Chromium/"), "Chrome"),
+    (re.compile(r"Version/[\d.]+.*Safari/"), "Safari"),
+    (re.compile(r"MSIE |Trident/"), "Internet Explorer"),
+]
+OS_RULES = [
+    (re.compile(r"iPhone|iPad|iPod"), "iOS"),
+    (re.compile(r"Android"), "Android"),
+    (re.compile(r"Windows"), "Windows"),
+    (re.compile(r"CrOS"), "Chrome OS"),
+    (re.compile(r"Mac OS X|Macintosh"), "macOS"),
+    (re.compile(r"Linux"), "Linux"),
+]
+TABLET = re.compile(r"iPad|Tablet|Android(?!.*Mobile)")
+MOBILE = re.compile(r"Mobi|iPhone|iPod|Android")
+
+def _first(rules, user_agent: str) -> str:
+    for pattern, name in rules:
+        if pattern.search(user_agent):
+            return name
+    return "Other"
+
+def parse_user_agent(user_agent: str) -> UserAgent:
+    browser = _first(BROWSER_RULES, user_agent)
+    os = _first(OS_RULES, user_agent)
+    if browser == "Bot":
+        device = "bot"
+    elif TABLET.search(user_agent):
+        device = "tablet"
+    elif MOBILE.search(user_agent):
+        device = "mobile"
+    else:
+        device = "desktop" if os != "Other" else "other"
+    return UserAgent(browser, os, device)
+
+
+# --- Geo-IP ---
+
+GEOIP_MAGIC = b"LLGEOIP1"
+GEOIP_HEADER = struct.Struct(">8sI")
+GEOIP_RECORD_SIZE = 34
+
+def _address_key(address: str) -> bytes:
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        ip = ipaddress.IPv6Address(b"\0" * 10 + b"\xff\xff" + ip.packed)
+    return ip.packed
+
+class _Starts:
+    """The start addresses of the records, as a sequence bisect can search without copying them."""
+
+    def __init__(self, buffer, count: int):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        offset = GEOIP_HEADER.size + index * GEOIP_RECORD_SIZE
+        return self.buffer[offset:offset + 16]
+
+class GeoIPDatabase:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = GEOIP_HEADER.unpack_from(self._map)
+        if magic != GEOIP_MAGIC or len(self._map) != GEOIP_HEADER.size + self.count * GEOIP_RECORD_SIZE:
+            self._map.close()
+            raise ValueError(f"{path} is not a geo-IP database built by `python -m app.enrichment build-geoip`")
+        self._starts = _Starts(self._map, self.count)
+
+    def country(self, address: str | None) -> str | None:
+        if not address:
+            return None
+        try:
+            key = _address_key(address)
+        except ValueError:
+            return None
+        index = bisect.bisect_right(self._starts, key) - 1
+        if index < 0:
+            return None
+        offset = GEOIP_HEADER.size + index * GEOIP_RECORD_SIZE
+        if self._map[offset + 16:offset + 32] < key:
+            return None
+        return self._map[offset + 32:offset + 34].decode("ascii")
+
+    def close(self) -> None:
+        self._map.close()
+
+def build_geoip_database(ranges: Iterable[tuple[str, str, str]], path: str) -> int:
+    """Writes (start_ip, end_ip, country) ranges in the memory-mappable layout; returns the record count."""
+    records = sorted(
+        (_address_key(start), _address_key(end), country.strip().upper().encode("ascii"))
+        for start, end, country in ranges
+    )
+    for (_, end, _), (start, _, _) in zip(records, records[1:]):
+        if start <= end:
+            raise ValueError(f"Overlapping ranges at {ipaddress.ip_address(start)}")
+    with open(path, "wb") as f:
+        f.write(GEOIP_HEADER.pack(GEOIP_MAGIC, len(records)))
+        for start, end, country in records:
+            if len(country) != 2:
+                raise ValueError(f"Country codes have two letters, got {country!r}")
+            f.write(start + end + country)
+    return len(records)
+
+
+# --- Enrichment stage ---
+
+class ClickEnricher:
+    """Adds browser, os, device and country to click events; `ua_cache_size=0` turns memoization off."""
+
+    def __init__(self, geoip: GeoIPDatabase | None, ua_cache_size: int):
+        self.geoip = geoip
+        self.parse_user_agent: Callable[[str], UserAgent] = (
+            lru_cache(maxsize=ua_cache_size)(parse_user_agent) if ua_cache_size else parse_user_agent
+        )
+
+    def enrich(self, events: list[dict]) -> list[dict]:
+        enriched = []
+        for event in events:
+            user_agent = event.get("user_agent")
+            browser, os, device = self.parse_user_agent(user_agent) if user_agent else (None, None, None)
+            country = self.geoip.country(event.get("ip_address")) if self.geoip is not None else None
+            enriched.append({**event, "browser": browser, "os": os, "device": device, "country": country})
+        return enriched
+
+    def stats(self) -> dict:
+        info = getattr(self.parse_user_agent, "cache_info", None)
+        stats = {"geoip_ranges": self.geoip.count if self.geoip is not None else None}
+        if info is not None:
+            hits, misses, _, size = info()
+            stats.update(user_agent_cache_hits=hits, user_agent_cache_misses=misses, user_agent_cache_size=size)
+        return stats
+
+
+_enricher: ClickEnricher | None = None
+_enricher_lock = threading.Lock()
+
+def get_enricher() -> ClickEnricher:
+    global _enricher
+    with _enricher_lock:
+        if _enricher is None:
+            geoip = None
+            if settings.GEOIP_DATABASE_PATH:
+                try:
+                    geoip = GeoIPDatabase(settings.GEOIP_DATABASE_PATH)
+                except (OSError, ValueError):
+                    logger.exception("Cannot open the geo-IP database; clicks are stored without a country")
+            _enricher = ClickEnricher(geoip, settings.USER_AGENT_CACHE_SIZE)
+        return _enricher
+
+def enricher_stats() -> dict | None:
+    return _enricher.stats() if _enricher is not None else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build-geoip":
+        sys.exit("usage: python -m app.enrichment build-geoip <ranges.csv> <output>")
+    with open(sys.argv[2], newline="") as f:
+        count = build_geoip_database((row[:3] for row in csv.reader(f) if row), sys.argv[3])
+    print(f"Wrote {count} ranges to {sys.argv[3]}")
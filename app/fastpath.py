@@ -0,0 +1,127 @@
+"""
+Fast path for `GET /{short_code}`: a pure ASGI middleware that answers
+redirects before FastAPI routing, dependency resolution and response
+validation run.
+
+A link in the local cache tier is served with no session, no query and no
+thread hop; the `Location` header is encoded once per cached entry. On a miss
+the shared Redis tier and the negative lookup filter are consulted as usual,
+then a single Core statement runs on a pooled connection (no Session, no ORM
+objects). Rate limiting, click capture, the link's redirect policy and the
+404/410 responses behave exactly like the regular route, which stays in place
+for everything the fast path passes on (other methods, multi-segment paths,
+the app's own fixed routes).
+"""
+
+import json
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, select
+
+from . import cache, crud, database, hot_links, ingest, models, negative_cache, ratelimit
+
+LINK_SNAPSHOT = select(*crud.LINK_SNAPSHOT_COLUMNS).where(models.URL.short_code == bindparam("short_code"))
+
+# Byte-for-byte what the regular route's JSONResponse/HTTPException would send.
+def _json(content: dict) -> bytes:
+    return json.dumps(content, separators=(",", ":")).encode()
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+NOT_FOUND_BODY = _json({"detail": "URL not found"})
+GONE_BODY = _json({"detail": "This link has been deactivated"})
+GONE_HEADERS = [*JSON_HEADERS, (b"cache-control", b"no-store, no-cache, must-revalidate, max-age=0")]
+RATE_LIMITED_BODY = _json({"detail": "Rate limit exceeded"})
+
+
+class FastPathRoute:
+    """Stands in for the matched route in the request scope, so metrics group fast-path hits with the route."""
+    path = "/{short_code}"
+
+
+def _snapshot(row) -> cache.CachedLink | None:
+    return cache.CachedLink.from_row(row) if row else None
+
+def load_link(short_code: str) -> cache.CachedLink | None:
+    with database.get_read_engine().connect() as connection:
+        return _snapshot(connection.execute(LINK_SNAPSHOT, {"short_code": short_code}).first())
+
+async def aload_link(short_code: str) -> cache.CachedLink | None:
+    from .async_database import get_async_read_engine
+
+    async with get_async_read_engine().connect() as connection:
+        return _snapshot((await connection.execute(LINK_SNAPSHOT, {"short_code": short_code})).first())
+
+
+class RedirectFastPath:
+    def __init__(self, app, router, use_async_db: bool = False):
+        self.app = app
+        self.router = router
+        self.use_async_db = use_async_db
+        self._reserved: set[str] | None = None
+
+    def _short_code(self, scope) -> str | None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return None
+        path = scope["path"]
+        if path.count("/") != 1 or len(path) < 2:
+            return None
+        if self._reserved is None:
+            # Fixed single-segment routes (docs, health, ...) are left to the router.
+            self._reserved = {route.path for route in self.router.routes if "{" not in getattr(route, "path", "{")}
+        return None if path in self._reserved else path[1:]
+
+    async def _lookup(self, short_code: str) -> cache.CachedLink | None:
+        link = cache.link_cache.get_local(short_code)
+        if link is not None:
+            return link
+        if self.use_async_db:
+            return await cache.link_cache.aget(
+                short_code, lambda: negative_cache.link_filter.aguard(short_code, lambda: aload_link(short_code))
+            )
+        return await run_in_threadpool(
+            cache.link_cache.get,
+            short_code,
+            lambda: negative_cache.link_filter.guard(short_code, lambda: load_link(short_code)),
+        )
+
+    async def __call__(self, scope, receive, send):
+        short_code = self._short_code(scope)
+        if short_code is None:
+            await self.app(scope, receive, send)
+            return
+        scope["route"] = FastPathRoute
+
+        client = scope.get("client")
+        ip_address = client[0] if client else None
+        retry_after = await ratelimit.limiter.ahit("redirect", ip=ip_address, short_code=short_code)
+        if retry_after is not None:
+            headers = [*JSON_HEADERS, (b"retry-after", ratelimit.retry_after_header(retry_after).encode())]
+            await _respond(send, 429, headers, RATE_LIMITED_BODY)
+            return
+
+        link = await self._lookup(short_code)
+        if link is None:
+            await _respond(send, 404, JSON_HEADERS, NOT_FOUND_BODY)
+            return
+        if not link.is_active:
+            await _respond(send, 410, GONE_HEADERS, GONE_BODY)
+            return
+
+        user_agent = referrer = None
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+            elif name == b"referer":
+                referrer = value.decode("latin-1")
+        ingest.enqueue_click(short_code=short_code, ip_address=ip_address, user_agent=user_agent, referrer=referrer)
+        hot_links.hot_links.record(short_code)
+        await _respond(send, link.status_code, link.redirect_headers, b"")
+
+
+async def _respond(send, status: int, headers: list[tuple[bytes, bytes]], body: bytes) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [*headers, (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
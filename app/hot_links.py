@@ -0,0 +1,225 @@
+"""
+Heavy-hitter tracking of redirects: which short codes get most of the traffic.
+
+Every worker counts its redirects in a Space-Saving sketch of
+HOT_LINKS_CAPACITY counters: constant memory however many codes are seen, and
+every code with more than 1/capacity of the traffic is guaranteed to be in it,
+with a count that overestimates by at most the smallest counter. Every
+HOT_LINKS_FLUSH_SECONDS the sketch is swapped for an empty one and its counts
+are added to the current minute's sorted set in Redis, which merges the workers
+(ZINCRBY is additive). Rankings over a sliding window are the union of the last
+N minute sets, so nothing reads the clicks table; minutes older than
+HOT_LINKS_WINDOW_MINUTES expire on their own.
+
+The top HOT_LINKS_PINNED links over the last HOT_LINKS_PIN_WINDOW_MINUTES are
+pinned in every worker's link cache and reloaded every
+HOT_LINKS_PIN_REFRESH_SECONDS, so they never miss the lookup cache.
+
+With Redis disabled the minute buckets are kept in process.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from operator import itemgetter
+from typing import Callable
+
+import redis
+
+from . import cache, crud, database
+from .cache import TTLCache
+from .config import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """The Space-Saving top-k sketch (Metwally et al.) with a lazily repaired min-heap over its counters."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # One (count, item) entry per counted item. Increments don't touch the heap, so an entry's
+        # count may be lower than the item's; the top is fixed up only when a counter is taken over.
+        self._heap: list[tuple[int, str]] = []
+
+    def offer(self, item: str, n: int = 1) -> None:
+        count = self.counts.get(item)
+        if count is not None:
+            self.counts[item] = count + n
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = n
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (n, item))
+            return
+        while True:
+            low, victim = self._heap[0]
+            current = self.counts[victim]
+            if current == low:
+                break
+            heapq.heapreplace(self._heap, (current, victim))
+        # The new item inherits the smallest counter, which bounds how far its count can be off.
+        heapq.heapreplace(self._heap, (low + n, item))
+        del self.counts[victim], self.errors[victim]
+        self.counts[item] = low + n
+        self.errors[item] = low
+
+    def top(self, n: int) -> list[tuple[str, int, int]]:
+        """The `n` largest counters as (item, count, maximum overestimate)."""
+        largest = heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+        return [(item, count, self.errors[item]) for item, count in largest]
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+class HotLinks:
+    KEY_PREFIX = "linkloom:hot:"
+
+    def __init__(
+        self,
+        capacity: int,
+        window_minutes: int,
+        enabled: bool = True,
+        redis_factory: Callable[[], redis.Redis | None] = get_redis,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.capacity = capacity
+        self.window_minutes = window_minutes
+        self.enabled = enabled
+        self._redis = redis_factory
+        self._clock = clock
+        self._sketch = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+        # Minute buckets when Redis is disabled: {minute: Counter}.
+        self._minutes: dict[int, Counter] = {}
+        self._rankings = TTLCache(64, settings.HOT_LINKS_RANKING_CACHE_SECONDS)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"recorded": 0, "flushes": 0, "pin_refreshes": 0, "redis_errors": 0}
+
+    def record(self, short_code: str) -> None:
+        """Counts one redirect; an increment under a lock, cheap enough for the redirect path."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._sketch.offer(short_code)
+            self._stats["recorded"] += 1
+
+    def _minute(self) -> int:
+        return int(self._clock() // 60)
+
+    def flush(self) -> int:
+        """Adds this worker's counts since the last flush to the current minute. Returns the codes flushed."""
+        with self._lock:
+            sketch, self._sketch = self._sketch, SpaceSaving(self.capacity)
+        if not sketch.counts:
+            return 0
+        minute = self._minute()
+        client = self._redis()
+        if client is None:
+            with self._lock:
+                bucket = self._minutes.setdefault(minute, Counter())
+                bucket.update(sketch.counts)
+                if len(bucket) > self.capacity * 2:
+                    self._minutes[minute] = Counter(dict(bucket.most_common(self.capacity)))
+                for old in [m for m in self._minutes if m <= minute - self.window_minutes]:
+                    del self._minutes[old]
+        else:
+            key = f"{self.KEY_PREFIX}{minute}"
+            try:
+                with client.pipeline(transaction=False) as pipe:
+                    for short_code, count in sketch.counts.items():
+                        pipe.zincrby(key, count, short_code)
+                    pipe.expire(key, (self.window_minutes + 1) * 60)
+                    pipe.execute()
+            except redis.RedisError:
+                # Only rankings lose these counts; the clicks themselves are stored elsewhere.
+                self._stats["redis_errors"] += 1
+                logger.warning("Could not publish hot link counts", exc_info=True)
+        self._stats["flushes"] += 1
+        return len(sketch.counts)
+
+    def trending(self, window_minutes: int, limit: int) -> list[tuple[str, int]]:
+        """The `limit` most redirected codes over the last `window_minutes` (current one included)."""
+        window_minutes = max(1, min(window_minutes, self.window_minutes))
+        ranking = self._rankings.get((window_minutes, limit))
+        if ranking is not None:
+            return ranking
+        newest = self._minute()
+        minutes = range(newest - window_minutes + 1, newest + 1)
+        client = self._redis()
+        if client is None:
+            with self._lock:
+                total = Counter()
+                for minute in minutes:
+                    total.update(self._minutes.get(minute, {}))
+            ranking = total.most_common(limit)
+        else:
+            union = f"{self.KEY_PREFIX}window:{window_minutes}"
+            try:
+                with client.pipeline(transaction=True) as pipe:
+                    pipe.zunionstore(union, [f"{self.KEY_PREFIX}{minute}" for minute in minutes])
+                    pipe.zrevrange(union, 0, limit - 1, withscores=True)
+                    pipe.delete(union)
+                    _, top, _ = pipe.execute()
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+                logger.warning("Could not read hot link rankings", exc_info=True)
+                return []
+            ranking = [(short_code, int(score)) for short_code, score in top]
+        self._rankings.set((window_minutes, limit), ranking)
+        return ranking
+
+    def refresh_pins(self, limit: int, window_minutes: int) -> int:
+        """Pins the current top `limit` links in the link cache, freshly read. Returns how many were pinned."""
+        codes = [short_code for short_code, _ in self.trending(window_minutes, limit)]
+        loaded_at = time.monotonic()
+        db = database.new_read_session()
+        try:
+            links = crud.get_link_snapshots(db, codes)
+        finally:
+            db.close()
+        cache.link_cache.pin(links, loaded_at)
+        self._stats["pin_refreshes"] += 1
+        return len(links)
+
+    def _run(self) -> None:
+        next_pin = 0.0
+        while not self._stop.wait(settings.HOT_LINKS_FLUSH_SECONDS):
+            try:
+                self.flush()
+                if time.monotonic() >= next_pin:
+                    self.refresh_pins(settings.HOT_LINKS_PINNED, settings.HOT_LINKS_PIN_WINDOW_MINUTES)
+                    next_pin = time.monotonic() + settings.HOT_LINKS_PIN_REFRESH_SECONDS
+            except Exception:
+                logger.exception("Hot link tracking failed")
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hot-links", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+            self.flush()
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": self.enabled, "tracked": len(self._sketch), "capacity": self.capacity}
+
+
+hot_links = HotLinks(
+    capacity=settings.HOT_LINKS_CAPACITY,
+    window_minutes=settings.HOT_LINKS_WINDOW_MINUTES,
+    enabled=settings.HOT_LINKS_ENABLED,
+)
@@ -0,0 +1,618 @@
+"""
+Batched click ingestion.
+
+The redirect path hands click events to an in-process buffer, which a
+background thread publishes to the Redis queue in batches, so a slow or
+unavailable Redis never holds up a redirect. A full buffer drops, samples or
+spills to a local file, as CLICK_PUBLISH_OVERFLOW says. A consumer drains the
+queue in batches of up to CLICK_BATCH_MAX_SIZE events (or whatever arrived
+within CLICK_BATCH_MAX_DELAY_MS) and stores each batch in a single transaction.
+
+Delivery is at-least-once: claimed events sit in a per-process processing list
+until their batch is committed. Each consumer holds a lease on its list; once a
+consumer dies and its lease lapses (CLICK_INGEST_LEASE_SECONDS), the next
+consumer to look for lapsed leases puts its events back on the queue. A batch
+that keeps failing for reasons other than the database being unreachable is
+bisected after CLICK_FLUSH_MAX_ATTEMPTS tries, and events that still fail on
+their own go to a dead-letter list. Run a consumer with `python -m app.ingest`.
+"""
+
+import itertools
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+
+import redis
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from . import crud, database, enrichment
+from .config import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# --- Queue Backends ---
+
+_CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+class RedisClickQueue:
+    """
+    Reliable queue on a Redis list; claimed events move atomically to a processing list.
+
+    Each consumer process has its own processing list and holds a lease on it, renewed
+    by a heartbeat thread while it consumes. Recovery only takes over the lists of
+    consumers whose lease has lapsed, so a live peer's in-flight batch is never requeued.
+    """
+
+    PENDING_KEY = "linkloom:clicks:pending"
+    DEAD_LETTER_KEY = "linkloom:clicks:dead"
+    PROCESSING_PREFIX = "linkloom:clicks:processing:"
+    LEASE_PREFIX = "linkloom:clicks:lease:"
+    # Every consumer that may have left a processing list behind.
+    CONSUMERS_KEY = "linkloom:clicks:consumers"
+
+    def __init__(self, client: redis.Redis, consumer: str, lease_seconds: int = 30):
+        self.client = client
+        self.consumer = consumer
+        self.processing_key = self.PROCESSING_PREFIX + consumer
+        self.lease_key = self.LEASE_PREFIX + consumer
+        self.lease_seconds = lease_seconds
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+        self._heartbeat: threading.Thread | None = None
+        self._stop_heartbeat = threading.Event()
+
+    def push(self, event: dict) -> None:
+        self.client.rpush(self.PENDING_KEY, json.dumps(event))
+
+    def push_many(self, events: list[dict]) -> None:
+        # One variadic RPUSH: a single round-trip, and the batch lands on the list atomically.
+        self.client.rpush(self.PENDING_KEY, *(json.dumps(event) for event in events))
+
+    def claim(self, max_items: int, timeout: float) -> list[dict]:
+        items = self._claim(keys=[self.PENDING_KEY, self.processing_key], args=[max_items])
+        if not items and timeout > 0:
+            item = self.client.blmove(self.PENDING_KEY, self.processing_key, timeout, "LEFT", "RIGHT")
+            items = [item] if item is not None else []
+        return [json.loads(item) for item in items]
+
+    def ack(self) -> None:
+        self.client.delete(self.processing_key)
+
+    def dead_letter(self, events: list[dict]) -> None:
+        self.client.rpush(self.DEAD_LETTER_KEY, *(json.dumps(event) for event in events))
+
+    def _renew_lease(self) -> None:
+        # One transaction, so a peer never sees this consumer registered without a lease.
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self.lease_key, self.consumer, ex=self.lease_seconds)
+            pipe.sadd(self.CONSUMERS_KEY, self.consumer)
+            pipe.execute()
+
+    def _beat(self) -> None:
+        while not self._stop_heartbeat.wait(self.lease_seconds / 3):
+            try:
+                self._renew_lease()
+            except redis.RedisError:
+                logger.warning("Could not renew the lease of click consumer %s", self.consumer, exc_info=True)
+
+    def _requeue(self, processing_key: str) -> None:
+        while self.client.lmove(processing_key, self.PENDING_KEY, "RIGHT", "LEFT") is not None:
+            pass
+
+    def recover(self) -> None:
+        """
+        Takes the lease on this consumer's processing list, then puts events left unacked
+        in it, and in the lists of consumers whose lease has lapsed, back at the head of the queue.
+        """
+        if self._heartbeat is None:
+            self._renew_lease()
+            self._stop_heartbeat.clear()
+            self._heartbeat = threading.Thread(target=self._beat, name="click-consumer-lease", daemon=True)
+            self._heartbeat.start()
+        self._requeue(self.processing_key)
+        for consumer in self.client.smembers(self.CONSUMERS_KEY):
+            if consumer == self.consumer:
+                continue
+            # Taking over the lapsed lease makes this the only consumer recovering that list.
+            lease_key = self.LEASE_PREFIX + consumer
+            if not self.client.set(lease_key, f"recovering:{self.consumer}", ex=self.lease_seconds, nx=True):
+                continue
+            self._requeue(self.PROCESSING_PREFIX + consumer)
+            logger.info("Recovered the processing list of click consumer %s", consumer)
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.srem(self.CONSUMERS_KEY, consumer)
+                pipe.delete(lease_key)
+                pipe.execute()
+
+    def close(self) -> None:
+        """Stops renewing the lease and gives it up, so events still unacked are recovered without waiting."""
+        if self._heartbeat is None:
+            return
+        self._stop_heartbeat.set()
+        self._heartbeat.join(timeout=10)
+        self._heartbeat = None
+        try:
+            # A list with events left in it stays registered for a peer (or the next start) to recover.
+            drained = not self.client.llen(self.processing_key)
+            with self.client.pipeline(transaction=True) as pipe:
+                if drained:
+                    pipe.srem(self.CONSUMERS_KEY, self.consumer)
+                pipe.delete(self.lease_key)
+                pipe.execute()
+        except redis.RedisError:
+            # The lease lapses on its own.
+            logger.warning("Could not release the lease of click consumer %s", self.consumer, exc_info=True)
+
+
+class MemoryClickQueue:
+    """In-process queue with the same claim/ack semantics, for single-process runs and tests."""
+
+    def __init__(self):
+        self._pending: deque[dict] = deque()
+        self._processing: list[dict] = []
+        self.dead: list[dict] = []
+        self._cond = threading.Condition()
+
+    def push(self, event: dict) -> None:
+        with self._cond:
+            self._pending.append(event)
+            self._cond.notify()
+
+    def claim(self, max_items: int, timeout: float) -> list[dict]:
+        with self._cond:
+            if not self._pending and timeout > 0:
+                self._cond.wait(timeout)
+            items = [self._pending.popleft() for _ in range(min(max_items, len(self._pending)))]
+            self._processing.extend(items)
+            return items
+
+    def ack(self) -> None:
+        with self._cond:
+            self._processing.clear()
+
+    def dead_letter(self, events: list[dict]) -> None:
+        with self._cond:
+            self.dead.extend(events)
+
+    def recover(self) -> None:
+        with self._cond:
+            self._pending.extendleft(reversed(self._processing))
+            self._processing.clear()
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+# --- Batching Consumer ---
+
+class ClickBatcher:
+    """Drains a click queue, flushing every `max_batch_size` events or `max_delay_ms` milliseconds."""
+
+    # How long an idle consumer waits for the first event before re-checking for shutdown.
+    IDLE_WAIT_SECONDS = 1.0
+    # How often a running consumer looks for dead consumers' events to requeue.
+    RECOVER_INTERVAL_SECONDS = 30.0
+    RETRY_BACKOFF_SECONDS = (0.5, 1, 2, 5, 10)
+
+    def __init__(
+        self,
+        queue,
+        flush: Callable[[list[dict]], None],
+        max_batch_size: int,
+        max_delay_ms: int,
+        max_attempts: int = 5,
+        retryable: tuple[type[Exception], ...] = (),
+    ):
+        self.queue = queue
+        self.flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.max_attempts = max_attempts
+        self.retryable = retryable
+        self.stats = {"batches": 0, "events": 0, "flush_failures": 0, "dead_lettered": 0}
+
+    def run_once(self, stop: threading.Event | None = None) -> int:
+        """Collects and flushes one batch; returns the number of events flushed."""
+        batch = self.queue.claim(self.max_batch_size, self.IDLE_WAIT_SECONDS)
+        if not batch:
+            return 0
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            batch.extend(self.queue.claim(self.max_batch_size - len(batch), remaining))
+        self._flush_until_stored(batch, stop)
+        return len(batch)
+
+    def _flush_until_stored(self, batch: list[dict], stop: threading.Event | None) -> None:
+        stored = self._try_flush(batch, stop, self.max_attempts)
+        if stored is False:
+            stored = self._isolate(batch, stop)
+        if stored is None:
+            # Shutting down: unacked events stay in the processing list and are recovered on restart.
+            return
+        self.queue.ack()
+
+    def _try_flush(self, batch: list[dict], stop: threading.Event | None, attempts: int) -> bool | None:
+        """
+        Flushes `batch`, retrying with backoff. Returns True once stored, False after
+        `attempts` non-retryable failures, None if asked to stop first. Retryable
+        errors (the database being unreachable) never use up attempts.
+        """
+        failures = 0
+        for attempt in itertools.count():
+            try:
+                self.flush(batch)
+            except Exception as exc:
+                self.stats["flush_failures"] += 1
+                logger.exception("Click batch flush failed (%d events)", len(batch))
+                if not isinstance(exc, self.retryable):
+                    failures += 1
+                    if failures >= attempts:
+                        return False
+                if stop is not None and stop.is_set():
+                    return None
+                backoff = self.RETRY_BACKOFF_SECONDS
+                time.sleep(backoff[min(attempt, len(backoff) - 1)])
+                continue
+            self.stats["batches"] += 1
+            self.stats["events"] += len(batch)
+            return True
+
+    def _isolate(self, batch: list[dict], stop: threading.Event | None) -> bool | None:
+        """Bisects a batch that keeps failing; single events that still fail go to the dead-letter list."""
+        if len(batch) == 1:
+            self.queue.dead_letter(batch)
+            self.stats["dead_lettered"] += 1
+            logger.error("Click event moved to the dead-letter list: %r", batch[0])
+            return True
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            stored = self._try_flush(half, stop, 1)
+            if stored is False:
+                stored = self._isolate(half, stop)
+            if stored is None:
+                return None
+        return True
+
+    def run(self, stop: threading.Event) -> None:
+        try:
+            next_recovery = 0.0
+            while not stop.is_set():
+                # Between batches this consumer's own processing list is empty, so only other lists are requeued.
+                if time.monotonic() >= next_recovery:
+                    self.queue.recover()
+                    next_recovery = time.monotonic() + self.RECOVER_INTERVAL_SECONDS
+                self.run_once(stop)
+        finally:
+            self.queue.close()
+
+    def drain(self) -> None:
+        """Flushes everything currently queued without waiting for more events."""
+        self.queue.recover()
+        try:
+            while batch := self.queue.claim(self.max_batch_size, 0):
+                self._flush_until_stored(batch, None)
+        finally:
+            self.queue.close()
+
+
+def flush_clicks(events: list[dict]) -> None:
+    if settings.CLICK_ENRICHMENT_ENABLED:
+        events = enrichment.get_enricher().enrich(events)
+    db = database.new_session()
+    try:
+        crud.create_db_clicks_bulk(db, events)
+    finally:
+        db.close()
+
+
+# --- Producer Side ---
+
+class ClickPublisher:
+    """
+    Bounded buffer between the redirect path and the click queue. `offer` never
+    blocks on the network; a background thread publishes the buffer in batches of
+    `batch_size`, or every `interval_ms` when traffic is light. Batches that fail
+    to publish go back to the front of the buffer and are retried.
+
+    Once the buffer is full, `overflow` decides what happens to new events:
+    "drop" discards them, "sample" starts admitting only `sample_rate` of them
+    as soon as the buffer is half full (and drops once it is full), "spill"
+    appends them to `spill_path`, which is published once the buffer has emptied.
+    A crash mid-replay leaves the events being replayed in `<spill_path>.<pid>.replay`.
+    """
+
+    OVERFLOW_POLICIES = ("drop", "sample", "spill")
+    RETRY_BACKOFF_SECONDS = 1.0
+
+    def __init__(
+        self,
+        publish: Callable[[list[dict]], None],
+        max_size: int,
+        batch_size: int,
+        interval_ms: int,
+        overflow: str = "drop",
+        sample_rate: float = 0.1,
+        spill_path: str = "",
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown click overflow policy {overflow!r}, expected one of {self.OVERFLOW_POLICIES}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill path")
+        self.publish = publish
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+        self.spill_path = spill_path
+        self._buffer: deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {
+            "enqueued": 0,
+            "published": 0,
+            "dropped": 0,
+            "sampled_out": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "publish_failures": 0,
+        }
+
+    def offer(self, event: dict) -> bool:
+        """Buffers `event` without blocking; returns False if the overflow policy discarded it."""
+        with self._cond:
+            size = len(self._buffer)
+            if self.overflow == "sample" and size >= self.max_size // 2 and random.random() >= self.sample_rate:
+                self.stats["sampled_out"] += 1
+                return False
+            if size < self.max_size:
+                self._buffer.append(event)
+                self.stats["enqueued"] += 1
+                if size + 1 >= self.batch_size:
+                    self._cond.notify()
+                return True
+        if self.overflow == "spill":
+            self._spill([event])
+            return True
+        self.stats["dropped"] += 1
+        return False
+
+    def _spill(self, events: list[dict]) -> None:
+        with self._spill_lock:
+            with open(self.spill_path, "a") as f:
+                f.writelines(json.dumps(event) + "\n" for event in events)
+            self.stats["spilled"] += len(events)
+
+    def _requeue(self, batch: list[dict]) -> None:
+        """Puts a batch that failed to publish back in front, as far as there is room."""
+        with self._cond:
+            room = max(0, self.max_size - len(self._buffer))
+            self._buffer.extendleft(reversed(batch[:room]))
+            overflow = batch[room:]
+        if overflow:
+            self._discard(overflow)
+
+    def _discard(self, events: list[dict]) -> None:
+        if self.overflow == "spill":
+            self._spill(events)
+        else:
+            self.stats["dropped"] += len(events)
+            logger.warning("Dropped %d click events that could not be published", len(events))
+
+    def _try_publish(self, batch: list[dict]) -> bool:
+        try:
+            self.publish(batch)
+        except Exception:
+            self.stats["publish_failures"] += 1
+            logger.warning("Could not publish %d click events", len(batch), exc_info=True)
+            return False
+        self.stats["published"] += len(batch)
+        return True
+
+    def _replay_spill(self) -> bool:
+        """Publishes the spill file; returns False if Redis refused part of it, which is spilled again."""
+        replaying = f"{self.spill_path}.{os.getpid()}.replay"
+        if not os.path.exists(replaying):
+            try:
+                # New spills start a fresh file while this one is replayed.
+                os.replace(self.spill_path, replaying)
+            except FileNotFoundError:
+                return True
+        events = []
+        with open(replaying) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping a malformed line in %s", replaying)
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            if not self._try_publish(batch):
+                self._spill(events[start:])
+                os.remove(replaying)
+                return False
+            self.stats["replayed"] += len(batch)
+        os.remove(replaying)
+        return True
+
+    def run(self) -> None:
+        while True:
+            with self._cond:
+                if len(self._buffer) < self.batch_size and not self._stop.is_set():
+                    self._cond.wait(self.interval)
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                stopping = self._stop.is_set()
+            if batch:
+                if self._try_publish(batch):
+                    continue
+                if stopping:
+                    self._discard(batch + self._take_all())
+                    return
+                self._requeue(batch)
+                self._stop.wait(self.RETRY_BACKOFF_SECONDS)
+            elif stopping:
+                return
+            elif self.overflow == "spill" and os.path.exists(self.spill_path) and not self._replay_spill():
+                self._stop.wait(self.RETRY_BACKOFF_SECONDS)
+
+    def _take_all(self) -> list[dict]:
+        with self._cond:
+            events = list(self._buffer)
+            self._buffer.clear()
+            return events
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="click-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Publishes what is buffered; whatever still fails is spilled or dropped."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stop.set()
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "buffered": len(self._buffer), "buffer_size": self.max_size, "overflow": self.overflow}
+
+
+_queue = None
+_publisher: ClickPublisher | None = None
+_publisher_lock = threading.Lock()
+_embedded: threading.Thread | None = None
+_embedded_batcher: ClickBatcher | None = None
+_embedded_stop = threading.Event()
+
+def get_queue():
+    """Returns this process's click queue: Redis-backed when available, in-memory otherwise."""
+    global _queue
+    if _queue is None:
+        client = get_redis()
+        if client is not None:
+            # Unique per process: consumers sharing a host (several `ingest` processes, or embedded
+            # consumers under several web workers) must not share a processing list.
+            consumer = f"{settings.CLICK_INGEST_CONSUMER or socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            _queue = RedisClickQueue(client, consumer, lease_seconds=settings.CLICK_INGEST_LEASE_SECONDS)
+        else:
+            _queue = MemoryClickQueue()
+    return _queue
+
+def make_click_event(short_code: str, ip_address: str | None, user_agent: str | None, referrer: str | None) -> dict:
+    return {
+        "short_code": short_code,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "referrer": referrer,
+        # Stamped at redirect time, the row is written later.
+        "clicked_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+def get_publisher() -> ClickPublisher | None:
+    """Returns the running publisher in front of the Redis queue, or None with the in-memory queue."""
+    global _publisher
+    queue = get_queue()
+    if not isinstance(queue, RedisClickQueue):
+        return None
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ClickPublisher(
+                queue.push_many,
+                max_size=settings.CLICK_PUBLISH_BUFFER_SIZE,
+                batch_size=settings.CLICK_PUBLISH_BATCH_SIZE,
+                interval_ms=settings.CLICK_PUBLISH_INTERVAL_MS,
+                overflow=settings.CLICK_PUBLISH_OVERFLOW,
+                sample_rate=settings.CLICK_PUBLISH_SAMPLE_RATE,
+                spill_path=settings.CLICK_PUBLISH_SPILL_PATH,
+            )
+            _publisher.start()
+        return _publisher
+
+def stop_publisher() -> None:
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.stop()
+            _publisher = None
+
+def publisher_stats() -> dict | None:
+    return _publisher.snapshot() if _publisher is not None else None
+
+def enqueue_click(short_code: str, ip_address: str | None, user_agent: str | None, referrer: str | None) -> None:
+    """Never blocks on Redis: events go through the publisher's buffer (or straight into the in-memory queue)."""
+    event = make_click_event(short_code, ip_address, user_agent, referrer)
+    publisher = get_publisher()
+    if publisher is None:
+        get_queue().push(event)
+    else:
+        publisher.offer(event)
+
+def make_batcher(queue=None) -> ClickBatcher:
+    return ClickBatcher(
+        queue if queue is not None else get_queue(),
+        flush_clicks,
+        max_batch_size=settings.CLICK_BATCH_MAX_SIZE,
+        max_delay_ms=settings.CLICK_BATCH_MAX_DELAY_MS,
+        max_attempts=settings.CLICK_FLUSH_MAX_ATTEMPTS,
+        # Connection-level errors mean the database is away, not that the batch is bad.
+        retryable=(OperationalError, InterfaceError),
+    )
+
+def start_embedded_consumer() -> None:
+    """Runs the consumer inside this process, used when there is no Redis-backed consumer."""
+    global _embedded, _embedded_batcher
+    if _embedded is not None:
+        return
+    _embedded_stop.clear()
+    _embedded_batcher = make_batcher()
+    _embedded = threading.Thread(target=_embedded_batcher.run, args=(_embedded_stop,), name="click-ingest", daemon=True)
+    _embedded.start()
+
+def stop_embedded_consumer() -> None:
+    global _embedded, _embedded_batcher
+    if _embedded is not None:
+        _embedded_stop.set()
+        _embedded.join(timeout=10)
+        # An in-memory queue does not outlive the process, so store what is left now.
+        _embedded_batcher.drain()
+        _embedded = _embedded_batcher = None
+
+def embedded_consumer_enabled() -> bool:
+    return settings.CLICK_INGEST_EMBEDDED or not settings.REDIS_ENABLED
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    make_batcher().run(stop)
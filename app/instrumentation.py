@@ -0,0 +1,186 @@
+"""
+Per-request timing: SQL statement count and time (from engine events), response
+serialization time and total time, keyed by route template.
+
+RequestTimingMiddleware opens a RequestTimings for each HTTP request in a
+context variable; Starlette's threadpool copies the context, so sync handlers,
+dependencies and streaming iterators all add to the same object. The totals
+are sent back in a `Server-Timing` header and accumulated into Prometheus-style
+metrics served at /internal/metrics (behind the internal token).
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import fastapi.routing
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RequestTimings:
+    queries: int = 0
+    db_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+# --- SQL Statements ---
+
+def instrument_engine(engine: Engine) -> None:
+    """Counts and times every statement `engine` executes, and logs those slower than SLOW_QUERY_MS."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.db_seconds += elapsed
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        metrics.record_slow_query()
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+
+# --- Response Serialization ---
+
+_serialize_response = fastapi.routing.serialize_response
+
+async def _timed_serialize_response(*args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return await _serialize_response(*args, **kwargs)
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.serialize_seconds += time.perf_counter() - started
+
+def instrument_serialization() -> None:
+    """Times response_model validation and encoding, including any lazy loads it triggers."""
+    # FastAPI has no hook around it; the request handler looks the function up on its module.
+    fastapi.routing.serialize_response = _timed_serialize_response
+
+
+# --- Metrics ---
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestMetrics:
+    """Thread-safe per-route counters, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: dict[tuple[str, str, int], dict] = {}
+        self.slow_queries = 0
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        with self._lock:
+            entry = self._routes.get((method, route, status))
+            if entry is None:
+                entry = self._routes[(method, route, status)] = {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "buckets": [0] * len(DURATION_BUCKETS),
+                    "queries": 0,
+                    "db_seconds": 0.0,
+                    "serialize_seconds": 0.0,
+                }
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+            entry["queries"] += timings.queries
+            entry["db_seconds"] += timings.db_seconds
+            entry["serialize_seconds"] += timings.serialize_seconds
+
+    def record_slow_query(self) -> None:
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE linkloom_http_request_duration_seconds histogram",
+            "# TYPE linkloom_http_db_queries_total counter",
+            "# TYPE linkloom_http_db_seconds_total counter",
+            "# TYPE linkloom_http_serialize_seconds_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), entry in sorted(self._routes.items()):
+                labels = f'method="{method}",route="{route}",status="{status}"'
+                for bound, count in zip(DURATION_BUCKETS, entry["buckets"]):
+                    lines.append(f'linkloom_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'linkloom_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+                lines.append(f"linkloom_http_request_duration_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+                lines.append(f"linkloom_http_request_duration_seconds_count{{{labels}}} {entry['count']}")
+                lines.append(f"linkloom_http_db_queries_total{{{labels}}} {entry['queries']}")
+                lines.append(f"linkloom_http_db_seconds_total{{{labels}}} {entry['db_seconds']:.6f}")
+                lines.append(f"linkloom_http_serialize_seconds_total{{{labels}}} {entry['serialize_seconds']:.6f}")
+            lines.append("# TYPE linkloom_db_slow_queries_total counter")
+            lines.append(f"linkloom_db_slow_queries_total {self.slow_queries}")
+        return "\n".join(lines) + "\n"
+
+metrics = RequestMetrics()
+
+
+# --- Middleware ---
+
+def server_timing(timings: RequestTimings, total_seconds: float) -> str:
+    return (
+        f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.queries} queries", '
+        f"serialize;dur={timings.serialize_seconds * 1000:.2f}, "
+        f"total;dur={total_seconds * 1000:.2f}"
+    )
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware, so streaming responses pass through untouched."""
+
+    def __init__(self, app, server_timing_header: bool = True):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    header = server_timing(timings, time.perf_counter() - started)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            metrics.observe(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - started,
+                timings,
+            )
@@ -1,18 +1,57 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, status, Request, status 
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from typing import Annotated
+import csv
+import io
+import json
+import secrets
+import tempfile
+from typing import Annotated, AsyncIterator, Iterator, Literal
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
 # Import all our application modules
-from . import database, models, schemas, crud, utils, security
-from .worker import log_click_task
-
-models.Base.metadata.create_all(bind=database.engine)
-
-app = FastAPI()
+from . import database, schemas, crud, utils, security, cache, pubsub, ingest, allocator, auth_cache, bootstrap, conditional, enrichment, hot_links, instrumentation, negative_cache, ratelimit, fastpath, warmup
+from .config import settings
+
+# Importing this module has no side effects: the schema is managed by `python -m app.bootstrap`
+# and the engines connect on first use.
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    if settings.BOOTSTRAP_ON_STARTUP:
+        await run_in_threadpool(bootstrap.bootstrap)
+    # Receive link invalidations published by the other workers.
+    pubsub.start_listener()
+    app.state.warm_up = None
+    if settings.WARMUP_LINKS:
+        app.state.warm_up = await run_in_threadpool(warmup.warm_up, settings.WARMUP_LINKS, settings.WARMUP_WINDOW_HOURS)
+    negative_cache.link_filter.start()
+    hot_links.hot_links.start()
+    if ingest.embedded_consumer_enabled():
+        ingest.start_embedded_consumer()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    ingest.stop_publisher()
+    ingest.stop_embedded_consumer()
+    hot_links.hot_links.stop()
+    negative_cache.link_filter.stop()
+    pubsub.stop_listener()
+
+app = FastAPI(lifespan=lifespan)
+
+# Innermost middleware, so CORS and request timing still apply to the redirects it answers.
+if settings.REDIRECT_FAST_PATH:
+    app.add_middleware(fastpath.RedirectFastPath, router=app.router, use_async_db=settings.ASYNC_DB_ENABLED)
 
 # This allows our frontend to communicate with our backend.
 origins = [
@@ -31,18 +70,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors for /api/me/links travel in response headers, validators for polling in ETag.
+    expose_headers=["X-Next-Cursor", "Link", "ETag"],
 )
 
+if settings.INSTRUMENTATION_ENABLED:
+    instrumentation.instrument_serialization()
+    app.add_middleware(instrumentation.RequestTimingMiddleware, server_timing_header=settings.SERVER_TIMING_HEADER)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# Opt-in async stack: these routes are matched before their sync twins further down.
+if settings.ASYNC_DB_ENABLED:
+    from . import async_api
+    app.include_router(async_api.router)
+
 def get_db():
-    db = database.SessionLocal()
+    db = database.new_session()
     try:
         yield db
     finally:
         db.close()
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
+def get_read_db():
+    # Same as get_db, but served by the read replica when DATABASE_REPLICA_URL is set.
+    db = database.new_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
     
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,38 +108,71 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = security.jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
-        email: str = payload.get("sub")
+        claims = auth_cache.verify_token(token)
+        email: str = claims.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
     except security.JWTError:
         raise credentials_exception
     
-    user = crud.get_user_by_email(db, email=token_data.email)
+    # A cached snapshot on hit; a primary-key lookup on miss (email lookup for older tokens).
+    user = auth_cache.get_user(
+        claims, lambda: crud.get_user_snapshot(db, user_id=claims.get("uid"), email=email)
+    )
     if user is None:
         raise credentials_exception
     return user
 
+# --- Rate Limiting ---
+
+def limit_shorten(request: Request, current_user: schemas.User = Depends(get_current_user)):
+    retry_after = ratelimit.limiter.hit("shorten", ip=request.client.host, user=current_user.id)
+    if retry_after is not None:
+        raise ratelimit.too_many_requests(retry_after)
+
+def limit_redirect(short_code: str, request: Request):
+    retry_after = ratelimit.limiter.hit("redirect", ip=request.client.host, short_code=short_code)
+    if retry_after is not None:
+        raise ratelimit.too_many_requests(retry_after)
+
 # --- Authentication Endpoints ---
 
+PASSWORD_HASHER_BUSY = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many sign-ins in progress, try again shortly.",
+    headers={"Retry-After": "1"},
+)
+
 @app.post("/auth/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await security.password_hasher.hash(user.password)
+    except security.PasswordHasherBusy:
+        raise PASSWORD_HASHER_BUSY
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/auth/token", response_model=schemas.Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username) # The form uses 'username' for email
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    # bcrypt and the queries run off the event loop, so a burst of logins doesn't stall redirects.
+    user = await run_in_threadpool(crud.get_user_by_email, db, email=form_data.username) # The form uses 'username' for email
+    try:
+        verified, new_hash = await security.password_hasher.verify(
+            form_data.password, user.hashed_password if user else None
+        )
+    except security.PasswordHasherBusy:
+        raise PASSWORD_HASHER_BUSY
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = security.create_access_token(data={"sub": user.email})
+    if new_hash:
+        await run_in_threadpool(crud.update_user_password_hash, db, user, new_hash)
+    access_token = security.create_access_token(data={"sub": user.email, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -90,21 +181,50 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
 @app.get("/api/me/links", response_model=list[schemas.URLInfo])
 def read_user_links(
     request: Request, # <-- ADD THE REQUEST DEPENDENCY
+    response: Response,
+    limit: int = Query(default=settings.LINKS_PAGE_SIZE, ge=1, le=settings.LINKS_PAGE_SIZE_MAX),
+    cursor: str | None = None,
+    is_active: bool | None = None,
     current_user: schemas.User = Depends(get_current_user),
+    # The primary, not the replica: a lagging replica could pair the new ETag with the old page,
+    # and every later If-None-Match would keep that page until the owner's next change.
     db: Session = Depends(get_db)
 ):
+    """
+    Returns one page of the user's links, newest first. When there are more,
+    the `X-Next-Cursor` header (and a `Link: rel="next"` header) points at the
+    next page; pass it back as `cursor`. Send the `ETag` back in `If-None-Match`
+    to get a 304 while none of the user's links changed.
+    """
+    after = None
+    if cursor:
+        try:
+            after = utils.decode_links_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Read before the page, from the database the token is bumped after: a change committed in
+    # between makes the ETag older than the body, never newer.
+    etag = conditional.listing_etag(current_user.id, request)
+    headers = conditional.validator_headers(etag, None, conditional.LISTING_CACHE_CONTROL)
+    if conditional.is_not_modified(request, etag):
+        return conditional.not_modified(headers)
+    response.headers.update(headers)
+    
+    # Fetch one row more than asked for to know whether there is a next page.
+    rows = crud.get_user_links(db=db, owner_id=current_user.id, limit=limit + 1, after=after, is_active=is_active)
     
-    # Get the list of URL objects from the database
-    db_links = crud.get_user_links(db=db, owner_id=current_user.id)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = utils.encode_cursor({"id": last.id, "created_at": last.created_at})
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     
     # Get the base URL (e.g., "http://localhost:8000/")
     base_url = str(request.base_url)
     
-    # Manually add the 'short_url' attribute to each link object
-    for link in db_links:
-        link.short_url = f"{base_url}{link.short_code}"
-        
-    return db_links
+    return [{**row._mapping, "short_url": f"{base_url}{row.short_code}"} for row in rows]
 
 
 # ADD THIS NEW ENDPOINT 
@@ -112,7 +232,7 @@ def read_user_links(
 def read_user_recent_links(
     request: Request,
     current_user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     
     db_links = crud.get_user_recent_links(db=db, owner_id=current_user.id)
@@ -125,6 +245,22 @@ def read_user_recent_links(
 # END OF NEW ENDPOINT 
 
 
+@app.get("/api/me/summary", response_model=schemas.DashboardSummary)
+def read_user_summary(
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Dashboard figures for the user's links, read from aggregates kept current by
+    every write, so the cost is the same for ten links or a million.
+    """
+    summary = crud.get_owner_summary(db, current_user.id, datetime.now(timezone.utc), top=settings.SUMMARY_TOP_LINKS)
+    base_url = str(request.base_url)
+    summary["top_links"] = [{**link, "short_url": f"{base_url}{link['short_code']}"} for link in summary["top_links"]]
+    return summary
+
+
 # vvv ADD THIS NEW ENDPOINT vvv
 @app.patch("/api/links/{short_code}", response_model=schemas.URLInfo)
 def toggle_link_status(
@@ -171,9 +307,100 @@ def delete_link(
 #  END OF NEW ENDPOINT 
 
 
+@app.put("/api/links/{short_code}/redirect-policy", response_model=schemas.URLInfo)
+def set_redirect_policy(
+    short_code: str,
+    policy: schemas.RedirectPolicy,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """
+    Sets the link's redirect status (301/302/307/308) and how long browsers may
+    cache the redirect. Null fields fall back to REDIRECT_STATUS and
+    REDIRECT_CACHE_MAX_AGE; max-age is capped by REDIRECT_CACHE_MAX_AGE_LIMIT,
+    which bounds how long a browser can keep following a deactivated link.
+    """
+    db_url = crud.update_db_url_redirect_policy(db, short_code=short_code, owner_id=current_user.id, policy=policy)
+
+    if not db_url:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Link not found or you do not have permission to modify it.",
+        )
+
+    db_url.short_url = f"{request.base_url}{db_url.short_code}"
+    return db_url
+
+
+# --- Click Export ---
+
+CLICK_EXPORT_FIELDS = [
+    "id", "short_code", "clicked_at", "ip_address", "user_agent", "referrer", "browser", "os", "device", "country", "cursor"
+]
+
+def _click_export_chunks(rows, export_format: str) -> Iterator[bytes]:
+    """Serializes export rows, one write per CLICK_EXPORT_BATCH_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CLICK_EXPORT_FIELDS) if export_format == "csv" else None
+    if writer:
+        writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        record = {**row._mapping, "cursor": utils.encode_cursor({"id": row.id})}
+        record["clicked_at"] = row.clicked_at.isoformat() if row.clicked_at else None
+        if writer:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record) + "\n")
+        if count % settings.CLICK_EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+@app.get("/api/me/clicks/export")
+def export_clicks(
+    export_format: Literal["csv", "ndjson"] = Query(default="ndjson", alias="format"),
+    short_code: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cursor: str | None = None,
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Streams the raw click history of your links (or of one `short_code`) as CSV
+    or NDJSON, oldest first, optionally limited to [start, end). Every row has a
+    `cursor`; pass the last one received back as `cursor` to resume after it.
+    """
+    after_id = None
+    if cursor:
+        try:
+            after_id = int(utils.decode_cursor(cursor)["id"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows = crud.iter_owner_clicks(
+        db,
+        owner_id=current_user.id,
+        short_code=short_code,
+        start=start.astimezone(timezone.utc) if start and start.tzinfo else start,
+        end=end.astimezone(timezone.utc) if end and end.tzinfo else end,
+        after_id=after_id,
+        batch_size=settings.CLICK_EXPORT_BATCH_SIZE,
+    )
+    # A sync iterator: Starlette pulls it from the threadpool, so the cursor reads never block the event loop.
+    return StreamingResponse(
+        _click_export_chunks(rows, export_format),
+        media_type="text/csv" if export_format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="clicks.{export_format}"'},
+    )
+
+
 # --- Protected URL Shortening Endpoint ---
 
-@app.post("/api/shorten", response_model=schemas.URLInfo)
+@app.post("/api/shorten", response_model=schemas.URLInfo, dependencies=[Depends(limit_shorten)])
 def create_short_url(
     url: schemas.URLCreate,
     request: Request,
@@ -182,21 +409,158 @@ def create_short_url(
 ):
     
     try:
-        short_code = utils.create_unique_short_code(db)
-        db_url = crud.create_db_url(db, url, short_code, owner_id=current_user.id)
+        url_hash = utils.url_hash(str(url.original_url)) if settings.SHORTEN_DEDUP_PER_OWNER else None
+        db_url = crud.get_owner_link_by_url_hash(db, current_user.id, url_hash) if url_hash else None
+
+        # The allocator never queries for uniqueness; the unique index catches the rare
+        # clash with a code it didn't know about, and we simply take the next one.
+        for _ in range(3):
+            if db_url is not None:
+                break
+            short_code = utils.create_unique_short_code()
+            try:
+                db_url = crud.create_db_url(db, url, short_code, owner_id=current_user.id, url_hash=url_hash)
+            except IntegrityError:
+                db.rollback()
+                # Either a concurrent request just stored the same URL, or the code was taken.
+                db_url = crud.get_owner_link_by_url_hash(db, current_user.id, url_hash) if url_hash else None
+                if db_url is None:
+                    allocator.get_allocator().note_taken(short_code)
+        if db_url is None:
+            raise RuntimeError("Short code collisions on every attempt")
         
         base_url = str(request.base_url)
-        db_url.short_url = f"{base_url}{short_code}"
+        db_url.short_url = f"{base_url}{db_url.short_code}"
         
         return db_url
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not create a unique short code.")
 
+def _ndjson(value: dict) -> bytes:
+    return json.dumps(value).encode() + b"\n"
+
+def _store_shorten_chunk(db: Session, chunk: list[tuple[int, str]], owner_id: int, base_url: str) -> list[bytes]:
+    """
+    Allocates codes for a chunk of (index, url) pairs and inserts them in one transaction.
+    With SHORTEN_DEDUP_PER_OWNER, URLs the owner already has (or that repeat within the
+    chunk) reuse that link's code instead.
+    """
+    hashes = {index: utils.url_hash(url) for index, url in chunk} if settings.SHORTEN_DEDUP_PER_OWNER else {}
+    for _ in range(3):
+        known = crud.get_owner_codes_by_url_hash(db, owner_id, set(hashes.values()))
+        fresh = []
+        for index, url in chunk:
+            url_hash = hashes.get(index)
+            if url_hash is None or url_hash not in known:
+                fresh.append((index, url, url_hash))
+                if url_hash is not None:
+                    known[url_hash] = None  # later repeats in this chunk take the code allocated below
+        codes = allocator.get_allocator().allocate_many(len(fresh))
+        try:
+            crud.create_db_urls_bulk(
+                db,
+                [
+                    {"short_code": code, "original_url": url, "url_hash": url_hash}
+                    for code, (_, url, url_hash) in zip(codes, fresh)
+                ],
+                owner_id=owner_id,
+            )
+            break
+        except IntegrityError:
+            # A code clashed with one the allocator didn't know about (or a concurrent request
+            # stored one of these URLs first); remember taken codes and retry with fresh ones.
+            db.rollback()
+            for code in crud.get_taken_short_codes(db, codes):
+                allocator.get_allocator().note_taken(code)
+    else:
+        return [_ndjson({"index": index, "error": "Could not create a unique short code."}) for index, _ in chunk]
+
+    assigned = {index: code for code, (index, _, _) in zip(codes, fresh)}
+    for code, (_, _, url_hash) in zip(codes, fresh):
+        if url_hash is not None:
+            known[url_hash] = code
+    results = []
+    for index, url in chunk:
+        code = assigned.get(index) or known[hashes[index]]
+        results.append(_ndjson({"index": index, "short_code": code, "short_url": f"{base_url}{code}", "original_url": url}))
+    return results
+
+async def _read_spooled(body, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    while data := await run_in_threadpool(body.read, chunk_size):
+        yield data
+
+async def _shorten_batch_results(
+    items: AsyncIterator[object], db: Session, owner_id: int, base_url: str
+) -> AsyncIterator[bytes]:
+    chunk: list[tuple[int, str]] = []
+    index = 0
+    try:
+        async for item in items:
+            if index >= settings.BATCH_SHORTEN_MAX_ITEMS:
+                yield _ndjson({"error": f"Batch exceeds {settings.BATCH_SHORTEN_MAX_ITEMS} items; the rest was ignored."})
+                break
+            try:
+                url = schemas.URLCreate.model_validate(item if isinstance(item, dict) else {"original_url": item})
+                chunk.append((index, str(url.original_url)))
+            except ValidationError as exc:
+                yield _ndjson({"index": index, "error": exc.errors()[0]["msg"]})
+            index += 1
+            if len(chunk) >= settings.BATCH_SHORTEN_CHUNK_SIZE:
+                for line in await run_in_threadpool(_store_shorten_chunk, db, chunk, owner_id, base_url):
+                    yield line
+                chunk = []
+    except ValueError as exc:
+        # Malformed body: keep what was parsed so far, then report where it stopped.
+        if chunk:
+            for line in await run_in_threadpool(_store_shorten_chunk, db, chunk, owner_id, base_url):
+                yield line
+        yield _ndjson({"index": index, "error": f"Malformed request body: {exc}"})
+        return
+    if chunk:
+        for line in await run_in_threadpool(_store_shorten_chunk, db, chunk, owner_id, base_url):
+            yield line
+
+@app.post("/api/shorten/batch", dependencies=[Depends(limit_shorten)])
+async def create_short_urls_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """
+    Shortens many URLs in one request. The body is either a JSON array or NDJSON
+    (`Content-Type: application/x-ndjson`); each element is a URL string or an
+    `{"original_url": ...}` object. The body is parsed as it streams in, stored
+    in chunks of BATCH_SHORTEN_CHUNK_SIZE with one multi-row INSERT each, and one
+    NDJSON result line per item (`short_code`/`short_url` or `error`, keyed by
+    `index`) is streamed back as each chunk commits.
+    """
+    # Read the whole body before the response starts: once it does, the server's
+    # disconnect listener competes with request.stream() for receive().
+    body = tempfile.SpooledTemporaryFile(max_size=settings.BATCH_SHORTEN_SPOOL_MEMORY_BYTES)
+    async for data in request.stream():
+        await run_in_threadpool(body.write, data)
+    body.seek(0)
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = utils.iter_ndjson(_read_spooled(body))
+    else:
+        items = utils.iter_json_array(_read_spooled(body))
+    return StreamingResponse(
+        _shorten_batch_results(items, db, current_user.id, str(request.base_url)),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(body.close),
+    )
+
 # --- Public Endpoints ---
 
-@app.get("/{short_code}") # FIX: Removed response_class=RedirectResponse to allow for multiple response types
-def redirect_to_url(short_code: str, request: Request, db: Session = Depends(get_db)):
-    db_url = crud.get_db_url_by_short_code(db, short_code)
+@app.get("/{short_code}", dependencies=[Depends(limit_redirect)]) # FIX: Removed response_class=RedirectResponse to allow for multiple response types
+def redirect_to_url(short_code: str, request: Request, db: Session = Depends(get_read_db)):
+    # The session only connects if the lookup misses both cache tiers.
+    db_url = cache.link_cache.get(
+        short_code,
+        lambda: negative_cache.link_filter.guard(short_code, lambda: crud.get_link_snapshot(db, short_code)),
+    )
     
     if not db_url:
         raise HTTPException(status_code=404, detail="URL not found")
@@ -211,25 +575,155 @@ def redirect_to_url(short_code: str, request: Request, db: Session = Depends(get
             headers={"Cache-Control": "no-store, no-cache, must-revalidate, max-age=0"},
         )
     
-    # If the link is active, proceed as normal.
-    log_click_task.delay(
+    # If the link is active, proceed as normal. This only buffers the click, Redis is not touched here.
+    ingest.enqueue_click(
         short_code=short_code,
         ip_address=request.client.host,
         user_agent=request.headers.get("user-agent"),
         referrer=request.headers.get("referer"),
     )
-    return RedirectResponse(url=db_url.original_url)
+    hot_links.hot_links.record(short_code)
+    return RedirectResponse(
+        url=db_url.original_url, status_code=db_url.status_code, headers={"Cache-Control": db_url.cache_control}
+    )
 
 
 @app.get("/api/stats/{short_code}", response_model=schemas.URLStats)
-def get_url_stats(short_code: str, request: Request, db: Session = Depends(get_db)):
+def get_url_stats(short_code: str, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    """Polling clients should send the `ETag` back in `If-None-Match`: unchanged stats cost one small query and a 304."""
+    validator = crud.get_url_stats_validator(db, short_code)
+    if not validator:
+        raise HTTPException(status_code=404, detail="URL not found")
+    etag, last_modified = conditional.stats_validators(validator)
+    headers = conditional.validator_headers(etag, last_modified, conditional.STATS_CACHE_CONTROL)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(headers)
+
     db_url = crud.get_db_url_stats(db, short_code)
     if not db_url:
         raise HTTPException(status_code=404, detail="URL not found")
+    response.headers.update(headers)
     base_url = str(request.base_url)
     db_url.short_url = f"{base_url}{short_code}"
     return db_url
 
+@app.get("/api/trending", response_model=list[schemas.TrendingLink])
+def get_trending_links(
+    request: Request,
+    window: int = Query(default=60, ge=1, le=settings.HOT_LINKS_WINDOW_MINUTES, description="minutes"),
+    limit: int = Query(default=10, ge=1, le=100),
+    current_user: schemas.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    The user's most redirected links over the last `window` minutes, across all
+    workers. Links are picked out of the top HOT_LINKS_TRENDING_CANDIDATES of
+    every owner's, so only links among the hottest overall show up. Counts are
+    estimates from the heavy-hitter sketches (never below the true figure) and
+    lag by up to HOT_LINKS_FLUSH_SECONDS. Deactivated links are left out.
+    """
+    candidates = hot_links.hot_links.trending(window, settings.HOT_LINKS_TRENDING_CANDIDATES)
+    # One lookup by short code for the whole ranking; the clicks table is never read.
+    owned = crud.get_owned_active_codes(db, current_user.id, [short_code for short_code, _ in candidates])
+    base_url = str(request.base_url)
+    return [
+        {"short_code": short_code, "short_url": f"{base_url}{short_code}", "redirects": redirects}
+        for short_code, redirects in candidates
+        if short_code in owned
+    ][:limit]
+
+TIMESERIES_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+TIMESERIES_DEFAULT_BUCKETS = {"hour": 48, "day": 30}
+
+@app.get("/api/stats/{short_code}/timeseries", response_model=schemas.URLTimeseries)
+def get_url_timeseries(
+    short_code: str,
+    granularity: Literal["hour", "day"] = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Clicks per hour or day bucket for [start, end], read only from the rollup
+    tables, plus the top referrer hosts over the same range. Defaults to the
+    last 48 hours or 30 days, ending with the current bucket.
+    """
+    if not cache.link_cache.get(short_code, lambda: crud.get_link_snapshot(db, short_code)):
+        raise HTTPException(status_code=404, detail="URL not found")
+
+    step = TIMESERIES_STEPS[granularity]
+    end = crud.bucket_start(end or datetime.now(timezone.utc), granularity) + step
+    start = crud.bucket_start(start, granularity) if start else end - step * TIMESERIES_DEFAULT_BUCKETS[granularity]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    buckets = (end - start) // step
+    if buckets > settings.STATS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range covers {buckets} buckets, the maximum is {settings.STATS_TIMESERIES_MAX_BUCKETS}",
+        )
+
+    counts = crud.get_click_timeseries(db, short_code, granularity, start, end)
+    points = [
+        {"bucket_start": bucket, "clicks": counts.get(bucket, 0)}
+        for bucket in (start + step * i for i in range(buckets))
+    ]
+    top_referrers = crud.get_top_referrers(db, short_code, crud.bucket_start(start, "day"), end)
+    return {
+        "short_code": short_code,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "points": points,
+        "top_referrers": top_referrers,
+    }
+
+# --- Internal Endpoints ---
+
+LOOPBACK_HOSTS = {"127.0.0.1", "::1"}
+
+def require_internal_access(request: Request, x_internal_token: str | None = Header(default=None)):
+    """Internal endpoints need INTERNAL_API_TOKEN in `X-Internal-Token`, or a loopback client when no token is set."""
+    if settings.INTERNAL_API_TOKEN:
+        if x_internal_token and secrets.compare_digest(x_internal_token, settings.INTERNAL_API_TOKEN):
+            return
+    elif request.client and request.client.host in LOOPBACK_HOSTS:
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+
+@app.get("/internal/cache-stats", dependencies=[Depends(require_internal_access)])
+def get_cache_stats():
+    return {
+        **cache.link_cache.stats(),
+        "negative_filter": negative_cache.link_filter.stats(),
+        "rate_limiter": ratelimit.limiter.stats(),
+        "hot_links": hot_links.hot_links.stats(),
+    }
+
+@app.get("/internal/metrics", dependencies=[Depends(require_internal_access)])
+def get_metrics():
+    """Per-route request metrics in the Prometheus text format."""
+    return Response(instrumentation.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/internal/ingest-stats", dependencies=[Depends(require_internal_access)])
+def get_ingest_stats():
+    """
+    Counters of the click publisher (null while clicks go straight to the in-memory queue)
+    and of the enrichment stage (null unless this process has stored clicks).
+    """
+    return {"publisher": ingest.publisher_stats(), "enrichment": enrichment.enricher_stats()}
+
+@app.get("/internal/pool-stats", dependencies=[Depends(require_internal_access)])
+def get_pool_stats():
+    return database.pool_metrics()
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: passes once start-up, including the optional warm-up, has finished."""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "starting"})
+    return {"status": "ready", "warm_up": getattr(app.state, "warm_up", None)}
+
 @app.get("/health")
 def health_check(db: Session = Depends(get_db)):
     try:
@@ -240,4 +734,8 @@ def health_check(db: Session = Depends(get_db)):
 
 @app.get("/")
 def read_root():
-    return {"message": "Hello World!"}
\ No newline at end of file
+    return {"message": "Hello World!"}
+
+# The catch-all redirect routes go last, so fixed paths such as /health and /ready are not
+# taken for short codes (the async router's twin is included before everything else).
+app.router.routes.sort(key=lambda route: getattr(route, "path", None) == "/{short_code}")
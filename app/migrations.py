@@ -0,0 +1,86 @@
+"""
+Schema changes that `create_all` cannot apply to an existing database.
+
+`create_all` only creates missing tables, so columns and indexes added to a
+table that already exists have to be created explicitly. Every step here is
+idempotent; they run as part of `python -m app.bootstrap` and can be applied
+on their own with `python -m app.migrations`.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+from sqlalchemy.engine import Engine
+
+from . import partitions
+from .config import settings
+
+# (table, column, column DDL), added when missing.
+COLUMNS = [
+    ("urls", "url_hash", "VARCHAR(64)"),
+    ("urls", "updated_at", "TIMESTAMP WITH TIME ZONE"),
+    ("urls", "redirect_status", "INTEGER"),
+    ("urls", "cache_max_age", "INTEGER"),
+    ("clicks", "browser", "VARCHAR(24)"),
+    ("clicks", "os", "VARCHAR(16)"),
+    ("clicks", "device", "VARCHAR(8)"),
+    ("clicks", "country", "VARCHAR(2)"),
+]
+
+MIGRATIONS = [
+    # Keyset pagination of /api/me/links (owner_id = ? ORDER BY created_at DESC, id DESC).
+    "CREATE INDEX IF NOT EXISTS ix_urls_owner_id_created_at ON urls (owner_id, created_at, id)",
+    # Recent clicks of one link; on a partitioned clicks table PostgreSQL adds it to every partition.
+    "CREATE INDEX IF NOT EXISTS ix_clicks_short_code_clicked_at ON clicks (short_code, clicked_at)",
+    # Per-owner dedup of destinations (SHORTEN_DEDUP_PER_OWNER).
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_urls_owner_id_url_hash ON urls (owner_id, url_hash)",
+    # Top links of /api/me/summary.
+    "CREATE INDEX IF NOT EXISTS ix_urls_owner_id_total_clicks ON urls (owner_id, total_clicks)",
+]
+
+# Owners without a summary row get one computed from their links (and their hourly
+# counts from the link rollups); from then on the writes keep it current. Hourly counts
+# go first, as the summary rows are what marks an owner as done.
+BACKFILL_OWNER_ROLLUPS = text(
+    """
+    INSERT INTO owner_click_rollups (owner_id, bucket_start, clicks)
+    SELECT u.owner_id, r.bucket_start, SUM(r.clicks)
+    FROM click_rollups r JOIN urls u ON u.short_code = r.short_code
+    WHERE r.granularity = 'hour' AND r.bucket_start >= :since AND u.owner_id IS NOT NULL
+      AND u.owner_id NOT IN (SELECT owner_id FROM owner_summaries)
+    GROUP BY u.owner_id, r.bucket_start
+    """
+).bindparams(bindparam("since", type_=DateTime(timezone=True)))
+BACKFILL_OWNER_SUMMARIES = text(
+    """
+    INSERT INTO owner_summaries (owner_id, total_links, active_links, total_clicks)
+    SELECT u.owner_id, COUNT(*), SUM(CASE WHEN u.is_active THEN 1 ELSE 0 END),
+           SUM(COALESCE(u.total_clicks, 0)
+               + COALESCE((SELECT SUM(s.clicks) FROM click_counter_shards s WHERE s.short_code = u.short_code), 0))
+    FROM urls u
+    WHERE u.owner_id IS NOT NULL AND u.owner_id NOT IN (SELECT owner_id FROM owner_summaries)
+    GROUP BY u.owner_id
+    """
+)
+
+def _add_missing_columns(connection) -> None:
+    inspector = inspect(connection)
+    for table, column, ddl in COLUMNS:
+        if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def apply(engine: Engine) -> None:
+    with engine.begin() as connection:
+        _add_missing_columns(connection)
+        for statement in MIGRATIONS:
+            connection.execute(text(statement))
+        since = datetime.now(timezone.utc) - timedelta(days=settings.OWNER_ROLLUP_RETENTION_DAYS)
+        connection.execute(BACKFILL_OWNER_ROLLUPS, {"since": since})
+        connection.execute(BACKFILL_OWNER_SUMMARIES)
+        partitions.ensure_click_partitions(connection, settings.CLICK_PARTITIONS_AHEAD)
+
+
+if __name__ == "__main__":
+    from .database import get_engine
+
+    apply(get_engine())
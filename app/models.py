@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -22,27 +22,117 @@ class URL(Base):
     id = Column(Integer, primary_key=True, index=True)
     short_code = Column(String(10), unique=True, index=True, nullable=False)
     original_url = Column(Text, nullable=False)
+    # SHA-256 of the normalized original_url, set only while SHORTEN_DEDUP_PER_OWNER is on
+    # and the link is active; NULLs never clash in the unique index below.
+    url_hash = Column(String(64), nullable=True)
     
     total_clicks = Column(Integer, default=0)
     last_clicked_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set when the owner changes the link (status, redirect policy); clicks don't touch it.
+    updated_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True)
+    # Per-link redirect policy; NULL falls back to REDIRECT_STATUS / REDIRECT_CACHE_MAX_AGE.
+    redirect_status = Column(Integer, nullable=True)
+    cache_max_age = Column(Integer, nullable=True)
 
     owner_id = Column(Integer, ForeignKey("users.id"))
     
     owner = relationship("User", back_populates="urls")
     clicks = relationship("Click", back_populates="url", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Backs the keyset-paginated listing of a user's links, newest first.
+        Index("ix_urls_owner_id_created_at", "owner_id", "created_at", "id"),
+        # One active deduplicated link per destination per owner.
+        Index("ux_urls_owner_id_url_hash", "owner_id", "url_hash", unique=True),
+        # An owner's most clicked links, for /api/me/summary.
+        Index("ix_urls_owner_id_total_clicks", "owner_id", "total_clicks"),
+    )
+
+class ClickCounterShard(Base):
+    """
+    Pending click increments for a link, spread over several rows so that
+    concurrent writers of a hot link don't all queue on the same row lock.
+    Folded back into URL.total_clicks periodically.
+    """
+    __tablename__ = "click_counter_shards"
+
+    short_code = Column(String(10), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+    last_clicked_at = Column(DateTime(timezone=True), nullable=True)
+
+class CodeBlockLease(Base):
+    """One row per block of short code ids handed to a process; the row id is the block number."""
+    __tablename__ = "code_block_leases"
+
+    id = Column(Integer, primary_key=True)
+    holder = Column(String(255), nullable=True)
+    leased_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Click(Base):
     __tablename__ = "clicks"
 
     id = Column(Integer, primary_key=True, index=True)
     short_code = Column(String(10), ForeignKey("urls.short_code", ondelete="CASCADE"), nullable=False)
     
-    clicked_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key on PostgreSQL (see app/partitions.py), so it is part of the primary key there.
+    clicked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(Text, nullable=True)
     referrer = Column(Text, nullable=True)
+    # Derived by the consumer from user_agent and ip_address (app/enrichment.py).
+    browser = Column(String(24), nullable=True)
+    os = Column(String(16), nullable=True)
+    device = Column(String(8), nullable=True)
+    country = Column(String(2), nullable=True)
     
     url = relationship("URL", back_populates="clicks")
+
+    __table_args__ = (
+        # Recent clicks of one link (get_db_url_stats) and per-link exports.
+        Index("ix_clicks_short_code_clicked_at", "short_code", "clicked_at"),
+    )
+
+
+class ClickRollup(Base):
+    """Click counts per link per hour or day bucket, kept current by the click pipeline."""
+    __tablename__ = "click_rollups"
+
+    short_code = Column(String(10), primary_key=True)
+    granularity = Column(String(8), primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+
+class OwnerSummary(Base):
+    """
+    Dashboard totals of one owner, adjusted in the same transaction as every
+    write that changes them (link create/toggle/delete, stored clicks), so
+    /api/me/summary never has to scan the owner's links.
+    """
+    __tablename__ = "owner_summaries"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_links = Column(Integer, nullable=False, default=0)
+    active_links = Column(Integer, nullable=False, default=0)
+    total_clicks = Column(Integer, nullable=False, default=0)
+
+class OwnerClickRollup(Base):
+    """Clicks on all of an owner's links per hour, for the 24h/7d figures; pruned after OWNER_ROLLUP_RETENTION_DAYS."""
+    __tablename__ = "owner_click_rollups"
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+
+class ReferrerRollup(Base):
+    """Click counts per link, day and referrer host, for top-referrer queries."""
+    __tablename__ = "referrer_rollups"
+
+    short_code = Column(String(10), primary_key=True)
+    day = Column(DateTime(timezone=True), primary_key=True)
+    referrer = Column(String(255), primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+
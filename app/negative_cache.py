@@ -0,0 +1,210 @@
+"""
+Membership filter of every existing short code, consulted on the redirect path
+before the database: a code the filter has never seen is rejected as a 404
+without a query, which keeps random-code scans off the database.
+
+Each process holds its own Bloom filter, built from `urls` at startup (in the
+background; until then every lookup passes through) and rebuilt periodically.
+New codes are added before their row is committed and broadcast to the other
+workers; they are also primed into the shared Redis tier of the link cache, so
+a worker that missed the broadcast still finds them there before asking the
+filter.
+
+A Bloom filter cannot forget a key, so deleted codes stay in it as false
+positives (costing one query, as before) until the next rebuild; a rebuild is
+brought forward once they make up NEGATIVE_CACHE_STALE_RATIO of the entries.
+Every code added since shortly before a rebuild started is replayed into the
+rebuilt filter, in case its row was committed after the rebuild read the table;
+codes are kept for replay as long as a rebuild is running, however long the
+load takes. Rebuilds read the primary, so replica lag cannot leave codes out.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+from sqlalchemy import func, select
+
+from . import database, models, pubsub
+from .bloom import BloomFilter
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class LinkFilter:
+    """Bloom filter of existing short codes with guarded lookups, background rebuilds and stats."""
+
+    # How long before a rebuild starts an added code may still be uncommitted (codes are added
+    # before their row is committed); such codes are replayed as well.
+    RECENT_SECONDS = 60.0
+
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        load_codes: Callable[[], Iterable[str]],
+        count_codes: Callable[[], int],
+        enabled: bool = True,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.enabled = enabled
+        self._load_codes = load_codes
+        self._count_codes = count_codes
+        self._filter: BloomFilter | None = None
+        # Codes added lately, replayed into a rebuilt filter: their rows may have been
+        # committed after the rebuild read the table.
+        self._recent: deque[tuple[float, str]] = deque()
+        self._lock = threading.Lock()
+        # Rebuilds in progress; `_recent` is not pruned while there are any.
+        self._rebuilding = 0
+        self._stale = 0
+        self._built_at = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"rejected": 0, "passed": 0, "false_positives": 0, "rebuilds": 0, "last_rebuild_seconds": None}
+
+    def might_exist(self, short_code: str) -> bool:
+        current = self._filter
+        return not self.enabled or current is None or short_code in current
+
+    def guard(self, short_code: str, loader: Callable[[], T | None]) -> T | None:
+        """Runs `loader` unless the filter rules the code out."""
+        if not self.might_exist(short_code):
+            self._stats["rejected"] += 1
+            return None
+        self._stats["passed"] += 1
+        result = loader()
+        if result is None and self._filter is not None:
+            self._stats["false_positives"] += 1
+        return result
+
+    async def aguard(self, short_code: str, loader: Callable[[], Awaitable[T | None]]) -> T | None:
+        if not self.might_exist(short_code):
+            self._stats["rejected"] += 1
+            return None
+        self._stats["passed"] += 1
+        result = await loader()
+        if result is None and self._filter is not None:
+            self._stats["false_positives"] += 1
+        return result
+
+    def add(self, short_codes: Iterable[str]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for short_code in short_codes:
+                if self._filter is not None:
+                    self._filter.add(short_code)
+                self._recent.append((now, short_code))
+            if not self._rebuilding:
+                while self._recent and self._recent[0][0] < now - self.RECENT_SECONDS:
+                    self._recent.popleft()
+
+    def mark_deleted(self, count: int) -> None:
+        self._stale += count
+
+    def rebuild(self) -> None:
+        started = time.perf_counter()
+        with self._lock:
+            self._rebuilding += 1
+            replay_since = time.monotonic() - self.RECENT_SECONDS
+        try:
+            # Leave headroom so the filter stays near its error rate until the next rebuild.
+            capacity = max(self.capacity, 2 * self._count_codes())
+            fresh = BloomFilter(capacity, self.error_rate)
+            for short_code in self._load_codes():
+                fresh.add(short_code)
+            with self._lock:
+                for added_at, short_code in self._recent:
+                    if added_at >= replay_since:
+                        fresh.add(short_code)
+                self._filter = fresh
+                self._stale = 0
+        finally:
+            with self._lock:
+                self._rebuilding -= 1
+        self._built_at = time.monotonic()
+        self._stats["rebuilds"] += 1
+        self._stats["last_rebuild_seconds"] = round(time.perf_counter() - started, 3)
+
+    def _needs_rebuild(self) -> bool:
+        current = self._filter
+        if current is None or time.monotonic() - self._built_at >= settings.NEGATIVE_CACHE_REBUILD_SECONDS:
+            return True
+        return self._stale > settings.NEGATIVE_CACHE_STALE_RATIO * max(current.count, 1)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._needs_rebuild():
+                try:
+                    self.rebuild()
+                except Exception:
+                    logger.exception("Rebuilding the short code filter failed")
+            self._stop.wait(min(60.0, settings.NEGATIVE_CACHE_REBUILD_SECONDS))
+
+    def start(self) -> None:
+        """Builds the filter in the background and keeps it fresh."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="link-filter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> dict:
+        current = self._filter
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "ready": current is not None,
+            "entries": current.count if current else 0,
+            "stale_entries": self._stale,
+            "capacity": current.capacity if current else self.capacity,
+            "target_error_rate": self.error_rate,
+            "estimated_false_positive_rate": round(current.estimated_false_positive_rate(), 6) if current else None,
+            "memory_bytes": current.memory_bytes if current else 0,
+        }
+
+
+# Both read the primary: a lagging replica could miss codes added before the replay window.
+
+def _load_codes() -> Iterable[str]:
+    db = database.new_session()
+    try:
+        yield from db.scalars(select(models.URL.short_code).execution_options(yield_per=10000))
+    finally:
+        db.close()
+
+def _count_codes() -> int:
+    db = database.new_session()
+    try:
+        return db.scalar(select(func.count()).select_from(models.URL))
+    finally:
+        db.close()
+
+link_filter = LinkFilter(
+    capacity=settings.NEGATIVE_CACHE_CAPACITY,
+    error_rate=settings.NEGATIVE_CACHE_ERROR_RATE,
+    load_codes=_load_codes,
+    count_codes=_count_codes,
+    enabled=settings.NEGATIVE_CACHE_ENABLED,
+)
+
+def links_created(short_codes: list[str]) -> None:
+    """Call before the new rows are committed, so no worker can see the row but not the code."""
+    pubsub.publish("links_created", short_codes=short_codes)
+
+def links_deleted(short_codes: list[str]) -> None:
+    pubsub.publish("links_deleted", count=len(short_codes))
+
+pubsub.subscribe("links_created", lambda message: link_filter.add(message["short_codes"]))
+pubsub.subscribe("links_deleted", lambda message: link_filter.mark_deleted(message["count"]))
@@ -0,0 +1,235 @@
+"""
+Time-partitioned click storage, retention and archival.
+
+On PostgreSQL `clicks` is created as a table partitioned by month on
+`clicked_at` (the primary key becomes (id, clicked_at), as partitioning
+requires). Monthly partitions are created ahead of time, plus a default
+partition so an insert never fails for lack of one. The
+(short_code, clicked_at) index is declared on the parent and PostgreSQL
+creates it on every partition.
+
+Rows only land in the default partition when their month has no partition
+(a skewed clock, or a month the maintenance task has not reached yet). They
+are moved into their month's partition when it is created, and retention
+archives and deletes them like any other rows.
+
+Other databases (SQLite in tests and local runs) keep a single table; retention
+then archives and deletes rows month by month instead of dropping partitions.
+
+Archived months are written as gzip-compressed CSV, one file per month, before
+anything is dropped or deleted.
+"""
+
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+CLICKS = models.Click.__tablename__
+DEFAULT_PARTITION = f"{CLICKS}_default"
+PARTITION_NAME = re.compile(rf"^{CLICKS}_y(\d{{4}})m(\d{{2}})$")
+
+
+@compiles(CreateTable, "postgresql")
+def _create_table(create, compiler, **kw):
+    ddl = compiler.visit_create_table(create, **kw)
+    if create.element.name != CLICKS:
+        return ddl
+    # A partitioned table's unique constraints must include the partition key.
+    ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, clicked_at)")
+    return ddl.rstrip() + " PARTITION BY RANGE (clicked_at)\n\n"
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(moment: datetime) -> datetime:
+    return moment.replace(year=moment.year + 1, month=1) if moment.month == 12 else moment.replace(month=moment.month + 1)
+
+def partition_name(month: datetime) -> str:
+    return f"{CLICKS}_y{month.year:04d}m{month.month:02d}"
+
+
+# --- Partition Maintenance (PostgreSQL) ---
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    kind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": CLICKS}
+    ).scalar()
+    return kind == "p"
+
+def _table_exists(connection: Connection, name: str) -> bool:
+    return connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+def _create_month_partition(connection: Connection, month: datetime, has_default: bool) -> None:
+    name = partition_name(month)
+    if _table_exists(connection, name):
+        return
+    upper = next_month(month)
+    bounds = {"lower": month, "upper": upper}
+    create = text(
+        f"CREATE TABLE {name} PARTITION OF {CLICKS} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+    in_range = "clicked_at >= :lower AND clicked_at < :upper"
+    stray = has_default and connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"), bounds
+    ).scalar()
+    if not stray:
+        connection.execute(create)
+        return
+    # PostgreSQL refuses a partition whose range has rows in the default partition: take the
+    # default out, create the month, move the rows over and put the default back, in one transaction.
+    connection.execute(text(f"ALTER TABLE {CLICKS} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(create)
+    moved = connection.execute(
+        text(f"INSERT INTO {CLICKS} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds
+    ).rowcount
+    connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+    connection.execute(text(f"ALTER TABLE {CLICKS} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.warning("Moved %d clicks of %s out of %s", moved, month.strftime("%Y-%m"), DEFAULT_PARTITION)
+
+def ensure_click_partitions(connection: Connection, months_ahead: int, now: datetime | None = None) -> None:
+    """
+    Creates the partitions for this month and the next `months_ahead`, plus the default one.
+    Call inside a transaction: creating a month may move rows out of the default partition.
+    """
+    if not is_partitioned(connection):
+        if connection.dialect.name == "postgresql":
+            logger.warning("%s is not a partitioned table; skipping partition maintenance", CLICKS)
+        return
+    has_default = _table_exists(connection, DEFAULT_PARTITION)
+    month = month_start(now or datetime.now(timezone.utc))
+    for _ in range(months_ahead + 1):
+        _create_month_partition(connection, month, has_default)
+        month = next_month(month)
+    if not has_default:
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {CLICKS} DEFAULT"))
+        return
+    stray = connection.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+    if stray:
+        logger.warning(
+            "%d clicks are in %s because their month has no partition; check the clocks of the redirect hosts",
+            stray,
+            DEFAULT_PARTITION,
+        )
+
+def _monthly_partitions(connection: Connection) -> list[tuple[str, datetime]]:
+    names = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:name)"
+        ),
+        {"name": CLICKS},
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+# --- Retention ---
+
+def _months_between(oldest: datetime | None, cutoff: datetime) -> list[datetime]:
+    months = []
+    month = month_start(oldest) if oldest is not None else cutoff
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def archive_month(db: Session, month: datetime, archive_dir: str, batch_size: int = 10000) -> tuple[str | None, int]:
+    """
+    Writes every click of `month` to `<archive_dir>/clicks-YYYY-MM.csv.gz`.
+    Returns the path (None for a month without clicks) and the row count.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{CLICKS}-{month.year:04d}-{month.month:02d}.csv.gz")
+    rows = db.execute(
+        select(*crud.CLICK_EXPORT_COLUMNS)
+        .where(models.Click.clicked_at >= month, models.Click.clicked_at < next_month(month))
+        .order_by(models.Click.id)
+        .execution_options(yield_per=batch_size)
+    )
+    count = 0
+    # Written under a temporary name so a crash never leaves a truncated archive behind.
+    with gzip.open(path + ".tmp", "wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(rows.keys())
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    if not count:
+        os.remove(path + ".tmp")
+        return None, 0
+    os.replace(path + ".tmp", path)
+    return path, count
+
+def apply_retention(engine: Engine, retention_days: int, archive_dir: str, now: datetime | None = None) -> list[dict]:
+    """
+    Archives and removes every whole month of clicks older than `retention_days`:
+    detaches and drops its partition on PostgreSQL (and deletes its rows from the
+    default partition), deletes its rows elsewhere. Counters and rollups are kept,
+    so totals and timeseries are unaffected.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = month_start(now - timedelta(days=retention_days))
+
+    with engine.connect() as connection:
+        partitioned = is_partitioned(connection)
+        has_default = partitioned and _table_exists(connection, DEFAULT_PARTITION)
+        if partitioned:
+            dropped = {month for _, month in _monthly_partitions(connection) if next_month(month) <= cutoff}
+            oldest_stray = None
+            if has_default:
+                oldest_stray = connection.execute(text(f"SELECT min(clicked_at) FROM {DEFAULT_PARTITION}")).scalar()
+            months = sorted(dropped.union(_months_between(oldest_stray, cutoff)))
+        else:
+            oldest = connection.execute(select(func.min(models.Click.clicked_at))).scalar()
+            months = _months_between(oldest, cutoff)
+
+    archived = []
+    for month in months:
+        with Session(engine) as db:
+            # Reads through the parent, so rows of the month in the default partition are archived too.
+            path, count = archive_month(db, month, archive_dir)
+            if partitioned:
+                if month in dropped:
+                    db.execute(text(f"ALTER TABLE {CLICKS} DETACH PARTITION {partition_name(month)}"))
+                    db.execute(text(f"DROP TABLE {partition_name(month)}"))
+                if has_default:
+                    db.execute(
+                        text(
+                            f"DELETE FROM {DEFAULT_PARTITION} "
+                            "WHERE clicked_at >= :lower AND clicked_at < :upper"
+                        ),
+                        {"lower": month, "upper": next_month(month)},
+                    )
+            else:
+                db.execute(
+                    delete(models.Click).where(
+                        models.Click.clicked_at >= month, models.Click.clicked_at < next_month(month)
+                    )
+                )
+            db.commit()
+        logger.info("Archived %d clicks from %s to %s", count, month.strftime("%Y-%m"), path)
+        archived.append({"month": month.strftime("%Y-%m"), "path": path, "clicks": count})
+    return archived
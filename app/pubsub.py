@@ -0,0 +1,81 @@
+import json
+import logging
+import time
+import uuid
+from typing import Callable
+
+import redis
+
+from .redis_client import get_redis
+
+CHANNEL = "linkloom:events"
+
+logger = logging.getLogger(__name__)
+
+# Lets a process recognise (and skip) its own messages when they come back from Redis.
+_origin = uuid.uuid4().hex
+_handlers: dict[str, list[Callable[[dict], None]]] = {}
+_listener = None
+
+def subscribe(event_type: str, handler: Callable[[dict], None]) -> None:
+    """Registers a handler that runs in every process when `event_type` is published."""
+    _handlers.setdefault(event_type, []).append(handler)
+
+def publish(event_type: str, **payload) -> None:
+    """Applies the event locally, then broadcasts it to the other workers."""
+    message = {"type": event_type, **payload}
+    _dispatch(message)
+
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(CHANNEL, json.dumps({**message, "origin": _origin}))
+    except redis.RedisError:
+        logger.warning("Could not broadcast %s event", event_type, exc_info=True)
+
+def _dispatch(message: dict) -> None:
+    for handler in _handlers.get(message.get("type"), []):
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Event handler failed for %s", message.get("type"))
+
+def _on_message(raw: dict) -> None:
+    try:
+        message = json.loads(raw["data"])
+    except (TypeError, ValueError):
+        return
+    if message.pop("origin", None) == _origin:
+        return
+    _dispatch(message)
+
+def start_listener() -> None:
+    """Starts the background thread that receives events from other workers."""
+    global _listener
+    client = get_redis()
+    if client is None or _listener is not None:
+        return
+    p = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        p.subscribe(**{CHANNEL: _on_message})
+    except redis.RedisError:
+        # Local caches still expire on their own TTL, so this only widens the staleness window.
+        logger.warning("Could not subscribe to %s, running without cross-worker events", CHANNEL)
+        return
+    _listener = p.run_in_thread(
+        sleep_time=0.5,
+        daemon=True,
+        exception_handler=_on_listener_error,
+    )
+
+def _on_listener_error(exc, pubsub, thread) -> None:
+    # Back off instead of spinning while Redis is unreachable; the thread keeps retrying.
+    logger.warning("Event listener error: %s", exc)
+    time.sleep(1.0)
+
+def stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,268 @@
+"""
+Token-bucket rate limiting per client IP, user and short code.
+
+Each route has a policy: one limit per identity it is keyed on (e.g. shorten
+is limited per IP and per user). A request takes one token from every bucket
+it maps to, and only if all of them have one; otherwise it is rejected with
+the time until the emptiest bucket refills, sent back as `Retry-After`.
+
+With Redis enabled the buckets live there and are checked and updated by one
+Lua script per request, so every worker shares them. A rejection is also
+remembered in-process until the bucket refills, so a client that keeps
+hammering a worker is turned away without a Redis round-trip. With Redis
+disabled, or while it is unreachable, the same buckets are kept in process
+memory; limits are then enforced per worker.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+import redis
+import redis.asyncio
+from fastapi import HTTPException, status
+
+from .cache import TTLCache
+from .config import settings
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+LIMIT_FORMAT = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$")
+
+
+@dataclass(frozen=True)
+class Limit:
+    """`burst` requests at once, refilled at `rate` per second."""
+    rate: float
+    burst: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit | None":
+        """Parses "60/minute"; an empty string means no limit."""
+        if not value.strip():
+            return None
+        match = LIMIT_FORMAT.match(value)
+        if match is None:
+            raise ValueError(f"Invalid rate limit {value!r}, expected e.g. '60/minute'")
+        count = int(match[1])
+        return cls(rate=count / PERIODS[match[2]], burst=count)
+
+    @property
+    def refill_seconds(self) -> float:
+        return self.burst / self.rate
+
+
+# Takes one token from every bucket in KEYS, or none if any of them is empty.
+# ARGV holds a (rate, burst) pair per key. Returns {allowed, retry_after, denying key index};
+# retry_after is a string because Redis truncates Lua numbers to integers.
+# Uses the server's clock so workers with skewed clocks share the same buckets.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local tokens = {}
+local retry_after = 0
+local denied = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    available = math.min(burst, available + math.max(0, now - ts) * rate)
+    tokens[i] = available
+    if available < 1 then
+        local wait = (1 - available) / rate
+        if wait > retry_after then
+            retry_after = wait
+            denied = i
+        end
+    end
+end
+local allowed = denied == 0 and 1 or 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - allowed, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {allowed, tostring(retry_after), denied}
+"""
+
+
+class MemoryBuckets:
+    """The token-bucket script's logic over an in-process LRU of buckets."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: list[tuple[str, Limit]]) -> tuple[float | None, str | None]:
+        """Returns (None, None) when allowed, else (retry_after, key of the limiting bucket)."""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            retry_after, denied = 0.0, None
+            for key, limit in buckets:
+                tokens, ts = self._buckets.get(key, (limit.burst, now))
+                tokens = min(limit.burst, tokens + max(0.0, now - ts) * limit.rate)
+                levels.append(tokens)
+                if tokens < 1 and (1 - tokens) / limit.rate > retry_after:
+                    retry_after, denied = (1 - tokens) / limit.rate, key
+            taken = 0 if denied else 1
+            for (key, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - taken, now)
+                self._buckets.move_to_end(key)
+            # An evicted bucket starts over full, which only ever lets a client through early.
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return (retry_after, denied) if denied else (None, None)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    KEY_PREFIX = "linkloom:ratelimit:"
+
+    def __init__(
+        self,
+        policies: dict[str, dict[str, Limit | None]],
+        local_size: int,
+        enabled: bool = True,
+        redis_factory: Callable[[], redis.Redis | None] = get_redis,
+        async_redis_factory: Callable[[], redis.asyncio.Redis | None] = get_async_redis,
+    ):
+        self.policies = policies
+        self.enabled = enabled
+        self.memory = MemoryBuckets(local_size)
+        # Rejections from Redis, remembered until the bucket that caused them has a token again.
+        longest = max((limit.refill_seconds for p in policies.values() for limit in p.values() if limit), default=1.0)
+        self.denied = TTLCache(local_size, longest)
+        self._redis = redis_factory
+        self._async_redis = async_redis_factory
+        self._script = None
+        self._async_script = None
+        self._stats = {"allowed": 0, "rejected": 0, "rejected_locally": 0, "redis_errors": 0}
+
+    def _buckets(self, route: str, identities: dict[str, object]) -> list[tuple[str, Limit]]:
+        policy = self.policies.get(route, {})
+        return [
+            (f"{self.KEY_PREFIX}{route}:{scope}:{identities[scope]}", limit)
+            for scope, limit in policy.items()
+            if limit is not None and identities.get(scope) is not None
+        ]
+
+    def _precheck(self, buckets: list[tuple[str, Limit]]) -> float | None:
+        now = time.monotonic()
+        for key, _ in buckets:
+            until = self.denied.get(key)
+            if until is not None and until > now:
+                self._stats["rejected_locally"] += 1
+                return until - now
+        return None
+
+    def _record(self, allowed: int, retry_after: str, denied: int, buckets: list[tuple[str, Limit]]) -> float | None:
+        if allowed:
+            return None
+        retry = float(retry_after)
+        self.denied.set(buckets[denied - 1][0], time.monotonic() + retry)
+        return retry
+
+    @staticmethod
+    def _script_args(buckets: list[tuple[str, Limit]]) -> tuple[list[str], list[float]]:
+        return [key for key, _ in buckets], [value for _, limit in buckets for value in (limit.rate, limit.burst)]
+
+    def _finish(self, retry_after: float | None) -> float | None:
+        self._stats["allowed" if retry_after is None else "rejected"] += 1
+        return retry_after
+
+    def hit(self, route: str, **identities) -> float | None:
+        """Takes a token for one request to `route`. Returns None if allowed, else seconds to wait."""
+        buckets = self._buckets(route, identities) if self.enabled else []
+        if not buckets:
+            return None
+        retry_after = self._precheck(buckets)
+        if retry_after is not None:
+            return self._finish(retry_after)
+
+        client = self._redis()
+        if client is not None:
+            if self._script is None:
+                self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            try:
+                keys, args = self._script_args(buckets)
+                allowed, retry, denied = self._script(keys=keys, args=args)
+                return self._finish(self._record(allowed, retry, denied, buckets))
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+                logger.warning("Rate limiter cannot reach Redis, limiting per worker", exc_info=True)
+        return self._finish(self.memory.take(buckets)[0])
+
+    async def ahit(self, route: str, **identities) -> float | None:
+        """Same as hit(), for the async request path."""
+        buckets = self._buckets(route, identities) if self.enabled else []
+        if not buckets:
+            return None
+        retry_after = self._precheck(buckets)
+        if retry_after is not None:
+            return self._finish(retry_after)
+
+        client = self._async_redis()
+        if client is not None:
+            if self._async_script is None:
+                self._async_script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            try:
+                keys, args = self._script_args(buckets)
+                allowed, retry, denied = await self._async_script(keys=keys, args=args)
+                return self._finish(self._record(allowed, retry, denied, buckets))
+            except redis.RedisError:
+                self._stats["redis_errors"] += 1
+                logger.warning("Rate limiter cannot reach Redis, limiting per worker", exc_info=True)
+        return self._finish(self.memory.take(buckets)[0])
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "memory_buckets": len(self.memory),
+            "denied_cached": len(self.denied),
+            "policies": {
+                route: {scope: f"{limit.burst} per {limit.refill_seconds:g}s" for scope, limit in policy.items() if limit}
+                for route, policy in self.policies.items()
+            },
+        }
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": retry_after_header(retry_after)},
+    )
+
+
+limiter = RateLimiter(
+    policies={
+        "shorten": {
+            "ip": Limit.parse(settings.RATE_LIMIT_SHORTEN_PER_IP),
+            "user": Limit.parse(settings.RATE_LIMIT_SHORTEN_PER_USER),
+        },
+        "redirect": {
+            "ip": Limit.parse(settings.RATE_LIMIT_REDIRECT_PER_IP),
+            "short_code": Limit.parse(settings.RATE_LIMIT_REDIRECT_PER_CODE),
+        },
+    },
+    local_size=settings.RATE_LIMIT_LOCAL_SIZE,
+    enabled=settings.RATE_LIMIT_ENABLED,
+)
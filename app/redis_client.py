@@ -0,0 +1,26 @@
+import redis
+import redis.asyncio
+
+from .config import settings
+
+_client: redis.Redis | None = None
+_async_client: redis.asyncio.Redis | None = None
+
+def get_redis() -> redis.Redis | None:
+    """Returns the shared Redis client, or None when Redis is disabled."""
+    global _client
+    if _client is None and settings.REDIS_ENABLED:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+def set_redis(client: redis.Redis | None) -> None:
+    """Swaps the shared client, e.g. for a fakeredis instance in tests."""
+    global _client
+    _client = client
+
+def get_async_redis() -> redis.asyncio.Redis | None:
+    """Async counterpart of get_redis for code running on the event loop."""
+    global _async_client
+    if _async_client is None and settings.REDIS_ENABLED:
+        _async_client = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, HttpUrl, ConfigDict, EmailStr
+from pydantic import BaseModel, HttpUrl, ConfigDict, EmailStr, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 # --- User Schemas ---
 class UserBase(BaseModel):
@@ -40,17 +40,70 @@ class URLInfo(BaseModel):
     # FIX: Add the created_at field to the response model
     created_at: datetime
 
+    # The link's own redirect policy; None means the server defaults.
+    redirect_status: Optional[int] = None
+    cache_max_age: Optional[int] = None
+
     model_config = ConfigDict(from_attributes=True)
 
+class RedirectPolicy(BaseModel):
+    """How a link redirects; a field left out (or null) falls back to the server default."""
+    redirect_status: Optional[Literal[301, 302, 307, 308]] = None
+    # Seconds browsers may reuse the redirect without asking again (capped by the server).
+    cache_max_age: Optional[int] = Field(default=None, ge=0)
+
 # --- Analytics Schemas ---
 class ClickInfo(BaseModel):
     clicked_at: datetime
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
+    browser: Optional[str] = None
+    os: Optional[str] = None
+    device: Optional[str] = None
+    country: Optional[str] = None
     model_config = ConfigDict(from_attributes=True)
 
 class URLStats(URLInfo):
     total_clicks: int
     last_clicked_at: Optional[datetime] = None
     recent_clicks: List[ClickInfo] = []
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class LinkClicks(BaseModel):
+    short_code: str
+    short_url: str
+    original_url: str
+    total_clicks: int
+
+class DashboardSummary(BaseModel):
+    total_links: int
+    active_links: int
+    total_clicks: int
+    # Hour-granular windows: the current hour and the 23 (or 167) before it.
+    clicks_last_24h: int
+    clicks_last_7d: int
+    top_links: List[LinkClicks] = []
+
+class TrendingLink(BaseModel):
+    short_code: str
+    short_url: str
+    # Estimated redirects over the window; never below the true figure.
+    redirects: int
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    clicks: int
+
+class ReferrerCount(BaseModel):
+    referrer: str
+    clicks: int
+    model_config = ConfigDict(from_attributes=True)
+
+class URLTimeseries(BaseModel):
+    short_code: str
+    granularity: str
+    start: datetime
+    end: datetime
+    points: List[TimeseriesPoint] = []
+    top_referrers: List[ReferrerCount] = []
+
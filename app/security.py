@@ -1,3 +1,6 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,7 +9,8 @@ from pydantic import BaseModel
 
 from .config import settings 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost are flagged by verify_and_update and rehashed on login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -15,6 +19,48 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are already queued."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated pool of `workers` threads (bcrypt releases the GIL),
+    so it never runs on the event loop or in the shared request threadpool. At
+    most `max_pending` calls wait for a worker; beyond that calls are refused
+    with PasswordHasherBusy instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self.rejected = 0
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(pwd_context.hash, password))
+
+    async def verify(self, password: str, hashed_password: str | None) -> tuple[bool, str | None]:
+        """
+        Returns whether the password matches, plus a new hash when the stored one
+        was made with other settings. Without a stored hash (unknown user) a dummy
+        verification still runs, so response times don't reveal which emails exist.
+        """
+        if hashed_password is None:
+            await asyncio.wrap_future(self._submit(pwd_context.dummy_verify))
+            return False, None
+        return await asyncio.wrap_future(self._submit(pwd_context.verify_and_update, password, hashed_password))
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+
+
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.JWT_ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -30,4 +76,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+def decode_access_token(token: str) -> dict:
+    """Verifies a JWT and returns its claims. Raises JWTError if it is invalid or expired."""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
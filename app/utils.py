@@ -1,15 +1,115 @@
-import random
-import string
-from sqlalchemy.orm import Session
-
-from . import crud
-
-def create_unique_short_code(db: Session) -> str:
-    chars = string.ascii_letters + string.digits
-    
-    for _ in range(5):
-        short_code = "".join(random.choices(chars, k=6))
-        if not crud.get_db_url_by_short_code(db, short_code):
-            return short_code
-        
-    raise Exception("Could not generate a unique short code")
\ No newline at end of file
+import base64
+import codecs
+import hashlib
+import json
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator
+from urllib.parse import urlsplit, urlunsplit
+
+from . import allocator
+
+def create_unique_short_code() -> str:
+    """Returns a fresh short code from the configured allocator, without querying the database."""
+    return allocator.get_allocator().allocate()
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form used to recognise the same destination: lowercase scheme and
+    host, no default port, "/" for an empty path. Query and fragment are kept
+    as they are, since either can change where the link ends up.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = f"{userinfo}@{host}" if userinfo else host
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+def url_hash(url: str) -> str:
+    """Fixed-width (64 hex chars) SHA-256 of the normalized URL, for the per-owner dedup index."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+def encode_cursor(values: dict) -> str:
+    """Packs pagination state into an opaque, URL-safe token."""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> dict:
+    """Reverses encode_cursor. Raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Malformed cursor") from exc
+    if not isinstance(values, dict):
+        raise ValueError("Malformed cursor")
+    return values
+
+def decode_links_cursor(token: str) -> dict:
+    """Decodes a /api/me/links cursor into the `after` row for crud.user_links_query. Raises ValueError."""
+    try:
+        values = decode_cursor(token)
+        return {"id": int(values["id"]), "created_at": datetime.fromisoformat(values["created_at"])}
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Malformed cursor") from exc
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[object]:
+    """Yields one decoded value per non-empty line of a streamed NDJSON body."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator[object]:
+    """
+    Yields the elements of a streamed top-level JSON array as each one completes,
+    without holding the whole body in memory. Raises ValueError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = finished = False
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                if buffer[pos] == "," and not started:
+                    raise ValueError("Expected a JSON array")
+                pos += 1
+            if pos == len(buffer) or finished:
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                pos += 1
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely an element split across chunks; wait for more data.
+                break
+            if end == len(buffer) and not isinstance(value, (dict, list, str)):
+                # A bare number or literal at the end of the buffer may still be growing.
+                break
+            pos = end
+            yield value
+        buffer = buffer[pos:]
+    if not started or not finished or buffer.strip():
+        raise ValueError("Malformed or truncated JSON array")
@@ -0,0 +1,32 @@
+"""
+Start-up warm-up, run by the lifespan before a worker reports ready (see
+/ready): builds the short code filter and loads the links clicked most over the
+last WARMUP_WINDOW_HOURS into the link cache, so the first requests after a
+deploy or scale-up are not all lookups against the database.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import cache, crud, database, negative_cache
+
+logger = logging.getLogger(__name__)
+
+def warm_up(limit: int, window_hours: int) -> dict:
+    started = time.perf_counter()
+    link_filter = negative_cache.link_filter
+    if link_filter.enabled:
+        # Built here rather than by the filter's thread, so every lookup is filtered from the first request.
+        link_filter.rebuild()
+
+    db = database.new_read_session()
+    try:
+        links = crud.get_hot_link_snapshots(db, limit, datetime.now(timezone.utc) - timedelta(hours=window_hours))
+    finally:
+        db.close()
+    cache.link_cache.warm(links)
+
+    summary = {"links": len(links), "seconds": round(time.perf_counter() - started, 3)}
+    logger.info("Warmed up %(links)d links in %(seconds).3fs", summary)
+    return summary
@@ -1,6 +1,7 @@
+from datetime import datetime, timedelta, timezone
+
 from celery import Celery
-from sqlalchemy.orm import Session
-from . import crud, database
+from . import crud, database, ingest, partitions
 from .config import settings
 
 celery_app = Celery(
@@ -9,12 +10,41 @@ celery_app = Celery(
     backend=settings.REDIS_URL
 )
 
+# Redirects now go through the batched pipeline in app/ingest.py. This task is kept
+# so that clicks already sitting in the broker from older releases still get stored.
 @celery_app.task
 def log_click_task(short_code: str, ip_address: str, user_agent: str, referrer: str):
-    
-    db: Session = database.SessionLocal()
+    ingest.flush_clicks([ingest.make_click_event(short_code, ip_address, user_agent, referrer)])
+
+celery_app.conf.beat_schedule = {
+    "fold-click-counters": {
+        "task": "app.worker.fold_click_counters_task",
+        "schedule": settings.CLICK_COUNTER_FOLD_SECONDS,
+    },
+    "maintain-click-storage": {
+        "task": "app.worker.maintain_click_storage_task",
+        "schedule": 6 * 60 * 60,
+    },
+}
+
+@celery_app.task
+def fold_click_counters_task():
+    db = database.new_session()
+    try:
+        crud.fold_click_counters(db)
+    finally:
+        db.close()
+
+@celery_app.task
+def maintain_click_storage_task():
+    with database.get_engine().begin() as connection:
+        partitions.ensure_click_partitions(connection, settings.CLICK_PARTITIONS_AHEAD)
+    db = database.new_session()
     try:
-        crud.create_db_click(db, short_code, ip_address, user_agent, referrer)
-        crud.update_db_url_clicks(db, short_code)
+        crud.prune_owner_click_rollups(
+            db, datetime.now(timezone.utc) - timedelta(days=settings.OWNER_ROLLUP_RETENTION_DAYS)
+        )
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+    if settings.CLICK_RETENTION_DAYS:
+        partitions.apply_retention(database.get_engine(), settings.CLICK_RETENTION_DAYS, settings.CLICK_ARCHIVE_DIR)
@@ -0,0 +1,127 @@
+"""
+Short code allocation throughput under concurrent workers.
+
+Each "worker" is its own allocator instance (as in separate uvicorn processes),
+driven by several threads; all workers lease from the same SQLite database.
+The legacy random + SELECT strategy is included for comparison.
+
+    python -m benchmarks.bench_allocator --workers 4 --threads 4 --codes 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+_db_path = os.path.join(tempfile.mkdtemp(), "bench_allocator.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import allocator, bootstrap, database, models  # noqa: E402
+
+
+def legacy_allocator():
+    """The original strategy: random 6-character codes, one SELECT per attempt."""
+    chars = allocator.ALPHABET
+
+    class Legacy:
+        def allocate(self):
+            db = database.new_session()
+            try:
+                for _ in range(5):
+                    code = "".join(random.choices(chars, k=6))
+                    if not db.query(models.URL.id).filter(models.URL.short_code == code).first():
+                        return code
+                raise RuntimeError("Could not generate a unique short code")
+            finally:
+                db.close()
+
+    return Legacy()
+
+
+STRATEGIES = {
+    "legacy": legacy_allocator,
+    "range": lambda: allocator.RangeAllocator(allocator.lease_block_from_db, 1000, None),
+    "range-permuted": lambda: allocator.RangeAllocator(
+        allocator.lease_block_from_db,
+        1000,
+        allocator.FeistelPermutation(b"benchmark", allocator.CODE_SPACE),
+    ),
+    "bloom": lambda: allocator.BloomAllocator(allocator.load_existing_codes, capacity=1_000_000, error_rate=0.001),
+}
+
+
+def seed_existing_codes(count: int) -> None:
+    db = database.new_session()
+    try:
+        rows = [{"short_code": f"x{i:08d}", "original_url": "https://example.com/"} for i in range(count)]
+        db.execute(insert(models.URL), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(strategy: str, workers: int, threads: int, codes: int) -> dict:
+    instances = [STRATEGIES[strategy]() for _ in range(workers)]
+    # Warm up outside the timed section: first block lease / Bloom filter load.
+    for instance in instances:
+        instance.allocate()
+    per_thread = codes // (workers * threads)
+    results: list[list[str]] = []
+    start_barrier = threading.Barrier(workers * threads + 1)
+
+    def drive(instance):
+        start_barrier.wait()
+        results.append([instance.allocate() for _ in range(per_thread)])
+
+    pool = [threading.Thread(target=drive, args=(i,)) for i in instances for _ in range(threads)]
+    for t in pool:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    allocated = [code for batch in results for code in batch]
+    return {
+        "strategy": strategy,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "codes": len(allocated),
+        "unique": len(set(allocated)) == len(allocated),
+        "seconds": round(elapsed, 4),
+        "codes_per_second": round(len(allocated) / elapsed, 1),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--codes", type=int, default=20000)
+    parser.add_argument("--existing", type=int, default=100000, help="rows pre-loaded into urls")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), action="append")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    bootstrap.bootstrap()
+    seed_existing_codes(args.existing)
+
+    results = [run(name, args.workers, args.threads, args.codes) for name in args.strategy or STRATEGIES]
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Latency and throughput of the hot endpoints, driven in-process through the ASGI
+app at a configurable concurrency:
+
+    redirect        GET /{short_code}
+    shorten         POST /api/shorten
+    stats           GET /api/stats/{short_code}
+    log_click_task  the Celery click task body, called directly
+
+`--redirect-handler routed` turns off the ASGI fast path (app/fastpath.py), so
+redirects go through FastAPI routing and the regular handler; compare the two
+with --output/--baseline.
+
+Runs against a throwaway SQLite database unless --database-url points at
+another one (e.g. a local Postgres). Reports p50/p95/p99, throughput and
+queries per request (every statement on the app's engines during the run,
+background click flushes included), and can save the run as JSON and diff it
+against a previous one:
+
+    python -m benchmarks.bench_api --requests 2000 --concurrency 8 --output before.json
+    python -m benchmarks.bench_api --requests 2000 --concurrency 8 --baseline before.json
+
+    python -m benchmarks.bench_api --scenario redirect --redirect-handler routed --output routed.json
+    python -m benchmarks.bench_api --scenario redirect --baseline routed.json
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+
+SCENARIOS = ("redirect", "shorten", "stats", "log_click_task")
+
+
+def setup_environment(database_url: str | None, redirect_handler: str = "fastpath") -> str:
+    """Points the app at the benchmark database; must run before the app is imported."""
+    url = database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_api.db')}"
+    os.environ["DATABASE_URL"] = url
+    os.environ["REDIRECT_FAST_PATH"] = str(redirect_handler == "fastpath").lower()
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("REDIS_ENABLED", "false")
+    # Every request comes from one client; the limits would turn the run into a 429 benchmark.
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    return url
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--links", type=int, default=1000, help="links seeded for the read scenarios")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--redirect-handler", choices=("fastpath", "routed"), default="fastpath")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="print the change against a JSON file from an earlier run")
+    args = parser.parse_args(argv)
+
+    url = setup_environment(args.database_url, args.redirect_handler)
+
+    from fastapi.testclient import TestClient
+
+    from app import bootstrap, database, worker
+    from app.main import app
+
+    bootstrap.bootstrap()
+
+    with TestClient(app) as client:
+        credentials = {"email": f"bench-{os.getpid()}@example.com", "password": "benchmark"}
+        client.post("/auth/register", json=credentials)
+        token = client.post(
+            "/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+        ).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+
+        codes = [
+            client.post("/api/shorten", json={"original_url": f"https://seed.example.com/{i}"}, headers=auth).json()[
+                "short_code"
+            ]
+            for i in range(args.links)
+        ]
+
+        def redirect(i):
+            response = client.get(f"/{codes[i % len(codes)]}", follow_redirects=False)
+            assert response.status_code == 307, response.status_code
+
+        def shorten(i):
+            response = client.post("/api/shorten", json={"original_url": f"https://bench.example.com/{i}"}, headers=auth)
+            assert response.status_code == 200, response.status_code
+
+        def stats(i):
+            response = client.get(f"/api/stats/{codes[i % len(codes)]}")
+            assert response.status_code == 200, response.status_code
+
+        def log_click(i):
+            worker.log_click_task(codes[i % len(codes)], "203.0.113.7", "bench-agent", "https://ref.example.org/")
+
+        calls = {"redirect": redirect, "shorten": shorten, "stats": stats, "log_click_task": log_click}
+
+        results = []
+        for name in args.scenario or SCENARIOS:
+            calls[name](0)  # warm-up: first connection, caches, allocator lease
+            with harness.QueryCounter(database.get_engine(), database.get_read_engine()) as queries:
+                latencies, elapsed = harness.drive(calls[name], args.requests, args.concurrency)
+            results.append(
+                harness.summarize(name, latencies, elapsed, queries.count, concurrency=args.concurrency)
+            )
+
+    harness.report(
+        results,
+        {
+            "benchmark": "bench_api",
+            "database": database.get_engine().dialect.name,
+            "database_url": url.split("@")[-1],
+            "redirect_handler": args.redirect_handler,
+        },
+        output=args.output,
+        baseline=args.baseline,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Throughput of the click enrichment stage (user-agent parsing plus geo-IP
+lookup), with and without the user-agent memo.
+
+Events are generated in consumer-sized batches. User agents are drawn from a
+Zipf distribution over --distinct strings, which is roughly how real traffic
+looks. IP addresses are uniform over a synthetic geo-IP database of --ranges
+ranges. Each scenario enriches the same events:
+
+    python -m benchmarks.bench_enrichment --events 200000 --output enrichment.json
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+from app import enrichment  # noqa: E402
+from benchmarks import harness  # noqa: E402
+
+TEMPLATES = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.{b}.{p} Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{b} Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; SM-S9{b}B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.{p}.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{b} Safari/605.1.{p}",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{v}.0) Gecko/20100101 Firefox/{v}.{b}",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36 Edg/{v}.0.{b}.{p}",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.{b}.{p} Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.{b}; +http://www.google.com/bot.html)",
+]
+
+
+def user_agents(distinct: int, rng: random.Random) -> list[str]:
+    agents = set()
+    while len(agents) < distinct:
+        template = rng.choice(TEMPLATES)
+        agents.add(template.format(v=rng.randint(100, 130), b=rng.randint(0, 9999), p=rng.randint(0, 999)))
+    return list(agents)
+
+
+def geoip_ranges(count: int, rng: random.Random) -> list[tuple[str, str, str]]:
+    """`count` adjacent IPv4 ranges covering the address space, with random countries."""
+    step = 2**32 // count
+    countries = ["US", "DE", "FR", "GB", "JP", "BR", "IN", "CN", "AU", "CA"]
+    return [
+        (str(ipaddress.IPv4Address(i * step)), str(ipaddress.IPv4Address(i * step + step - 1)), rng.choice(countries))
+        for i in range(count)
+    ]
+
+
+def make_batches(events: int, batch_size: int, agents: list[str], skew: float, rng: random.Random) -> list[list[dict]]:
+    weights = [1 / (rank + 1) ** skew for rank in range(len(agents))]
+    picked = rng.choices(agents, weights=weights, k=events)
+    batch = [
+        {"short_code": "bench", "ip_address": str(ipaddress.IPv4Address(rng.getrandbits(32))), "user_agent": agent}
+        for agent in picked
+    ]
+    return [batch[i:i + batch_size] for i in range(0, events, batch_size)]
+
+
+def run(name: str, enricher: enrichment.ClickEnricher, batches: list[list[dict]]) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for batch in batches:
+        batch_started = time.perf_counter()
+        enricher.enrich(batch)
+        latencies.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+    events = sum(len(batch) for batch in batches)
+    return harness.summarize(
+        name, latencies, elapsed, events_per_second=round(events / elapsed, 1), **enricher.stats()
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=500, help="events per consumer batch")
+    parser.add_argument("--distinct", type=int, default=5000, help="distinct user-agent strings")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the user-agent distribution")
+    parser.add_argument("--ranges", type=int, default=300_000, help="ranges in the synthetic geo-IP database")
+    parser.add_argument("--cache-size", type=int, default=10_000, help="USER_AGENT_CACHE_SIZE of the memoized run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="print the change against a JSON file from an earlier run")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "geoip.bin")
+    enrichment.build_geoip_database(geoip_ranges(args.ranges, rng), path)
+    geoip = enrichment.GeoIPDatabase(path)
+    batches = make_batches(args.events, args.batch_size, user_agents(args.distinct, rng), args.skew, rng)
+
+    results = [
+        run("uncached", enrichment.ClickEnricher(geoip, ua_cache_size=0), batches),
+        run("memoized", enrichment.ClickEnricher(geoip, ua_cache_size=args.cache_size), batches),
+    ]
+    harness.report(
+        results,
+        {
+            "benchmark": "bench_enrichment",
+            "events": args.events,
+            "distinct_user_agents": args.distinct,
+            "skew": args.skew,
+            "geoip_ranges": args.ranges,
+        },
+        output=args.output,
+        baseline=args.baseline,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
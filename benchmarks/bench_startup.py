@@ -0,0 +1,107 @@
+"""
+Cold start of a web worker, measured in fresh interpreters (one per run):
+
+    import          importing app.main
+    startup         running the lifespan (warm-up included) until requests are served
+    ready           interpreter start to the first passing GET /ready
+    first_redirect  the first redirect of one of the hottest links
+
+Seeds a throwaway SQLite database (unless --database-url says otherwise) with
+--links links, the first --hot of which get clicks, then starts the app --runs
+times. Compare warm-up against none with --output/--baseline:
+
+    python -m benchmarks.bench_startup --runs 10 --output cold.json
+    python -m benchmarks.bench_startup --runs 10 --warmup-links 1000 --baseline cold.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import harness
+from benchmarks.bench_api import setup_environment
+
+PHASES = ("import", "startup", "ready", "first_redirect")
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+imported = time.perf_counter()
+with TestClient(app) as client:
+    serving = time.perf_counter()
+    assert client.get("/ready").status_code == 200
+    ready = time.perf_counter()
+    response = client.get("/" + sys.argv[1], follow_redirects=False)
+    assert response.status_code == 307, response.status_code
+    redirected = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "startup": serving - imported,
+    "ready": ready - started,
+    "first_redirect": redirected - ready,
+}))
+"""
+
+
+def seed(links: int, hot: int) -> str:
+    """Creates the schema and the links; returns the code of the hottest one."""
+    from app import bootstrap, crud, database, ingest, models
+
+    bootstrap.bootstrap()
+    db = database.new_session()
+    try:
+        codes = [f"st{i:06d}" for i in range(links)]
+        db.add_all(models.URL(short_code=code, original_url=f"https://cold.example.com/{code}") for code in codes)
+        db.commit()
+        events = [ingest.make_click_event(code, None, None, None) for n, code in enumerate(codes[:hot]) for _ in range(hot - n)]
+        crud.create_db_clicks_bulk(db, events)
+    finally:
+        db.close()
+    return codes[0]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--hot", type=int, default=200, help="links that get clicks (the warm-up candidates)")
+    parser.add_argument("--warmup-links", type=int, default=0, help="WARMUP_LINKS for the measured workers")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="print the change against a JSON file from an earlier run")
+    args = parser.parse_args(argv)
+
+    url = setup_environment(args.database_url)
+    hottest = seed(args.links, args.hot)
+
+    env = {**os.environ, "WARMUP_LINKS": str(args.warmup_links)}
+    timings = {phase: [] for phase in PHASES}
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        child = subprocess.run(
+            [sys.executable, "-c", CHILD, hottest], env=env, capture_output=True, text=True, check=True
+        )
+        for phase, seconds in json.loads(child.stdout.splitlines()[-1]).items():
+            timings[phase].append(seconds)
+    elapsed = time.perf_counter() - started
+
+    harness.report(
+        [harness.summarize(phase, timings[phase], elapsed) for phase in PHASES],
+        {
+            "benchmark": "bench_startup",
+            "database_url": url.split("@")[-1],
+            "links": args.links,
+            "warmup_links": args.warmup_links,
+        },
+        output=args.output,
+        baseline=args.baseline,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Shared pieces of the benchmark scripts: a concurrent driver, latency summaries,
+per-request query counting and JSON results that can be compared between commits.
+"""
+
+import json
+import subprocess
+import threading
+import time
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    """Counts statements executed on the given engines while active."""
+
+    def __init__(self, *engines: Engine):
+        self.engines = list(dict.fromkeys(engines))
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+def drive(call: Callable[[int], None], total: int, concurrency: int) -> tuple[list[float], float]:
+    """
+    Runs `call(i)` for i in range(total) spread over `concurrency` threads that
+    start together. Returns the per-call latencies in seconds and the wall time.
+    """
+    latencies: list[float] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(offset: int):
+        own = []
+        barrier.wait()
+        for i in range(offset, total, concurrency):
+            started = time.perf_counter()
+            call(i)
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name: str, latencies: list[float], elapsed: float, queries: int | None = None, **extra) -> dict:
+    ordered = sorted(latencies)
+    result = {
+        "scenario": name,
+        "requests": len(ordered),
+        "seconds": round(elapsed, 4),
+        "throughput_per_second": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+    }
+    if queries is not None:
+        result["queries_per_request"] = round(queries / len(ordered), 3) if ordered else None
+    result.update(extra)
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+COMPARED_METRICS = ("throughput_per_second", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+def compare(results: list[dict], baseline: list[dict]) -> list[dict]:
+    """Relative change of each metric against the same scenario in an earlier run."""
+    previous = {result["scenario"]: result for result in baseline}
+    changes = []
+    for result in results:
+        old = previous.get(result["scenario"])
+        if old is None:
+            continue
+        change = {"scenario": result["scenario"]}
+        for metric in COMPARED_METRICS:
+            if old.get(metric) and result.get(metric) is not None:
+                change[f"{metric}_change_pct"] = round((result[metric] - old[metric]) / old[metric] * 100, 1)
+        changes.append(change)
+    return changes
+
+
+def report(results: list[dict], meta: dict, output: str | None = None, baseline: str | None = None) -> None:
+    """Prints one JSON line per scenario, then optionally saves the run and diffs it against a saved one."""
+    for result in results:
+        print(json.dumps(result))
+    if baseline:
+        with open(baseline) as f:
+            for change in compare(results, json.load(f)["results"]):
+                print(json.dumps(change))
+    if output:
+        with open(output, "w") as f:
+            json.dump({**meta, "revision": git_revision(), "results": results}, f, indent=2)
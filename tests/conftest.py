@@ -8,20 +8,35 @@ from sqlalchemy.orm import sessionmaker
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.main import app, get_db
-from app.database import Base
-
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
+# The app reads its settings at import time, so they have to be in place first.
+os.environ.setdefault("DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("REDIS_ENABLED", "false")
+# Tests insert links straight into the database, behind the short code filter's back.
+os.environ.setdefault("NEGATIVE_CACHE_ENABLED", "false")
+
+from app.main import app, get_db, get_read_db
+from app.database import Base
+from app.instrumentation import instrument_engine
+from app.worker import celery_app
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+instrument_engine(engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Start every run from a clean schema so a stale test.db never leaks into the tests.
+Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
 
+# There is no broker in the test environment, run tasks in-process instead.
+celery_app.conf.task_always_eager = True
+
 def override_get_db():
-    
+
     try:
         db = TestingSessionLocal()
         yield db
@@ -29,8 +44,16 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 @pytest.fixture(scope="module")
 def client():
     with TestClient(app) as c:
-        yield c
\ No newline at end of file
+        credentials = {"email": "tester@example.com", "password": "test-password"}
+        c.post("/auth/register", json=credentials)
+        token = c.post(
+            "/auth/token",
+            data={"username": credentials["email"], "password": credentials["password"]},
+        ).json()["access_token"]
+        c.headers["Authorization"] = f"Bearer {token}"
+        yield c
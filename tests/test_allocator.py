@@ -0,0 +1,74 @@
+# tests/test_allocator.py
+
+import itertools
+import threading
+
+import pytest
+
+from app.allocator import (
+    CODE_LENGTH,
+    BloomAllocator,
+    FeistelPermutation,
+    RangeAllocator,
+    base62_decode,
+    base62_encode,
+    make_allocator,
+)
+from app.config import settings
+
+
+def test_base62_round_trip():
+    for number in (0, 1, 61, 62, 123456789):
+        code = base62_encode(number)
+        assert len(code) == CODE_LENGTH
+        assert base62_decode(code) == number
+
+
+def test_feistel_permutation_is_a_bijection():
+    permutation = FeistelPermutation(b"key", domain=1000)
+    values = [permutation.permute(i) for i in range(1000)]
+    assert sorted(values) == list(range(1000))
+    assert all(permutation.invert(v) == i for i, v in enumerate(values))
+
+
+def test_range_allocator_is_unique_across_threads():
+    blocks = itertools.count(1)
+    lock = threading.Lock()
+
+    def lease_block():
+        with lock:
+            return next(blocks)
+
+    # Two "processes" sharing the same lease source.
+    permutation = FeistelPermutation(b"key", 62 ** 6)
+    allocators = [RangeAllocator(lease_block, 50, permutation) for _ in range(2)]
+    codes = []
+
+    def work(allocator):
+        codes.extend(allocator.allocate_many(500))
+
+    threads = [threading.Thread(target=work, args=(a,)) for a in allocators for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(codes) == 2000
+    assert len(set(codes)) == 2000
+    assert all(len(code) == CODE_LENGTH for code in codes)
+
+
+def test_bloom_allocator_skips_known_codes():
+    allocator = BloomAllocator(lambda: ["taken1"], capacity=1000, error_rate=0.01)
+    allocator.note_taken("taken2")
+    codes = allocator.allocate_many(200)
+    assert "taken1" not in codes
+    assert len(set(codes)) == 200
+
+
+def test_redis_block_source_requires_redis(monkeypatch):
+    monkeypatch.setattr(settings, "SHORT_CODE_ALLOCATOR", "range")
+    monkeypatch.setattr(settings, "SHORT_CODE_BLOCK_SOURCE", "redis")
+    monkeypatch.setattr(settings, "REDIS_ENABLED", False)
+    with pytest.raises(ValueError, match="REDIS_ENABLED"):
+        make_allocator()
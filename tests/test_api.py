@@ -1,5 +1,9 @@
 # tests/test_api.py
 
+import json
+import os
+from app.config import settings
+
 def test_create_short_url(client):
     """
     Test creating a new short URL.
@@ -64,4 +68,403 @@ def test_invalid_url_format(client):
         "/api/shorten",
         json={"original_url": "this-is-not-a-url"}
     )
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+def test_deactivated_link_is_not_served_from_cache(client):
+    """
+    Test that toggling a link off invalidates the cached redirect.
+    """
+    create_response = client.post(
+        "/api/shorten",
+        json={"original_url": "https://www.cached.com"}
+    )
+    short_code = create_response.json()["short_code"]
+
+    assert client.get(f"/{short_code}", follow_redirects=False).status_code == 307
+    assert client.patch(f"/api/links/{short_code}").json()["is_active"] is False
+
+    response = client.get(f"/{short_code}", follow_redirects=False)
+    assert response.status_code == 410
+
+def test_pool_stats(client, monkeypatch):
+    """
+    Test that pool metrics are reported for the primary engine, to internal callers only.
+    """
+    monkeypatch.setattr(settings, "INTERNAL_API_TOKEN", "internal-token")
+    assert client.get("/internal/pool-stats").status_code == 403
+    assert client.get("/internal/pool-stats", headers={"X-Internal-Token": "wrong"}).status_code == 403
+
+    response = client.get("/internal/pool-stats", headers={"X-Internal-Token": "internal-token"})
+    assert response.status_code == 200
+    data = response.json()["primary"]
+    assert {"checkouts", "connects", "timeouts", "wait_seconds_total"} <= data.keys()
+
+def test_user_links_are_keyset_paginated(client):
+    """
+    Test walking the link listing page by page with the cursor header.
+    """
+    created = {
+        client.post("/api/shorten", json={"original_url": f"https://page{i}.example.com"}).json()["short_code"]
+        for i in range(5)
+    }
+
+    seen = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/me/links", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(link["short_code"] for link in page)
+        if "x-next-cursor" not in response.headers:
+            break
+        params = {"limit": 2, "cursor": response.headers["x-next-cursor"]}
+
+    assert len(seen) == len(set(seen))
+    assert created <= set(seen)
+
+    inactive = client.get("/api/me/links", params={"is_active": False}).json()
+    assert all(not link["is_active"] for link in inactive)
+
+def test_pagination_headers_are_exposed_to_browsers(client):
+    response = client.get("/api/me/links", params={"limit": 1}, headers={"Origin": "http://localhost:3000"})
+    exposed = response.headers["access-control-expose-headers"]
+    assert "X-Next-Cursor" in exposed and "Link" in exposed
+
+def test_user_links_rejects_bad_cursor(client):
+    response = client.get("/api/me/links", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_batch_shorten_json_array(client):
+    """
+    Test shortening a JSON array, including an invalid entry.
+    """
+    response = client.post(
+        "/api/shorten/batch",
+        json=["https://batch1.example.com", {"original_url": "https://batch2.example.com"}, "nope"],
+    )
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {result["index"]: result for result in results}
+
+    assert by_index[0]["original_url"] == "https://batch1.example.com/"
+    assert by_index[1]["original_url"] == "https://batch2.example.com/"
+    assert "error" in by_index[2]
+
+    redirect = client.get(f"/{by_index[0]['short_code']}", follow_redirects=False)
+    assert redirect.status_code == 307
+
+def test_batch_shorten_ndjson(client):
+    """
+    Test shortening an NDJSON body.
+    """
+    body = "\n".join(json.dumps({"original_url": f"https://nd{i}.example.com"}) for i in range(3))
+    response = client.post(
+        "/api/shorten/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
+    assert len({result["short_code"] for result in results}) == 3
+
+def test_click_export_streams_and_resumes(client):
+    from app import crud, ingest
+    from tests.conftest import TestingSessionLocal
+
+    short_code = client.post("/api/shorten", json={"original_url": "https://export.example.com"}).json()["short_code"]
+    db = TestingSessionLocal()
+    try:
+        crud.create_db_clicks_bulk(db, [ingest.make_click_event(short_code, "1.2.3.4", "ua", None) for _ in range(5)])
+    finally:
+        db.close()
+
+    response = client.get("/api/me/clicks/export", params={"short_code": short_code})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 5
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+    resumed = client.get("/api/me/clicks/export", params={"short_code": short_code, "cursor": rows[1]["cursor"]})
+    assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == [row["id"] for row in rows[2:]]
+
+    csv_export = client.get("/api/me/clicks/export", params={"short_code": short_code, "format": "csv"})
+    lines = csv_export.text.splitlines()
+    assert lines[0].startswith("id,short_code,clicked_at")
+    assert len(lines) == 6
+
+    past = client.get("/api/me/clicks/export", params={"short_code": short_code, "end": "2000-01-01T00:00:00Z"})
+    assert past.text == ""
+
+def test_requests_are_timed(client, monkeypatch):
+    response = client.get("/api/me/links")
+    timing = response.headers["server-timing"]
+    assert "db;dur=" in timing and "total;dur=" in timing
+    assert '"0 queries"' not in timing
+
+    monkeypatch.setattr(settings, "INTERNAL_API_TOKEN", "internal-token")
+    metrics = client.get("/internal/metrics", headers={"X-Internal-Token": "internal-token"}).text
+    assert 'linkloom_http_db_queries_total{method="GET",route="/api/me/links",status="200"}' in metrics
+
+def test_login_upgrades_the_password_hash(client):
+    from passlib.context import CryptContext
+
+    from app import models
+    from tests.conftest import TestingSessionLocal
+
+    db = TestingSessionLocal()
+    cheap = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("old-cost")
+    db.add(models.User(email="rehash@example.com", hashed_password=cheap))
+    db.commit()
+
+    response = client.post("/auth/token", data={"username": "rehash@example.com", "password": "old-cost"})
+    assert response.status_code == 200
+    db.expire_all()
+    stored = db.query(models.User).filter(models.User.email == "rehash@example.com").one().hashed_password
+    db.close()
+    assert stored != cheap and stored.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+
+    wrong = client.post("/auth/token", data={"username": "nobody@example.com", "password": "x"})
+    assert wrong.status_code == 401
+
+def test_password_hasher_refuses_work_beyond_its_queue():
+    import asyncio
+
+    import pytest
+
+    from app import security
+
+    hasher = security.PasswordHasher(workers=1, max_pending=0)
+    hasher._slots.acquire()
+    with pytest.raises(security.PasswordHasherBusy):
+        asyncio.run(hasher.hash("x"))
+    hasher._slots.release()
+    assert asyncio.run(hasher.verify("x", asyncio.run(hasher.hash("x")))) == (True, None)
+
+def test_redirects_beyond_the_limit_get_429(client, monkeypatch):
+    from app import ratelimit
+
+    short_code = client.post("/api/shorten", json={"original_url": "https://limited.example.com"}).json()["short_code"]
+    monkeypatch.setitem(ratelimit.limiter.policies, "redirect", {"short_code": ratelimit.Limit(rate=0.01, burst=2)})
+
+    for _ in range(2):
+        assert client.get(f"/{short_code}", follow_redirects=False).status_code == 307
+    limited = client.get(f"/{short_code}", follow_redirects=False)
+    assert limited.status_code == 429
+    assert 1 <= int(limited.headers["retry-after"]) <= 100
+
+def test_rate_limit_takes_from_every_bucket_or_none():
+    from app.ratelimit import Limit, MemoryBuckets
+
+    assert Limit.parse("60/minute") == Limit(rate=1.0, burst=60)
+    assert Limit.parse("") is None
+
+    buckets = MemoryBuckets(maxsize=10)
+    tight, loose = ("ip", Limit(rate=0.5, burst=1)), ("user", Limit(rate=0.5, burst=2))
+    assert buckets.take([tight, loose]) == (None, None)
+    retry_after, key = buckets.take([tight, loose])
+    assert key == "ip" and 0 < retry_after <= 2
+    # The rejected request took nothing from the user's bucket.
+    assert buckets.take([loose]) == (None, None)
+    assert buckets.take([loose])[1] == "user"
+
+def test_cached_redirects_skip_the_database(client):
+    target = "https://fast.example.com/path?q=a b"
+    short_code = client.post("/api/shorten", json={"original_url": target}).json()["short_code"]
+
+    first = client.get(f"/{short_code}", follow_redirects=False)
+    second = client.get(f"/{short_code}", follow_redirects=False)
+    assert first.status_code == second.status_code == 307
+    assert second.headers["location"] == "https://fast.example.com/path?q=a%20b"
+    assert '"0 queries"' in second.headers["server-timing"]
+
+    assert client.get("/zzzzzz").json() == {"detail": "URL not found"}
+    assert client.get("/docs").status_code == 200
+
+def test_shorten_reuses_the_owners_link_for_the_same_url(client, monkeypatch):
+    from app import utils
+
+    assert utils.normalize_url("HTTPS://Dedup.Example.com:443") == "https://dedup.example.com/"
+    assert utils.url_hash("https://dedup.example.com/a?x=1") != utils.url_hash("https://dedup.example.com/a?x=2")
+
+    monkeypatch.setattr(settings, "SHORTEN_DEDUP_PER_OWNER", True)
+    first = client.post("/api/shorten", json={"original_url": "https://dedup.example.com/page"}).json()
+    again = client.post("/api/shorten", json={"original_url": "HTTPS://DEDUP.example.com:443/page"}).json()
+    assert again["short_code"] == first["short_code"]
+
+    batch = client.post(
+        "/api/shorten/batch",
+        json=["https://dedup.example.com/page", "https://dedup.example.com/other", "https://dedup.example.com/other"],
+    )
+    codes = [json.loads(line)["short_code"] for line in batch.text.splitlines()]
+    assert codes[0] == first["short_code"] and codes[1] == codes[2] != codes[0]
+
+    # A deactivated link is not handed out again.
+    client.patch(f"/api/links/{first['short_code']}")
+    fresh = client.post("/api/shorten", json={"original_url": "https://dedup.example.com/page"}).json()
+    assert fresh["short_code"] != first["short_code"]
+
+def test_importing_the_app_touches_no_database():
+    import subprocess
+    import sys
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": "postgresql://nobody@127.0.0.1:1/unreachable",
+        "REDIS_ENABLED": "false",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.main, app.worker; from app import database; assert database._engine is None"],
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+def test_health_and_readiness_are_not_taken_for_short_codes(client):
+    assert client.get("/health").json()["status"] == "healthy"
+    ready = client.get("/ready")
+    assert ready.status_code == 200 and ready.json()["status"] == "ready"
+
+def test_warm_up_loads_the_most_clicked_links(client):
+    from app import cache, crud, ingest, warmup
+    from tests.conftest import TestingSessionLocal
+
+    codes = [client.post("/api/shorten", json={"original_url": f"https://warm{i}.example.com"}).json()["short_code"] for i in range(3)]
+    db = TestingSessionLocal()
+    crud.create_db_clicks_bulk(db, [ingest.make_click_event(code, None, None, None) for code in [codes[0]] * 50 + [codes[1]]])
+    db.close()
+    cache.link_cache.local.clear()
+
+    summary = warmup.warm_up(limit=1, window_hours=settings.WARMUP_WINDOW_HOURS)
+    assert summary["links"] == 1
+    assert cache.link_cache.local.get(codes[0]) is not None
+    assert cache.link_cache.local.get(codes[1]) is None
+
+def test_redirect_policy_sets_status_and_browser_caching(client, monkeypatch):
+    monkeypatch.setattr(settings, "REDIRECT_CACHE_MAX_AGE_LIMIT", 3600)
+    short_code = client.post("/api/shorten", json={"original_url": "https://policy.example.com"}).json()["short_code"]
+    response = client.get(f"/{short_code}", follow_redirects=False)
+    assert response.status_code == 307 and response.headers["cache-control"] == "no-store"
+
+    policy = client.put(f"/api/links/{short_code}/redirect-policy", json={"redirect_status": 308, "cache_max_age": 86400})
+    assert policy.status_code == 200 and policy.json()["redirect_status"] == 308
+
+    # The policy change invalidated the cached entry; max-age is capped so a deactivation catches up.
+    response = client.get(f"/{short_code}", follow_redirects=False)
+    assert response.status_code == 308
+    assert response.headers["cache-control"] == "private, max-age=3600"
+
+    client.patch(f"/api/links/{short_code}")
+    assert client.get(f"/{short_code}", follow_redirects=False).status_code == 410
+    assert client.put(f"/api/links/{short_code}/redirect-policy", json={"redirect_status": 303}).status_code == 422
+
+def test_stats_answer_304_until_a_click_arrives(client):
+    from app import crud, ingest
+    from tests.conftest import TestingSessionLocal
+
+    short_code = client.post("/api/shorten", json={"original_url": "https://etag.example.com"}).json()["short_code"]
+    first = client.get(f"/api/stats/{short_code}")
+    etag = first.headers["etag"]
+
+    unchanged = client.get(f"/api/stats/{short_code}", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304 and unchanged.content == b""
+    assert unchanged.headers["etag"] == etag
+    since = client.get(f"/api/stats/{short_code}", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+    db = TestingSessionLocal()
+    crud.create_db_clicks_bulk(db, [ingest.make_click_event(short_code, None, None, None)])
+    db.close()
+    changed = client.get(f"/api/stats/{short_code}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["total_clicks"] == 1
+    assert changed.headers["etag"] != etag
+
+def test_link_listing_answers_304_until_a_link_changes(client):
+    client.post("/api/shorten", json={"original_url": "https://listing-etag.example.com"})
+    etag = client.get("/api/me/links", params={"limit": 5}).headers["etag"]
+    assert client.get("/api/me/links", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 304
+    # Another page or filter is another representation.
+    assert client.get("/api/me/links", params={"limit": 6}, headers={"If-None-Match": etag}).status_code == 200
+
+    short_code = client.post("/api/shorten", json={"original_url": "https://listing-etag2.example.com"}).json()["short_code"]
+    assert client.get("/api/me/links", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 200
+    etag = client.get("/api/me/links", params={"limit": 5}).headers["etag"]
+    client.patch(f"/api/links/{short_code}")
+    assert client.get("/api/me/links", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 200
+
+def test_summary_is_kept_current_by_every_write(client):
+    from app import crud, ingest, migrations, models
+    from tests.conftest import TestingSessionLocal, engine
+
+    credentials = {"email": "summary@example.com", "password": "summary-password"}
+    client.post("/auth/register", json=credentials)
+    token = client.post("/auth/token", data={"username": credentials["email"], "password": credentials["password"]}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    codes = [
+        client.post("/api/shorten", json={"original_url": f"https://summary{i}.example.com"}, headers=headers).json()["short_code"]
+        for i in range(3)
+    ]
+    db = TestingSessionLocal()
+    crud.create_db_clicks_bulk(db, [ingest.make_click_event(code, None, None, None) for code in [codes[0]] * 3 + [codes[1]] * 2])
+    crud.fold_click_counters(db)
+    db.close()
+    client.patch(f"/api/links/{codes[2]}", headers=headers)
+    client.delete(f"/api/links/{codes[1]}", headers=headers)
+
+    summary = client.get("/api/me/summary", headers=headers).json()
+    expected = {"total_links": 2, "active_links": 1, "total_clicks": 3, "clicks_last_24h": 3, "clicks_last_7d": 3}
+    assert {key: summary[key] for key in expected} == expected
+    assert [link["short_code"] for link in summary["top_links"]][0] == codes[0]
+    assert summary["top_links"][0]["total_clicks"] == 3
+
+    # The migration rebuilds the figures of owners that have no summary yet.
+    db = TestingSessionLocal()
+    owner_id = db.query(models.User.id).filter(models.User.email == credentials["email"]).scalar()
+    for table in (models.OwnerSummary, models.OwnerClickRollup):
+        db.query(table).filter(table.owner_id == owner_id).delete()
+    db.commit()
+    db.close()
+    migrations.apply(engine)
+    rebuilt = client.get("/api/me/summary", headers=headers).json()
+    assert {key: rebuilt[key] for key in expected} == expected
+
+    # Clicks not folded yet count towards the ranking as they do towards the total.
+    db = TestingSessionLocal()
+    crud.create_db_clicks_bulk(db, [ingest.make_click_event(codes[2], None, None, None)] * 4)
+    db.close()
+    summary = client.get("/api/me/summary", headers=headers).json()
+    assert summary["total_clicks"] == 7
+    assert [(link["short_code"], link["total_clicks"]) for link in summary["top_links"]] == [(codes[2], 4), (codes[0], 3)]
+
+def test_trending_ranks_redirects_and_pins_the_top(client, monkeypatch):
+    from app import cache
+    from app.hot_links import HotLinks
+
+    tracker = HotLinks(100, 60)
+    monkeypatch.setattr("app.hot_links.hot_links", tracker)
+    monkeypatch.setattr(cache.link_cache, "pinned", {})
+    codes = [client.post("/api/shorten", json={"original_url": f"https://trend{i}.example.com"}).json()["short_code"] for i in range(3)]
+    for code, redirects in zip(codes, (5, 2, 1)):
+        for _ in range(redirects):
+            assert client.get(f"/{code}", follow_redirects=False).status_code == 307
+    client.patch(f"/api/links/{codes[1]}")
+    # Another owner's link outranks them all but is not theirs to see.
+    credentials = {"email": "trending@example.com", "password": "trending-password"}
+    client.post("/auth/register", json=credentials)
+    token = client.post("/auth/token", data={"username": credentials["email"], "password": credentials["password"]}).json()["access_token"]
+    other = client.post(
+        "/api/shorten", json={"original_url": "https://trend-other.example.com"}, headers={"Authorization": f"Bearer {token}"}
+    ).json()["short_code"]
+    for _ in range(9):
+        client.get(f"/{other}", follow_redirects=False)
+    tracker.flush()
+
+    trending = client.get("/api/trending", params={"window": 5}).json()
+    assert [(link["short_code"], link["redirects"]) for link in trending] == [(codes[0], 5), (codes[2], 1)]
+    assert client.get("/api/trending", params={"window": 5, "limit": 1}).json()[0]["short_code"] == codes[0]
+
+    # Pinning still follows the global ranking.
+    tracker.refresh_pins(limit=1, window_minutes=5)
+    assert set(cache.link_cache.pinned) == {other}
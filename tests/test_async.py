@@ -0,0 +1,79 @@
+# tests/test_async.py
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import async_api, async_database, auth_cache, models
+from tests.conftest import SQLALCHEMY_DATABASE_URL, TestingSessionLocal
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+async_engine = create_async_engine(async_database.to_async_url(SQLALCHEMY_DATABASE_URL))
+
+async def override_get_async_db():
+    async with async_database.AsyncSessionLocal(bind=async_engine) as db:
+        yield db
+
+app = FastAPI()
+app.include_router(async_api.router)
+app.dependency_overrides[async_api.get_async_db] = override_get_async_db
+app.dependency_overrides[async_api.get_async_read_db] = override_get_async_db
+
+
+def _create_link(short_code, is_active=True):
+    db = TestingSessionLocal()
+    db.add(models.URL(short_code=short_code, original_url="https://async.example.com/", is_active=is_active))
+    db.commit()
+    db.close()
+
+
+def test_to_async_url():
+    assert async_database.to_async_url("postgresql://u:p@db/x") == "postgresql+asyncpg://u:p@db/x"
+    assert async_database.to_async_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+
+
+def test_async_redirect_and_stats():
+    _create_link("async1")
+    _create_link("async2", is_active=False)
+    with TestClient(app) as client:
+        response = client.get("/async1", follow_redirects=False)
+        assert response.status_code == 307
+        assert response.headers["location"] == "https://async.example.com/"
+        assert client.get("/async2", follow_redirects=False).status_code == 410
+        assert client.get("/nope00", follow_redirects=False).status_code == 404
+
+        stats = client.get("/api/stats/async1").json()
+        assert stats["short_code"] == "async1"
+        assert stats["total_clicks"] == 0
+
+
+def test_async_user_links_are_keyset_paginated():
+    db = TestingSessionLocal()
+    owner = models.User(email="async@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    owner_id = owner.id
+    db.add_all(
+        models.URL(short_code=f"asyncl{i}", original_url="https://async.example.com/", owner_id=owner_id)
+        for i in range(3)
+    )
+    db.commit()
+    db.close()
+
+    app.dependency_overrides[async_api.get_current_user_async] = lambda: auth_cache.UserSnapshot(
+        id=owner_id, email="async@example.com"
+    )
+    try:
+        with TestClient(app) as client:
+            seen = []
+            params = {"limit": 2}
+            while True:
+                response = client.get("/api/me/links", params=params)
+                assert response.status_code == 200
+                seen.extend(link["short_code"] for link in response.json())
+                if "x-next-cursor" not in response.headers:
+                    break
+                params = {"limit": 2, "cursor": response.headers["x-next-cursor"]}
+            assert sorted(seen) == ["asyncl0", "asyncl1", "asyncl2"]
+    finally:
+        del app.dependency_overrides[async_api.get_current_user_async]
@@ -0,0 +1,155 @@
+# tests/test_cache.py
+
+import time
+
+import pytest
+
+from app.cache import CachedLink, LinkCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_link_cache_reads_through_both_tiers():
+    fakeredis = pytest.importorskip("fakeredis")
+    shared = fakeredis.FakeRedis(decode_responses=True)
+    link = CachedLink(original_url="https://example.com/", is_active=True)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return link
+
+    worker_a = LinkCache(TTLCache(10, 60), redis_ttl=60, redis_factory=lambda: shared)
+    worker_b = LinkCache(TTLCache(10, 60), redis_ttl=60, redis_factory=lambda: shared)
+
+    assert worker_a.get("abc123", loader) == link
+    assert worker_a.get("abc123", loader) == link
+    assert worker_b.get("abc123", loader) == link
+    assert len(loads) == 1
+    assert worker_a.stats()["local_hits"] == 1
+    assert worker_b.stats()["redis_hits"] == 1
+
+    worker_a.invalidate("abc123")
+    worker_b.drop_local("abc123")
+    assert worker_b.get("abc123", loader) == link
+    assert len(loads) == 2
+
+
+def test_user_snapshot_is_cached_until_the_user_changes():
+    from app import auth_cache, models, security
+    from tests.conftest import TestingSessionLocal
+
+    db = TestingSessionLocal()
+    user = models.User(email="snapshot@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    snapshot = auth_cache.UserSnapshot(id=user.id, email=user.email)
+    claims = auth_cache.verify_token(security.create_access_token({"sub": snapshot.email, "uid": snapshot.id}))
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return snapshot
+
+    auth_cache.get_user(claims, loader)
+    auth_cache.get_user(claims, loader)
+    assert len(loads) == 1
+
+    # A rolled-back change keeps the snapshot, a committed one drops it.
+    user.hashed_password = "y"
+    db.flush()
+    db.rollback()
+    auth_cache.get_user(claims, loader)
+    assert len(loads) == 1
+
+    user.hashed_password = "y"
+    db.flush()
+    auth_cache.get_user(claims, loader)
+    assert len(loads) == 1
+    db.commit()
+    db.close()
+    auth_cache.get_user(claims, loader)
+    assert len(loads) == 2
+
+
+def test_link_filter_rejects_unknown_codes_without_loading():
+    from app.negative_cache import LinkFilter
+
+    link_filter = LinkFilter(1000, 0.001, load_codes=lambda: ["known1"], count_codes=lambda: 1)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return "row"
+
+    # Until the first build every lookup passes through.
+    assert link_filter.guard("nope00", loader) == "row"
+    link_filter.rebuild()
+    assert link_filter.guard("nope00", loader) is None
+    assert link_filter.guard("known1", loader) == "row"
+    assert len(loads) == 2
+
+    link_filter.add(["fresh1"])
+    assert link_filter.might_exist("fresh1")
+    # Codes added just before a rebuild survive it even if the table read missed them.
+    link_filter.rebuild()
+    assert link_filter.might_exist("fresh1")
+
+    stats = link_filter.stats()
+    assert stats["rejected"] == 1 and stats["ready"] and stats["memory_bytes"] > 0
+
+
+def test_link_filter_replays_codes_added_during_a_slow_rebuild(monkeypatch):
+    from app import negative_cache
+
+    clock = [1000.0]
+    monkeypatch.setattr(negative_cache.time, "monotonic", lambda: clock[0])
+
+    def slow_load():
+        # Codes created while the table is read, the first one long before the load ends.
+        link_filter.add(["during1"])
+        clock[0] += 5 * link_filter.RECENT_SECONDS
+        link_filter.add(["during2"])
+        yield "known1"
+
+    link_filter = negative_cache.LinkFilter(1000, 0.001, load_codes=slow_load, count_codes=lambda: 1)
+    link_filter.rebuild()
+    assert link_filter.might_exist("during1") and link_filter.might_exist("during2")
+
+    # Once no rebuild is running, old codes are pruned again.
+    clock[0] += 5 * link_filter.RECENT_SECONDS
+    link_filter.add(["after"])
+    assert [short_code for _, short_code in link_filter._recent] == ["after"]
+
+
+def test_redirect_consults_the_filter(client, monkeypatch):
+    from app import negative_cache
+
+    link_filter = negative_cache.link_filter
+    monkeypatch.setattr(link_filter, "enabled", True)
+    monkeypatch.setattr(link_filter, "_filter", None)
+    link_filter.rebuild()
+
+    rejected = link_filter.stats()["rejected"]
+    assert client.get("/zzzzzz", follow_redirects=False).status_code == 404
+    assert link_filter.stats()["rejected"] == rejected + 1
+
+    short_code = client.post("/api/shorten", json={"original_url": "https://filter.example.com"}).json()["short_code"]
+    assert client.get(f"/{short_code}", follow_redirects=False).status_code == 307
@@ -0,0 +1,60 @@
+# tests/test_hot_links.py
+
+import random
+from collections import Counter
+
+import pytest
+
+from app.cache import CachedLink, LinkCache, TTLCache
+from app.hot_links import HotLinks, SpaceSaving
+
+
+def test_space_saving_keeps_the_heavy_hitters_in_constant_memory():
+    rng = random.Random(7)
+    stream = [f"hot{i}" for i in range(5) for _ in range(500)] + [f"tail{rng.randrange(10000)}" for _ in range(5000)]
+    rng.shuffle(stream)
+    sketch = SpaceSaving(capacity=50)
+    for item in stream:
+        sketch.offer(item)
+
+    assert len(sketch) == 50
+    truth = Counter(stream)
+    top = sketch.top(5)
+    assert {item for item, _, _ in top} == {f"hot{i}" for i in range(5)}
+    for item, count, error in top:
+        assert count - error <= truth[item] <= count
+
+
+def test_workers_are_merged_through_redis_minute_buckets():
+    fakeredis = pytest.importorskip("fakeredis")
+    shared = fakeredis.FakeRedis(decode_responses=True)
+    now = [600.0]
+    workers = [HotLinks(100, 60, redis_factory=lambda: shared, clock=lambda: now[0]) for _ in range(2)]
+
+    for worker, codes in zip(workers, (["a"] * 3 + ["b"], ["b"] * 4 + ["c"])):
+        for code in codes:
+            worker.record(code)
+        worker.flush()
+    assert workers[0].trending(5, 2) == [("b", 5), ("a", 3)]
+
+    # Counts slide out of the window a minute at a time.
+    now[0] += 120
+    workers[1].record("c")
+    workers[1].flush()
+    assert workers[1].trending(1, 5) == [("c", 1)]
+
+
+def test_pinned_links_skip_eviction_until_invalidated():
+    link_cache = LinkCache(TTLCache(1, 60), redis_ttl=60, redis_factory=lambda: None)
+    link = CachedLink(original_url="https://pinned.example.com/", is_active=True)
+    link_cache.pin({"pin01": link}, loaded_at=0)
+
+    link_cache.get("other", lambda: CachedLink(original_url="https://other.example.com/", is_active=True))
+    assert link_cache.get("pin01", lambda: None) == link
+    assert link_cache.stats()["pinned_hits"] == 1
+
+    link_cache.drop_local("pin01")
+    assert link_cache.get("pin01", lambda: None) is None
+    # A refresh that read the link before the invalidation does not put it back.
+    link_cache.pin({"pin01": link}, loaded_at=0)
+    assert "pin01" not in link_cache.pinned
@@ -0,0 +1,321 @@
+# tests/test_ingest.py
+
+import threading
+
+import pytest
+
+from app import crud, ingest, models
+from tests.conftest import TestingSessionLocal
+
+
+def _create_link(short_code):
+    db = TestingSessionLocal()
+    db.add(models.URL(short_code=short_code, original_url="https://example.com/"))
+    db.commit()
+    db.close()
+
+
+def test_batcher_flushes_when_batch_is_full():
+    queue = ingest.MemoryClickQueue()
+    flushed = []
+    batcher = ingest.ClickBatcher(queue, flushed.append, max_batch_size=3, max_delay_ms=50)
+    for _ in range(5):
+        queue.push(ingest.make_click_event("abc", None, None, None))
+
+    assert batcher.run_once() == 3
+    assert batcher.run_once() == 2
+    assert [len(batch) for batch in flushed] == [3, 2]
+
+
+def test_failed_flush_is_retried_before_ack():
+    queue = ingest.MemoryClickQueue()
+    calls = []
+
+    def flaky_flush(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+
+    batcher = ingest.ClickBatcher(queue, flaky_flush, max_batch_size=10, max_delay_ms=0)
+    batcher.RETRY_BACKOFF_SECONDS = (0,)
+    queue.push(ingest.make_click_event("abc", None, None, None))
+
+    batcher.run_once(threading.Event())
+    assert calls == [1, 1]
+    assert batcher.stats == {"batches": 1, "events": 1, "flush_failures": 1, "dead_lettered": 0}
+
+
+def test_poison_events_are_dead_lettered():
+    queue = ingest.MemoryClickQueue()
+    stored = []
+
+    def flush(batch):
+        if any(event["short_code"] == "bad" for event in batch):
+            raise ValueError("cannot store this event")
+        stored.extend(batch)
+
+    batcher = ingest.ClickBatcher(queue, flush, max_batch_size=10, max_delay_ms=0, max_attempts=2)
+    batcher.RETRY_BACKOFF_SECONDS = (0,)
+    for code in ("ok1", "bad", "ok2", "ok3"):
+        queue.push(ingest.make_click_event(code, None, None, None))
+
+    batcher.run_once(threading.Event())
+    assert sorted(event["short_code"] for event in stored) == ["ok1", "ok2", "ok3"]
+    assert [event["short_code"] for event in queue.dead] == ["bad"]
+    assert batcher.stats["dead_lettered"] == 1
+    queue.recover()
+    assert len(queue) == 0
+
+
+def test_unacked_events_are_recovered():
+    queue = ingest.MemoryClickQueue()
+    queue.push({"n": 1})
+    queue.push({"n": 2})
+    assert queue.claim(1, 0) == [{"n": 1}]
+    queue.recover()
+    assert queue.claim(10, 0) == [{"n": 1}, {"n": 2}]
+
+
+def test_redis_consumers_recover_only_lapsed_processing_lists():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    live = ingest.RedisClickQueue(client, "host:1:a")
+    peer = ingest.RedisClickQueue(client, "host:2:b")
+    live.recover()
+    # An in-flight batch of the live consumer (claim() itself needs Lua, which fakeredis lacks).
+    client.rpush(live.processing_key, '{"n": 1}')
+    try:
+        peer.recover()
+        assert client.llen(ingest.RedisClickQueue.PENDING_KEY) == 0
+        peer.ack()
+        assert client.llen(live.processing_key) == 1
+
+        # The live consumer dies: once its lease lapses, the next recovery requeues its events once.
+        live._stop_heartbeat.set()
+        client.delete(live.lease_key)
+        peer.recover()
+        peer.recover()
+        assert client.lrange(ingest.RedisClickQueue.PENDING_KEY, 0, -1) == ['{"n": 1}']
+        assert client.smembers(ingest.RedisClickQueue.CONSUMERS_KEY) == {"host:2:b"}
+    finally:
+        live.close()
+        peer.close()
+    assert not client.exists(peer.lease_key)
+
+
+def test_bulk_insert_aggregates_counters():
+    _create_link("bulk01")
+    events = [ingest.make_click_event("bulk01", "1.2.3.4", "ua", None) for _ in range(3)]
+    events.append(ingest.make_click_event("gone00", "1.2.3.4", "ua", None))
+
+    db = TestingSessionLocal()
+    try:
+        assert crud.create_db_clicks_bulk(db, events) == 3
+        db_url = crud.get_db_url_stats(db, "bulk01")
+        assert db_url.total_clicks == 3
+        assert db_url.last_clicked_at is not None
+        assert db.query(models.Click).filter(models.Click.short_code == "bulk01").count() == 3
+    finally:
+        db.close()
+
+
+def test_folding_counters_keeps_totals_exact():
+    _create_link("fold01")
+    db = TestingSessionLocal()
+    try:
+        for _ in range(20):
+            crud.update_db_url_clicks(db, "fold01")
+        assert crud.get_db_url_by_short_code(db, "fold01").total_clicks == 0
+        assert crud.get_db_url_stats(db, "fold01").total_clicks == 20
+
+        crud.fold_click_counters(db)
+        db.expire_all()
+        assert crud.get_db_url_by_short_code(db, "fold01").total_clicks == 20
+        assert crud.get_db_url_stats(db, "fold01").total_clicks == 20
+        assert db.query(models.ClickCounterShard).count() == 0
+    finally:
+        db.close()
+
+
+def test_rollups_feed_the_timeseries(client):
+    short_code = client.post("/api/shorten", json={"original_url": "https://rollup.example.com"}).json()["short_code"]
+    events = [
+        ingest.make_click_event(short_code, None, None, "https://news.example.org/a"),
+        ingest.make_click_event(short_code, None, None, "https://news.example.org/b"),
+        ingest.make_click_event(short_code, None, None, None),
+    ]
+    db = TestingSessionLocal()
+    try:
+        crud.create_db_clicks_bulk(db, events)
+    finally:
+        db.close()
+
+    response = client.get(f"/api/stats/{short_code}/timeseries", params={"granularity": "hour"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["points"]) == 48
+    assert sum(point["clicks"] for point in data["points"]) == 3
+    assert data["top_referrers"][0] == {"referrer": "news.example.org", "clicks": 2}
+
+    daily = client.get(f"/api/stats/{short_code}/timeseries").json()
+    assert sum(point["clicks"] for point in daily["points"]) == 3
+
+    assert client.get("/api/stats/nope00/timeseries").status_code == 404
+
+    assert client.delete(f"/api/links/{short_code}").status_code == 204
+    db = TestingSessionLocal()
+    try:
+        for table in (models.ClickCounterShard, models.ClickRollup, models.ReferrerRollup):
+            assert db.query(table).filter(table.short_code == short_code).count() == 0
+    finally:
+        db.close()
+
+
+def test_clicks_are_partitioned_on_postgres_only():
+    from sqlalchemy.dialects import postgresql, sqlite
+    from sqlalchemy.schema import CreateTable
+
+    from app import partitions  # noqa: F401  (registers the DDL hook)
+
+    ddl = str(CreateTable(models.Click.__table__).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (clicked_at)" in ddl
+    assert "PRIMARY KEY (id, clicked_at)" in ddl
+    assert "PARTITION" not in str(CreateTable(models.Click.__table__).compile(dialect=sqlite.dialect()))
+
+
+def test_retention_archives_old_months(tmp_path):
+    import csv
+    import gzip
+    from datetime import datetime, timezone
+
+    from app import partitions
+    from tests.conftest import engine
+
+    _create_link("old001")
+    db = TestingSessionLocal()
+    try:
+        db.add_all(
+            models.Click(short_code="old001", clicked_at=datetime(2020, month, 15, tzinfo=timezone.utc))
+            for month in (1, 1, 3)
+        )
+        db.add(models.Click(short_code="old001"))
+        db.commit()
+    finally:
+        db.close()
+
+    archived = partitions.apply_retention(engine, 90, str(tmp_path))
+    by_month = {entry["month"]: entry for entry in archived}
+    assert by_month["2020-01"]["clicks"] == 2
+    assert by_month["2020-03"]["clicks"] == 1
+    assert by_month["2020-02"]["path"] is None
+
+    with gzip.open(by_month["2020-01"]["path"], "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["short_code"] for row in rows] == ["old001", "old001"]
+
+    db = TestingSessionLocal()
+    try:
+        remaining = db.query(models.Click).filter(models.Click.short_code == "old001").all()
+        assert len(remaining) == 1
+    finally:
+        db.close()
+
+
+def test_publisher_batches_and_requeues_failed_batches():
+    published, failures = [], [1]
+
+    def publish(batch):
+        if failures:
+            failures.pop()
+            raise ConnectionError("redis unavailable")
+        published.append(batch)
+
+    publisher = ingest.ClickPublisher(publish, max_size=10, batch_size=4, interval_ms=10)
+    publisher.RETRY_BACKOFF_SECONDS = 0.01
+    for code in "abcdef":
+        assert publisher.offer(ingest.make_click_event(code, None, None, None))
+    publisher.start()
+    publisher.stop()
+
+    assert [[event["short_code"] for event in batch] for batch in published] == [list("abcd"), list("ef")]
+    assert publisher.stats["published"] == 6 and publisher.stats["publish_failures"] == 1
+
+
+def test_publisher_overflow_policies(tmp_path):
+    dropping = ingest.ClickPublisher(lambda batch: None, max_size=2, batch_size=10, interval_ms=10)
+    results = [dropping.offer(ingest.make_click_event("abc", None, None, None)) for _ in range(3)]
+    assert results == [True, True, False] and dropping.stats["dropped"] == 1
+
+    sampling = ingest.ClickPublisher(lambda batch: None, max_size=4, batch_size=10, interval_ms=10, overflow="sample", sample_rate=0)
+    results = [sampling.offer(ingest.make_click_event("abc", None, None, None)) for _ in range(3)]
+    assert results == [True, True, False] and sampling.stats["sampled_out"] == 1
+
+    published = []
+    spill_path = tmp_path / "spill.ndjson"
+    spilling = ingest.ClickPublisher(
+        published.extend, max_size=1, batch_size=10, interval_ms=10, overflow="spill", spill_path=str(spill_path)
+    )
+    for code in ("first", "second", "third"):
+        assert spilling.offer(ingest.make_click_event(code, None, None, None))
+    assert spilling.stats["spilled"] == 2 and len(spill_path.read_text().splitlines()) == 2
+
+    spilling.start()
+    for _ in range(100):
+        if spilling.stats["replayed"] == 2:
+            break
+        threading.Event().wait(0.01)
+    spilling.stop()
+    assert [event["short_code"] for event in published] == ["first", "second", "third"]
+    assert not spill_path.exists()
+
+
+CHROME_ANDROID = "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36"
+SAFARI_MAC = "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15"
+EDGE_WINDOWS = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36 Edg/126.0"
+
+
+def test_user_agents_are_parsed_into_browser_os_and_device():
+    from app.enrichment import UserAgent, parse_user_agent
+
+    assert parse_user_agent(CHROME_ANDROID) == UserAgent("Chrome", "Android", "mobile")
+    assert parse_user_agent(SAFARI_MAC) == UserAgent("Safari", "macOS", "desktop")
+    assert parse_user_agent(EDGE_WINDOWS) == UserAgent("Edge", "Windows", "desktop")
+    assert parse_user_agent("Googlebot/2.1 (+http://www.google.com/bot.html)").device == "bot"
+
+
+def test_geoip_database_is_searched_in_place(tmp_path):
+    from app.enrichment import GeoIPDatabase, build_geoip_database
+
+    path = str(tmp_path / "geoip.bin")
+    ranges = [("2001:db8::", "2001:db8::ffff", "fr"), ("1.0.0.0", "1.0.0.255", "AU"), ("8.8.8.0", "8.8.8.255", "US")]
+    assert build_geoip_database(ranges, path) == 3
+
+    geoip = GeoIPDatabase(path)
+    try:
+        assert geoip.country("8.8.8.8") == "US"
+        assert geoip.country("1.0.0.0") == "AU"
+        assert geoip.country("2001:db8::1") == "FR"
+        assert geoip.country("8.8.9.1") is None
+        assert geoip.country("0.0.0.1") is None
+        assert geoip.country("not-an-ip") is None
+    finally:
+        geoip.close()
+
+
+def test_enriched_clicks_are_stored(tmp_path):
+    from app.enrichment import ClickEnricher, GeoIPDatabase, build_geoip_database
+
+    path = str(tmp_path / "geoip.bin")
+    build_geoip_database([("8.8.8.0", "8.8.8.255", "US")], path)
+    enricher = ClickEnricher(GeoIPDatabase(path), ua_cache_size=16)
+    _create_link("enrich1")
+    events = enricher.enrich([ingest.make_click_event("enrich1", "8.8.8.8", CHROME_ANDROID, None) for _ in range(3)])
+    assert enricher.stats()["user_agent_cache_hits"] == 2
+
+    db = TestingSessionLocal()
+    try:
+        crud.create_db_clicks_bulk(db, events)
+        click = db.query(models.Click).filter(models.Click.short_code == "enrich1").first()
+        assert (click.browser, click.os, click.device, click.country) == ("Chrome", "Android", "mobile", "US")
+    finally:
+        db.close()